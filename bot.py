@@ -1,49 +1,114 @@
+import time
+# Process start mark for the cold start measurement
+STARTED_AT = time.perf_counter()
+
 import asyncio
 import logging
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
 from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.filters.command import Command
+from aiogram.types import TelegramObject
+
+# Environment variables must be loaded before the core modules read their settings
+load_dotenv()
 
+from core.model.models import init_db
 from core.utils.commands import set_commands # Import to create menu button
 # Import handlers for start, help and weather commands, for dispatcher processing
-from core.handlers.basic import cmd_start, cmd_help, cmd_weather, cmd_login, cmd_signup
+from core.handlers.basic import cmd_start, cmd_help, cmd_weather, cmd_login, cmd_signup, cb_recent_city, cache_snapshot, forget_cities
+from core.keyboards.inline_keyboards import CityCallback
+from core.handlers.charts import cmd_chart
+from core.handlers.inline import inline_city_search, build_city_index
+from core.handlers.subscriptions import cmd_subscribe, cmd_unsubscribe
+from core.middlewares.throttling import create_throttling_middleware
+from core.middlewares.profiling import ProfilingMiddleware
+from core.middlewares.concurrency import create_concurrency_governor
+from core.handlers.admin import cmd_profile, cmd_stats
+from core.filters.admin import IsAdmin
+from core.utils.scheduler import forecast_scheduler
+from core.utils.alerts import alert_dispatcher
+from core.utils.chart import shutdown_executor
+from core.utils.maintenance import maintenance_job
+from core.utils.fsm_storage import create_fsm_storage
+from core.repository import Repository, SQLAlchemyRepository, create_repository
 
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+IMPORTS_DONE_AT = time.perf_counter()
+_first_update_logged = False
+
+async def init_database(repo: Repository):
+    """Create the database engine, registered first on dp.startup, a repository without a database needs none."""
+    if not isinstance(repo, SQLAlchemyRepository):
+        logger.info(f'No database is used by the {type(repo).__name__} backend')
+        return
+    started = time.perf_counter()
+    init_db()
+    logger.info(f'Database is initialized in {(time.perf_counter() - started) * 1000:.1f} ms')
 
-async def start_bot(bot: Bot):
-    """Notify admin that the bot is running."""
-    bot_info = await bot.me()
+async def log_first_update(
+    handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+    event: TelegramObject,
+    data: Dict[str, Any],
+) -> Any:
+    """Log the time from the process start to the first received update."""
+    global _first_update_logged
+    if not _first_update_logged:
+        _first_update_logged = True
+        logger.info(
+            f'First update received {(time.perf_counter() - STARTED_AT) * 1000:.1f} ms after start '
+            f'(imports took {(IMPORTS_DONE_AT - STARTED_AT) * 1000:.1f} ms)'
+        )
+    return await handler(event, data)
+
+async def start_bot(bots: List[Bot]):
+    """Notify admin that the bots are running and set the command menu of every bot."""
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     admin_id = os.getenv('ADMIN_ID')
-    message_text = (
-        f'Bot {bot_info.first_name} is running!\n'
-        f'Admin ID: {admin_id}\n'
-        f'Current Time: {current_time}\n'
-        f'Bot ID: {bot_info.id}\n'
-        f'Bot Username: @{bot_info.username}'
-    )
-    logger.info(f'{message_text}')
-    #await bot.send_message(settings.bots.admin_id, text='Bot is running!')
+    for bot in bots:
+        bot_info = await bot.me()
+        await set_commands(bot)
+        message_text = (
+            f'Bot {bot_info.first_name} is running!\n'
+            f'Admin ID: {admin_id}\n'
+            f'Current Time: {current_time}\n'
+            f'Bot ID: {bot_info.id}\n'
+            f'Bot Username: @{bot_info.username}'
+        )
+        logger.info(f'{message_text}')
+        #await bot.send_message(settings.bots.admin_id, text='Bot is running!')
 
-async def stop_bot(bot: Bot):
-    """Notify admin that the bot is running."""
-    bot_info = await bot.me()
+async def stop_bot(bots: List[Bot]):
+    """Notify admin that the bots are stopping."""
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     admin_id = os.getenv('ADMIN_ID')
-    message_text = (
-        f'Bot {bot_info.first_name} is stopping!\n'
-        f'Admin ID: {admin_id}\n'
-        f'Current Time: {current_time}\n'
-        f'Bot ID: {bot_info.id}\n'
-        f'Bot Username: @{bot_info.username}\n'
-        "#####################################"
-    )
-    logger.info(f'{message_text}')
-    #await bot.send_message(settings.bots.admin_id, text='Bot is stopping!')
+    for bot in bots:
+        bot_info = await bot.me()
+        message_text = (
+            f'Bot {bot_info.first_name} is stopping!\n'
+            f'Admin ID: {admin_id}\n'
+            f'Current Time: {current_time}\n'
+            f'Bot ID: {bot_info.id}\n'
+            f'Bot Username: @{bot_info.username}\n'
+            "#####################################"
+        )
+        logger.info(f'{message_text}')
+        #await bot.send_message(settings.bots.admin_id, text='Bot is stopping!')
+
+async def assign_default_bot(bots: List[Bot], repo: Repository):
+    """Users registered before the multi-bot mode belong to the first bot (the former TOKEN)."""
+    count = repo.assign_default_bot(bots[0].id)
+    if count:
+        logger.info(f'{count} users are assigned to bot {bots[0].id}')
+
+def get_tokens() -> List[str]:
+    """Bot tokens from TOKENS (comma separated), or the single TOKEN."""
+    tokens = os.getenv('TOKENS') or os.getenv('TOKEN') or ''
+    return [token.strip() for token in tokens.split(',') if token.strip()]
 
 def configure_logging():
     """Configure logging settings."""
@@ -59,33 +124,70 @@ def register_handlers(dp: Dispatcher):
     Let's register a handler, the event we register for is message.
     Let's call the registry method, which will launch the process_start_command function.
     """
+    governor = create_concurrency_governor()
+    # The database must be ready before the other startup hooks use it
+    dp.startup.register(init_database)
+    # Updates in flight finish before the other shutdown hooks release what they use
+    dp.shutdown.register(governor.drain)
+    dp.startup.register(assign_default_bot)
     dp.startup.register(start_bot)
     dp.shutdown.register(stop_bot)
+    # Warm the caches from the last snapshot before the first update is handled
+    dp.startup.register(cache_snapshot.start)
+    dp.shutdown.register(cache_snapshot.stop)
+    dp.startup.register(build_city_index)
+    dp.startup.register(forecast_scheduler.start)
+    dp.shutdown.register(forecast_scheduler.stop)
+    dp.startup.register(alert_dispatcher.start)
+    dp.shutdown.register(alert_dispatcher.stop)
+    dp.shutdown.register(shutdown_executor)
+    # Cities merged or deleted by the maintenance are dropped from the handler caches
+    maintenance_job.add_listener(forget_cities)
+    dp.startup.register(maintenance_job.start)
+    dp.shutdown.register(maintenance_job.stop)
+    # Per-user and per-chat flood control, runs only for messages that matched a handler
+    dp.message.middleware(create_throttling_middleware())
+    dp.update.outer_middleware(log_first_update)
+    # Slow-update log and the /profile sampling cover the whole dispatch path
+    dp.update.outer_middleware(ProfilingMiddleware())
+    # Bounded concurrency with load shedding, after profiling so waiting time is measured
+    dp.update.outer_middleware(governor)
     dp.message.register(cmd_start, Command('start'))
     dp.message.register(cmd_help, Command('help'))
     dp.message.register(cmd_weather, Command('weather'))
     dp.message.register(cmd_login, Command('login'))
     dp.message.register(cmd_signup, Command('signup'))
+    dp.message.register(cmd_chart, Command('chart'))
+    dp.message.register(cmd_subscribe, Command('subscribe'))
+    dp.message.register(cmd_unsubscribe, Command('unsubscribe'))
+    dp.message.register(cmd_profile, Command('profile'), IsAdmin())
+    dp.message.register(cmd_stats, Command('stats'), IsAdmin())
+    dp.inline_query.register(inline_city_search)
+    dp.callback_query.register(cb_recent_city, CityCallback.filter())
 
 async def main() -> None:
     """Main function to start the bot."""
     configure_logging()
-    bot_token = os.getenv('TOKEN')
-    # Create an object of the bot class
-    bot = Bot(token=bot_token)
-    # Create an object of the dispatcher class it is receiving updates
-    dp = Dispatcher()
+    # One bot per token, all of them share the HTTP connection pool, the database and the caches
+    session = AiohttpSession()
+    bots = [Bot(token=token, session=session) for token in get_tokens()]
+    # Create an object of the dispatcher class it is receiving updates,
+    # dialog state lives in Redis when the bot runs as several replicas
+    dp = Dispatcher(storage=create_fsm_storage())
+    # Handlers and startup hooks get the storage as the `repo` argument
+    dp['repo'] = create_repository()
 
     register_handlers(dp)
 
     try:
         # 
-        await dp.start_polling(bot)
+        await dp.start_polling(*bots, close_bot_session=False)
     except Exception as e:
         logging.error(f"An error occurred while polling: {e}")
     finally:
         # 
-        await bot.session.close()
+        await dp.storage.close()
+        await session.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
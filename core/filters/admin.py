@@ -0,0 +1,29 @@
+from os import getenv
+from typing import FrozenSet, Union
+
+from aiogram.filters import Filter
+from aiogram.types import Message, CallbackQuery
+
+
+def admin_ids() -> FrozenSet[int]:
+    '''
+    Telegram IDs from ADMIN_ID, several IDs are separated by commas.
+    '''
+    return frozenset(int(value) for value in getenv('ADMIN_ID', '').split(',') if value.strip())
+
+
+class IsAdmin(Filter):
+    '''
+    A filter that passes only messages and callback queries from the admins (ADMIN_ID).
+    '''
+    def __init__(self) -> None:
+        self.admins = admin_ids()
+
+    async def __call__(self, message: Union[Message, CallbackQuery]) -> bool:
+        return message.from_user is not None and message.from_user.id in self.admins
+
+
+'''
+    # Admin-only command
+    dp.message.register(cmd_profile, Command('profile'), IsAdmin())
+'''
@@ -1,7 +1,82 @@
-from typing import Union, List
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple, Union
 from aiogram.filters import Filter
 from aiogram.types import Message, CallbackQuery
 
+
+class AhoCorasick:
+    '''
+    An Aho-Corasick automaton that tells whether a text contains any of the keywords.
+
+    The automaton is built once, a search is a single pass over the text
+    whose cost does not depend on the number of keywords.
+    '''
+    def __init__(self, keywords: List[str]):
+        # State 0 is the root, every state has its transitions, failure link and a match flag
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.match: List[bool] = [False]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_links()
+
+    def _add(self, keyword: str) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.match.append(False)
+            state = next_state
+        self.match[state] = True
+
+    def _build_links(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                link = self.fail[state]
+                while link and char not in self.goto[link]:
+                    link = self.fail[link]
+                target = self.goto[link].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.match[next_state] = self.match[next_state] or self.match[self.fail[next_state]]
+
+    def search(self, text: str) -> bool:
+        '''
+        Return True if the text contains any of the keywords.
+        '''
+        goto, fail, match = self.goto, self.fail, self.match
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if match[state]:
+                return True
+        return False
+
+
+@lru_cache(maxsize=256)
+def compile_matcher(words: Tuple[str, ...], ignore_case: bool, partial_match: bool) -> Callable[[str], bool]:
+    '''
+    Build a matching function for the words, shared by all filters with the same configuration.
+
+    Exact mode looks the text up in a precomputed set, partial mode runs an Aho-Corasick automaton.
+    '''
+    keywords = [word.casefold() if ignore_case else word for word in words]
+    if partial_match:
+        if '' in keywords:
+            # An empty word is contained in any text
+            return lambda text: True
+        return AhoCorasick(keywords).search
+    return frozenset(keywords).__contains__
+
 class ContainsWord(Filter):
     '''
     A filter to check if a message or callback query contains specific word(s).
@@ -23,6 +98,7 @@ class ContainsWord(Filter):
         self.words = [words] if isinstance(words, str) else words
         self.ignore_case = ignore_case
         self.partial_match = partial_match
+        self._matcher = compile_matcher(tuple(self.words), ignore_case, partial_match)
 
     async def __call__(self, message: Union[Message, CallbackQuery]) -> bool:
         '''
@@ -40,17 +116,9 @@ class ContainsWord(Filter):
                 return False
 
             if self.ignore_case:
-                text = text.lower()
-
-            for word in self.words:
-                word_to_check = word.lower() if self.ignore_case else word
-                if self.partial_match:
-                    if word_to_check in text:
-                        return True
-                else:
-                    if text == word_to_check:
-                        return True
-            return False
+                text = text.casefold()
+
+            return self._matcher(text)
         except AttributeError:
             return False
         
@@ -0,0 +1,47 @@
+'''
+Admin-only handlers, registered with the IsAdmin filter
+'''
+import logging
+
+from aiogram.types import Message
+from aiogram.filters import CommandObject
+
+from core.utils.profiling import MAX_REPORT_LENGTH, profiler
+from core.utils.stats import bot_stats
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILED_UPDATES = 1000
+
+
+async def cmd_profile(message: Message, command: CommandObject) -> None:
+    """
+    Handler for the /profile command.
+
+    /profile N [EVERY] profiles N of the next updates, one in EVERY, and sends the top entries
+    when they are handled. /profile stop sends the report of the updates profiled so far.
+    """
+    args = (command.args or '').split()
+    if args and args[0] == 'stop':
+        report = profiler.disarm()
+        await message.answer(report[:MAX_REPORT_LENGTH] if report else 'The profiler is not running.')
+        return
+
+    try:
+        updates = int(args[0]) if args else 10
+        every = int(args[1]) if len(args) > 1 else 1
+    except ValueError:
+        await message.answer('Error, usage: /profile N [EVERY] or /profile stop.')
+        return
+    if not 0 < updates <= MAX_PROFILED_UPDATES or every < 1:
+        await message.answer(f'Error, N must be between 1 and {MAX_PROFILED_UPDATES}.')
+        return
+
+    profiler.arm(updates, every, message.chat.id)
+    logger.info(f'Admin {message.from_user.id} started profiling {updates} updates, one in {every}.')
+    await message.answer(f'Profiling {updates} of the next updates, one in {every}. The report will be sent here.')
+
+
+async def cmd_stats(message: Message) -> None:
+    """Handler for the /stats command, the figures come from in-memory counters only."""
+    await message.answer(bot_stats.report()[:MAX_REPORT_LENGTH])
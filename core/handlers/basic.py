@@ -5,209 +5,93 @@ import os
 import logging
 import secrets
 
-from dotenv import load_dotenv
-
-from datetime import datetime
-
 from aiogram import Bot
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.filters import CommandObject
-from typing import Optional, Dict, Any
+from aiogram.fsm.context import FSMContext
+from typing import Optional, Dict, Any, List, Tuple, Union
 
-from sqlalchemy.orm import Session
-from core.model.models import SessionLocal, User, City, Forecast
+from core.repository import Repository
 
 from core.utils.geocode import Geocode
-from core.utils.weather import WeatherForecast, DayWeather
-from core.utils.util import extract_lat_lon, generate_token_hash, is_forecast_old
+from core.utils.quota import QuotaGovernor, QuotaExceeded
+from core.utils.weather import WeatherForecast, DayWeather, render_forecast_lines, render_aggregate_lines, aggregate_days
+from core.utils.locales import resolve_locale
+from core.utils.util import generate_token_hash, is_forecast_old, forecast_ttl, parse_forecast_options
+from core.utils.cache import TTLCache
+from core.utils.snapshot import CacheSnapshot
+from core.utils.profiling import stage, timed_stage
+from core.utils.stats import bot_stats
+from core.utils.alerts import alert_dispatcher
+from core.utils.prefix_index import PrefixIndex
+from core.keyboards.inline_keyboards import CityCallback, RecentCities
+from core.utils.states import AuthStates
 
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+# The geocode.maps.co free tier allows about 1 request per second
+geocode_governor = QuotaGovernor(
+    name='geocode.maps.co',
+    rate=float(os.getenv('GEOCODE_RATE', '1')),
+    burst=int(os.getenv('GEOCODE_BURST', '1')),
+    daily_limit=int(os.getenv('GEOCODE_DAILY_LIMIT', '5000')),
+    max_queue=int(os.getenv('GEOCODE_QUEUE_SIZE', '100')),
+    max_wait=float(os.getenv('GEOCODE_MAX_WAIT', '10')),
+)
 
-# Временное хранилище для токенов
-tokens = {}
+# Fresh forecasts by city ID: {'city_id', 'name', 'lat', 'lon', 'timestamp', 'forecast_data'}
+forecast_cache = TTLCache(maxsize=int(os.getenv('FORECAST_CACHE_SIZE', '1000')))
 
-def get_db():
-    '''
-    Dependency to get the database session
-    '''
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Rendered forecast lines by (city ID, forecast timestamp, locale)
+rendered_forecasts = TTLCache(maxsize=int(os.getenv('FORECAST_CACHE_SIZE', '1000')) * 2)
 
-### CRUD functions for User
-def create_user(db: Session, user_id: int, token: str):
-    '''
-    Add user to database
-    '''
-    db_user = User(user_id=user_id, token=token)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+# Most recently requested cities of every (bot ID, Telegram ID) with their cached keyboards
+recent_cities = RecentCities()
 
-def get_user(db: Session, user_id: int):
-    '''
-    Get user from database
-    '''
-    return db.query(User).filter(User.user_id == user_id).first()
+# Known city names for autocomplete, the value is (city_id, lat, lon)
+city_index = PrefixIndex()
 
-def update_user(db: Session, user_id: int, token: str, is_active=None):
-    '''
-    Update user token in database
-    '''
-    db_user = db.query(User).filter(User.user_id == user_id).first()
-    if db_user:
-        if token is not None:
-            db_user.token = token
-        if is_active is not None:
-            db_user.is_active = is_active
-        db.commit()
-        db.refresh(db_user)
-    return db_user
-
-def delete_user(db: Session, user_id: int):
-    '''
-    Delete user from database
-    '''
-    db_user = db.query(User).filter(User.user_id == user_id).first()
-    if db_user:
-        db.delete(db_user)
-        db.commit()
-    return db_user
-### CRUD functions for User
-
-### CRUD functions for City
-def create_city(db: Session, user_id: int, name: str, latitude: float, longitude: float):
-    '''
-    Add city to database
-    '''
-    db_city = City(user_id=user_id, name=name, latitude=latitude, longitude=longitude)
-    db.add(db_city)
-    db.commit()
-    db.refresh(db_city)
-    return db_city
+# Geocoded locations by normalized address: {'address', 'lat', 'lon', 'city_id', 'name'}
+geocode_cache = TTLCache(maxsize=int(os.getenv('GEOCODE_CACHE_SIZE', '5000')), ttl=float(os.getenv('GEOCODE_CACHE_TTL', '86400')))
 
-def get_city_coordinates(db: Session, name: str):
-    '''
-    Get city coordinates from the database.
+# "<bot ID>:<Telegram ID>" of authorized users, only positive answers are cached
+auth_cache = TTLCache(maxsize=int(os.getenv('AUTH_CACHE_SIZE', '10000')), ttl=float(os.getenv('AUTH_CACHE_TTL', '600')))
 
-    Args:
-        db (Session): Database session.
-        name (str): Name of the city.
+# The hot caches survive restarts through snapshots under files/
+cache_snapshot = CacheSnapshot({'forecast': forecast_cache, 'geocode': geocode_cache, 'auth': auth_cache})
 
-    Returns:
-        Optional[Dict[str, float]]: A dictionary containing the city's name, latitude, and longitude.
-            Returns None if the city is not found or an error occurs.
-    '''
-    if not name:
-        logger.error("City name is empty")
-        return None
-    
-    try:
-        db_city = db.query(City).filter(City.name == name).first()
-        if db_city:
-            return {
-                "name": db_city.name,
-                'latitude': db_city.latitude,
-                'longitude': db_city.longitude
-            }
-        else:
-            logger.error(f"City {name} not found in the database")
-            return None
-    except Exception as e:
-        logger.error(f'Error getting city coordinates: {e}')
-        return None
+bot_stats.track_cache('forecast', forecast_cache)
+bot_stats.track_cache('rendered', rendered_forecasts)
+bot_stats.track_cache('geocode', geocode_cache)
+bot_stats.track_cache('auth', auth_cache)
 
-def get_city_id_by_name(db: Session, city_name: str) -> Optional[int]:
-    ''' Get city by name from the database.'''
-    try:
-        db_city = db.query(City).filter(City.name == city_name).first()
-        return db_city.id
-    except Exception as e:
-        logger.error(f"Error querying city ID by name: {e}")
-        return None
-
-# Maybe unused
-def get_city_name(db: Session, latitude: float, longitude: float):
+def load_city_index(repo: Repository) -> int:
     '''
-    Get city name from the database based on latitude and longitude.
-
-    Args:
-        db (Session): Database session.
-        latitude (float): Latitude of the city.
-        longitude (float): Longitude of the city.
-
-    Returns:
-        Optional[str]: Name of the city if found, otherwise None.
+    Fill the autocomplete index with all cities from the repository.
     '''
-    try:
-        # Validate input parameters
-        if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
-            logger.error("Invalid latitude or longitude values.")
-            return None
-        
-        # Query the database for the city name
-        db_city = db.query(City).filter(
-            City.latitude == latitude,
-            City.longitude == longitude
-        ).first()
-        
-        if db_city:
-            logger.info(f'City found: {db_city.name}')
-            return db_city.name
-        else:
-            logger.warning(f'No city found at latitude {latitude} and longitude {longitude}.')
-            return None
-    except Exception as e:
-        logger.error(f'Error querying city by coordinates: {e}')
-        return None
-### CRUD functions for City
+    city_index.update((city.name, (city.id, city.latitude, city.longitude)) for city in repo.list_cities())
+    return len(city_index)
 
-### CRUD functions for Forecast
-def get_weather_forecast_by_city_id(db: Session, city_id: int) -> Optional[Forecast]:
-    '''
-    Get weather forecast by city ID from the database.
+def forget_cities(removed: Dict[int, Optional[int]]) -> None:
     '''
-    try:
-        db_forecast = db.query(Forecast).filter(Forecast.city_id == city_id).first()
-        return db_forecast
-    except Exception as e:
-        logger.error(f"Error querying weather forecast by city ID: {e}")
-        return None
+    Drop or remap city IDs removed by the database maintenance, registered as its listener.
 
-def create_or_update_weather_forecast(db: Session, city_id: int, forecast_data: dict) -> Optional[Forecast]:
+    Merged cities are replaced with the city they were merged into, deleted ones (None) are dropped,
+    so no handler asks for the forecast of a city that no longer exists.
     '''
-    Create or update a weather forecast entry in the database.
-
-    :param db: SQLAlchemy database session
-    :param city_id: ID of the city for which the forecast is being created
-    :param forecast_data: Dictionary containing weather forecast data
-    :return: Created Forecast object
-    '''
-    try:
-        forecast = get_weather_forecast_by_city_id(db, city_id)
-        if forecast:
-            forecast.forecast_data = forecast_data
-            forecast.timestamp = datetime.now()
-        else:
-            forecast = Forecast(city_id=city_id, forecast_data=forecast_data)
-            # Add the new instance to the database
-            db.add(forecast)
-        # Commit the session to save the new forecast to the database
-        db.commit()
-        # Refresh the instance to get any new data from the database
-        db.refresh(forecast)
-        return forecast
-    except Exception as e:
-        logger.error(f"Error creating or updating weather forecast: {e}")
-        db.rollback()
-        return None
-### CRUD functions for Forecast
-
+    for city_id in removed:
+        forecast_cache.pop(city_id)
+    geocode_cache.remove_if(lambda key, location: location.get('city_id') in removed)
+    recent_cities.remap(removed)
+
+    def remap(value: Tuple[int, float, float]) -> Optional[Tuple[int, float, float]]:
+        if value[0] not in removed:
+            return value
+        return None if removed[value[0]] is None else (removed[value[0]],) + tuple(value[1:])
+    city_index.remap(remap)
+    logger.info(f'{len(removed)} removed cities are dropped from the caches')
+
+@timed_stage('upstream')
 async def fetch_weather_from_api(lat: float, lon: float) -> Optional[dict]:
     '''
     Fetch weather data from the OpenWeatherMap API.
@@ -221,25 +105,39 @@ async def fetch_weather_from_api(lat: float, lon: float) -> Optional[dict]:
         logger.error(f"Error fetching weather data from API: {e}")
         return None
 
-async def check_authorization(message: Message):
+async def _reply(event: Union[Message, CallbackQuery], text: str) -> None:
+    """Reply to a message, or show a notification for a callback query."""
+    if isinstance(event, CallbackQuery):
+        await event.answer(text, show_alert=True)
+    else:
+        await event.reply(text)
+
+def is_authorized(repo: Repository, user_id: int, bot_id: int) -> bool:
+    """Check if the user is registered with the bot, only positive answers are cached."""
+    key = f'{bot_id}:{user_id}'
+    if key in auth_cache:
+        return True
+    if not repo.get_user(user_id, bot_id):
+        return False
+    auth_cache.set(key, True)
+    return True
+
+@timed_stage('auth')
+async def check_authorization(message: Union[Message, CallbackQuery], repo: Repository):
     user_id = message.from_user.id
-    db: Session = next(get_db())
     try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            await message.reply("Sorry you dont have access to this bot.")
+        if not is_authorized(repo, user_id, message.bot.id):
+            await _reply(message, "Sorry you dont have access to this bot.")
             return False
         return True
     except Exception as e:
-        await message.reply("Sorry, an internal authorization error occurred.")
+        await _reply(message, "Sorry, an internal authorization error occurred.")
         logger.error(f'Exception with autorization : {e}')
-    finally:
-        db.close()
 
-async def cmd_start(message: Message, bot: Bot):
+async def cmd_start(message: Message, bot: Bot, repo: Repository):
     """Handler for the /start command."""
 
-    if not await check_authorization(message):
+    if not await check_authorization(message, repo):
         return
 
     welcome_message = f"""
@@ -256,10 +154,10 @@ async def cmd_start(message: Message, bot: Bot):
     await bot.send_message(message.from_user.id, welcome_message)
     logger.info(f'User {message.from_user.first_name} with ID {message.from_user.id} started the bot.')
 
-async def cmd_help(message: Message):
+async def cmd_help(message: Message, repo: Repository):
     """Handler for the /help command."""
 
-    if not await check_authorization(message):
+    if not await check_authorization(message, repo):
         return
 
     help_text: str = """
@@ -279,128 +177,231 @@ async def cmd_help(message: Message):
         
     /weather - Get the weather forecast for a specific location.\n
     Usage: Type /weather followed by the city name. For example, /weather Moscow.\n
+    Add "week" for daily minimum, maximum and precipitation over the week, e.g. /weather Moscow week,
+    or the hours to show, e.g. /weather Moscow 6,12,18.\n
     Note: Make sure to provide the city name correctly for accurate results.
+
+    /chart - Get a chart of temperature and precipitation for a specific location.\n
+    Usage: Type /chart followed by the city name. For example, /chart Moscow.
+
+    /subscribe - Get a daily weather forecast at a local time.\n
+    Usage: Type /subscribe followed by the city name and the time. For example, /subscribe Moscow 07:30.
+
+    /unsubscribe - Stop daily weather forecasts.\n
+    Usage: Type /unsubscribe followed by the city name, or just /unsubscribe to stop all of them.
         
     If you have any questions or need further assistance, feel free to ask!
     """
     await message.reply(help_text)
     logger.info(f'User {message.from_user.first_name} with ID {message.from_user.id} requested help.')
 
-async def get_geocode_location(message: Message, address: str) -> Optional[Dict[str, Any]]:
-    """Helper method to get geocode location."""
+@timed_stage('geocode')
+async def get_geocode_location(message: Message, address: str, repo: Repository) -> Optional[Dict[str, Any]]:
+    """
+    Helper method to get geocode location.
+
+    The location carries the ID and the stored name of the city, so spellings that share
+    a cache entry (e.g. "Moscow" and "moscow ") are served by the same city.
+    """
+    key = address.strip().casefold()
+    location = geocode_cache.get(key)
+    # Entries restored from snapshots of older versions have no city ID
+    if location is not None and 'city_id' in location:
+        return location
+
     gtoken = os.getenv('GEOCODE_TOKEN')
-    db: Session = next(get_db())
     logger.info("Query of location coordinates from DB")
-    data = get_city_coordinates(db, address)
-
-    if data:
-        lat, lon = extract_lat_lon(data)
-        if lat is not None and lon is not None:
-            logger.info(f'Geocode location from file for {address} is {lat}, {lon}.')
-            return {'address': address, 'lat': lat, 'lon': lon}
+    city = repo.get_city_by_name(address)
+    if city is not None:
+        logger.info(f'Geocode location from DB for {address} is {city.latitude}, {city.longitude}.')
+        location = {'address': address, 'lat': city.latitude, 'lon': city.longitude, 'city_id': city.id, 'name': city.name}
+        geocode_cache.set(key, location)
+        return location
 
     logger.info("Query of location coordinates from API")
     geocode_location = Geocode(url='https://geocode.maps.co', code_search=True, api_key=gtoken)
-    location = geocode_location.quest(address)
+    try:
+        # Identical lookups waiting in the queue share one upstream call
+        location = await geocode_governor.submit(key, lambda: geocode_location.quest(address))
+    except QuotaExceeded as e:
+        logger.warning(f'Geocode request for {address} was not sent: {e}')
+        return None
     logger.info(f'Geocode location from API request - {location}')
 
     if location is not None:
-        user_id = message.from_user.id
-        create_city(db, user_id, address, location['lat'], location['lon'])
-        print("location is exist")
+        city = repo.create_city(message.from_user.id, address, location['lat'], location['lon'], message.bot.id)
+        city_index.add(city.name, (city.id, city.latitude, city.longitude))
+        location = dict(location, city_id=city.id, name=city.name)
+        geocode_cache.set(key, location)
         return location
     return None
 
-async def get_weather_forecast(name: str, lat: float, lon: float) -> Optional[list[DayWeather]]:
-    """Helper method to get weather forecast."""
-    db: Session = next(get_db())
-    try:
-        logger.info("Query of forecast from DB")
-        
-        # Get the city ID from the database using the city name
-        city_id = get_city_id_by_name(db, name)
-        if city_id is None:
-            # Fix it later: get city id from geocode
-            logger.info(f"City {name} not found in the database.")
+async def get_forecast_entry(repo: Repository, city_id: int, name: str, lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """
+    Helper method to get the forecast of a known city: from the cache, the DB or the API.
+
+    Returns the cache entry {'city_id', 'name', 'lat', 'lon', 'timestamp', 'forecast_data'}.
+    """
+    bot_stats.record_city(name)
+    cached = forecast_cache.get(city_id)
+    if cached is not None:
+        logger.info(f"Weather forecast for city {name} found in the cache.")
+        return cached
+
+    logger.info("Query of forecast from DB")
+    # Query the weather forecast for the city using the city ID
+    with stage('db'):
+        forecast = repo.get_forecast(city_id)
+
+    # If the forecast is not found or older than 12 hours, fetch it from the API
+    if forecast is None or is_forecast_old(forecast.timestamp):
+        logger.info(f"Weather forecast for city {name} not found in the database. Fetching from API...")
+        # Get the weather forecast from the API
+        weather_data = await fetch_weather_from_api(lat=lat, lon=lon)
+        if weather_data is None:
+            logger.info("Failed to fetch weather forecast from API.")
             return None
     
-        # Query the weather forecast for the city using the city ID
-        forecast = get_weather_forecast_by_city_id(db, city_id)
-
-        # If the forecast is not found or older than 12 hours, fetch it from the API
-        if forecast is None or is_forecast_old(forecast.timestamp):
-            logger.info(f"Weather forecast for city {name} not found in the database. Fetching from API...")
-            # Get the weather forecast from the API
-            weather_data = await fetch_weather_from_api(lat=lat, lon=lon)
-            if weather_data is None:
-                logger.info("Failed to fetch weather forecast from API.")
-                return None
-        
-            # Create a new forecast entry in the database
-            forecast = create_or_update_weather_forecast(db, city_id, weather_data)
-            if forecast is None:
-                return None
-    
-        # Assuming forecast.forecast_data is a dictionary that can be converted to DayWeather objects
-        weather_forecast = WeatherForecast(lon, lat).create_forecast(forecast.forecast_data)
-        return weather_forecast
-    
-    finally:
-        db.close()
+        previous = forecast
+        # Create a new forecast entry in the database
+        with stage('db'):
+            forecast = repo.upsert_forecast(city_id, weather_data)
+        if forecast is None:
+            return None
+        if previous is not None:
+            with stage('alerts'):
+                alert_dispatcher.submit(city_id, name, previous.forecast_data, weather_data)
+
+    entry = {
+        'city_id': city_id,
+        'name': name,
+        'lat': lat,
+        'lon': lon,
+        'timestamp': forecast.timestamp,
+        'forecast_data': forecast.forecast_data,
+    }
+    forecast_cache.set(city_id, entry, ttl=forecast_ttl(forecast.timestamp))
+    return entry
+
+async def get_location_forecast_entry(repo: Repository, location: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Helper method to get the forecast cache entry of a location returned by get_geocode_location."""
+    return await get_forecast_entry(repo, location['city_id'], location['name'], location['lat'], location['lon'])
+
+async def get_forecast_entry_by_name(repo: Repository, name: str, lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """Helper method to get the forecast cache entry of a city by its name."""
+    # Get the city ID from the database using the city name
+    city = repo.get_city_by_name(name)
+    if city is None:
+        # Fix it later: get city id from geocode
+        logger.info(f"City {name} not found in the database.")
+        return None
+    return await get_forecast_entry(repo, city.id, name, lat, lon)
 
-async def send_weather_message(message: Message, weather_forecast: list[DayWeather]) -> None:
-    """Helper method to send weather messages."""
-    for day in weather_forecast:
-        for i, time in enumerate(day.time):
-            await message.answer(f'Time: {time}, Temperature: {day.temperature_2m[i]}, Forecast: {day.weather_code[i]}')
+async def get_weather_forecast(repo: Repository, name: str, lat: float, lon: float) -> Optional[list[DayWeather]]:
+    """Helper method to get weather forecast."""
+    entry = await get_forecast_entry_by_name(repo, name, lat, lon)
+    if entry is None:
+        return None
+    # Assuming forecast_data is a dictionary that can be converted to DayWeather objects
+    return WeatherForecast(lon, lat).create_forecast(entry['forecast_data'])
+
+def get_rendered_lines(entry: Dict[str, Any], locale: str, week: bool = False,
+                       hours: Optional[Tuple[int, ...]] = None) -> List[str]:
+    """
+    Helper method to render a cached forecast, the text is cached per (forecast version, locale, view).
 
-async def cmd_weather(message: Message, command: CommandObject) -> None:
+    The weekly view renders the daily aggregates of the whole horizon, otherwise
+    the given (or default) hours of the first days are sampled.
+    """
+    key = (entry['city_id'], entry['timestamp'].isoformat(), locale, week, hours)
+    lines = rendered_forecasts.get(key)
+    if lines is None:
+        if week:
+            lines = render_aggregate_lines(aggregate_days(entry['forecast_data']), locale)
+        else:
+            weather_forecast = WeatherForecast(entry['lon'], entry['lat']).create_forecast(entry['forecast_data'], hours)
+            lines = render_forecast_lines(weather_forecast, locale)
+        rendered_forecasts.set(key, lines, ttl=forecast_ttl(entry['timestamp']))
+    return lines
+
+@timed_stage('send')
+async def send_weather_message(message: Message, lines: List[str],
+                               reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+    """Helper method to send weather messages, the keyboard is attached to the last one."""
+    for n, line in enumerate(lines, start=1):
+        await message.answer(line, reply_markup=reply_markup if n == len(lines) else None)
+
+async def cmd_weather(message: Message, command: CommandObject, repo: Repository) -> None:
     """Handler for the /weather command."""
 
-    if not await check_authorization(message):
+    if not await check_authorization(message, repo):
         return
 
     if command.args is None:
         await message.answer("Error, no arguments passed. Pass the city name.")
         return
     
-    name = command.args
-    location = await get_geocode_location(message, name)
+    name, week, hours = parse_forecast_options(command.args)
+    location = await get_geocode_location(message, name, repo)
     if location is None:
         await message.answer("Error, unknown location arguments passed.")
         return
     
     lat, lon = location["lat"], location["lon"]
     
-    weather_forecast = await get_weather_forecast(name, lat, lon)
-    if weather_forecast is None:
+    entry = await get_location_forecast_entry(repo, location)
+    if entry is None:
         await message.answer("Error, don't get data of weather forecast.")
         return
-    
-    await send_weather_message(message, weather_forecast)
 
-async def cmd_login(message: Message) -> None:
+    lines = get_rendered_lines(entry, resolve_locale(message.from_user.language_code), week, hours)
+    # Users are separate per bot, so are their recent cities
+    user_key = (message.bot.id, message.from_user.id)
+    recent_cities.touch(user_key, entry['city_id'], entry['name'], lat, lon)
+    await send_weather_message(message, lines, recent_cities.keyboard(user_key))
+
+async def cb_recent_city(callback: CallbackQuery, callback_data: CityCallback, repo: Repository) -> None:
+    """Handler for a tap on the recent cities keyboard, the forecast is served by city ID."""
+
+    if not await check_authorization(callback, repo):
+        return
+
+    user_key = (callback.bot.id, callback.from_user.id)
+    city = recent_cities.get(user_key, callback_data.city_id)
+    if city is None:
+        await callback.answer("This city is no longer in your recent list, use /weather.")
+        return
+
+    entry = await get_forecast_entry(repo, city.city_id, city.name, city.lat, city.lon)
+    if entry is None:
+        await callback.answer("Error, don't get data of weather forecast.")
+        return
+
+    await callback.answer()
+    recent_cities.touch(user_key, city.city_id, city.name, city.lat, city.lon)
+    lines = get_rendered_lines(entry, resolve_locale(callback.from_user.language_code))
+    await send_weather_message(callback.message, lines, recent_cities.keyboard(user_key))
+
+async def cmd_login(message: Message, state: FSMContext, repo: Repository) -> None:
     """Handler for the /login command."""
     user_id = message.from_user.id
-    db: Session = next(get_db())
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        user = repo.get_user(user_id, message.bot.id)
         if user:
             await message.answer("You are already logged in.")
             return
         
-        # A hash of the token is generated and stored in the temporary `tokens` storage.
+        # A hash of the token is generated and kept in the FSM storage until /signup.
         token = secrets.token_urlsafe(32)
         token_hash = generate_token_hash(token)
-        tokens[user_id] = token_hash
+        await state.set_state(AuthStates.waiting_signup)
+        await state.set_data({'token_hash': token_hash})
         await message.reply(f'Your temporary token:\n {token}\n Use command /signup <token> to login.')
     except Exception as e:
         await message.reply(f'An error occurred: {e}')
         logger.info(f'An error occurred: {e}')
-    finally:
-        db.close()
 
-async def cmd_signup(message: Message, command: CommandObject) -> None:
+async def cmd_signup(message: Message, command: CommandObject, state: FSMContext, repo: Repository) -> None:
     """Handler for the /signup command."""
     user_id = message.from_user.id
     token = command.args
@@ -412,21 +413,19 @@ async def cmd_signup(message: Message, command: CommandObject) -> None:
     If the hashes match, the user is authorized.
     '''
     token_hash = generate_token_hash(token)
-    if tokens.get(user_id) != token_hash:
+    data = await state.get_data()
+    if data.get('token_hash') != token_hash:
         await message.reply("Error, invalid token.")
         return
+    await state.clear()
 
-    db: Session = next(get_db())
     try:
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = repo.get_user(user_id, message.bot.id)
         if not user:
-            user = User(user_id=user_id, token=token_hash)
-            db.add(user)
-            db.commit()
+            repo.create_user(user_id, token_hash, message.bot.id)
+            auth_cache.set(f'{message.bot.id}:{user_id}', True)
             await message.reply('You have successfully logged in.')
         else:
             await message.reply('You are already logged in.')
     except Exception as e:
-        await message.reply(f'An error occurred: {e}')
-    finally:
-        db.close()
\ No newline at end of file
+        await message.reply(f'An error occurred: {e}')
\ No newline at end of file
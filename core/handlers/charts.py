@@ -0,0 +1,75 @@
+'''
+Handler for forecast charts
+'''
+import logging
+
+from aiogram.types import Message, BufferedInputFile
+from aiogram.filters import CommandObject
+
+from core.handlers.basic import check_authorization, get_geocode_location, get_location_forecast_entry
+from core.repository import Repository
+from core.utils.cache import TTLCache
+from core.utils.stats import bot_stats
+from core.utils.chart import render_forecast_chart
+from core.utils.weather import FORECAST_DAYS, WeatherForecast
+
+logger = logging.getLogger(__name__)
+
+# Rendered PNG images by (city ID, forecast version)
+chart_images = TTLCache(maxsize=128, ttl=12 * 3600)
+# Telegram file IDs of uploaded charts by (bot ID, city ID, forecast version), file IDs are valid only for one bot
+chart_file_ids = TTLCache(maxsize=4096, ttl=12 * 3600)
+
+bot_stats.track_cache('chart', chart_images)
+bot_stats.track_cache('chart file ID', chart_file_ids)
+
+
+async def cmd_chart(message: Message, command: CommandObject, repo: Repository) -> None:
+    """Handler for the /chart command."""
+
+    if not await check_authorization(message, repo):
+        return
+
+    if command.args is None:
+        await message.answer("Error, no arguments passed. Pass the city name.")
+        return
+
+    name = command.args
+    location = await get_geocode_location(message, name, repo)
+    if location is None:
+        await message.answer("Error, unknown location arguments passed.")
+        return
+
+    lat, lon = location["lat"], location["lon"]
+    entry = await get_location_forecast_entry(repo, location)
+    if entry is None:
+        await message.answer("Error, don't get data of weather forecast.")
+        return
+
+    # The image is shared by all spellings of the city, so is its title
+    city_id, name = entry['city_id'], entry['name']
+    # The forecast timestamp changes on every refresh, so it identifies the chart
+    key = (city_id, entry['timestamp'].isoformat())
+
+    file_key = (message.bot.id,) + key
+    file_id = chart_file_ids.get(file_key)
+    if file_id is not None:
+        logger.info(f'Chart for {name} is sent by file ID')
+        await message.answer_photo(file_id)
+        return
+
+    image = chart_images.get(key)
+    if image is None:
+        try:
+            # Every hour of the horizon, the hourly precipitation is the total of the hour
+            weather_forecast = WeatherForecast(lon, lat).create_forecast(entry['forecast_data'], range(24), FORECAST_DAYS)
+            image = await render_forecast_chart(name, weather_forecast)
+        except Exception as e:
+            logger.error(f'Error rendering chart for {name}: {e}')
+            await message.answer("Error, the chart is not rendered.")
+            return
+        chart_images.set(key, image)
+
+    sent = await message.answer_photo(BufferedInputFile(image, filename=f'{city_id}.png'))
+    if sent.photo:
+        chart_file_ids.set(file_key, sent.photo[-1].file_id)
@@ -0,0 +1,111 @@
+'''
+Inline mode handlers: city autocomplete with forecast cards
+'''
+import os
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent
+
+from core.handlers.basic import load_city_index, city_index, forecast_cache, is_authorized
+from core.repository import Repository
+from core.utils.cache import TTLCache
+from core.utils.stats import bot_stats
+from core.utils.locales import resolve_locale, describe
+from core.utils.weather import WeatherForecast, format_forecast
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the next keystroke before a query is answered
+INLINE_DEBOUNCE = float(os.getenv('INLINE_DEBOUNCE', '0.3'))
+# Seconds Telegram and the bot keep an inline answer
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '60'))
+INLINE_RESULTS_LIMIT = 10
+
+# (normalized query, locale) -> inline results
+inline_answers = TTLCache(maxsize=2048, ttl=INLINE_CACHE_TIME)
+bot_stats.track_cache('inline', inline_answers)
+
+# The latest pending query task of every (bot ID, Telegram ID)
+_pending_queries: Dict[Tuple[int, int], asyncio.Task] = {}
+
+
+async def build_city_index(repo: Repository) -> None:
+    '''
+    Load the city names for autocomplete, registered on dp.startup.
+    '''
+    try:
+        count = load_city_index(repo)
+        logger.info(f'City index is loaded with {count} names')
+    except Exception as e:
+        logger.error(f'Error loading the city index: {e}')
+
+
+def build_results(query: str, locale: str = 'en') -> List[InlineQueryResultArticle]:
+    '''
+    Build forecast cards for the cities whose name starts with the query.
+
+    Only in-process data is used: a city with a cached forecast gets the forecast as its card,
+    any other city (or a cached forecast without a full day) gets a card that sends the /weather command for it.
+    '''
+    results = []
+    for name, (city_id, lat, lon) in city_index.search(query, INLINE_RESULTS_LIMIT):
+        cached = forecast_cache.get(city_id)
+        days = WeatherForecast(lon, lat).create_forecast(cached['forecast_data']) if cached is not None else []
+        if days and days[0].temperature_2m:
+            first = days[0]
+            description = f'{first.temperature_2m[0]}, {describe(first.weather_code[0], locale)}'
+            text = format_forecast(name, days, locale)
+        else:
+            description = 'Tap to request the forecast'
+            text = f'/weather {name}'
+        results.append(InlineQueryResultArticle(
+            id=str(city_id),
+            title=name,
+            description=description,
+            input_message_content=InputTextMessageContent(message_text=text),
+        ))
+    return results
+
+
+async def _answer(inline_query: InlineQuery, repo: Repository) -> None:
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    # The city index and the cached forecasts are only for registered users, as every command
+    if not is_authorized(repo, inline_query.from_user.id, inline_query.bot.id):
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=True,
+                                  button=InlineQueryResultsButton(text='Log in with /login to search cities', start_parameter='login'))
+        return
+    query = inline_query.query.strip().casefold()
+    locale = resolve_locale(inline_query.from_user.language_code)
+    results = inline_answers.get((query, locale))
+    if results is None:
+        results = build_results(query, locale)
+        inline_answers.set((query, locale), results)
+    # The answer depends on the user's language, so Telegram must not share it between users;
+    # the in-process cache still shares it between users with the same language
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
+
+
+async def inline_city_search(inline_query: InlineQuery, repo: Repository) -> None:
+    """Handler for inline queries, only the latest query of a user is answered."""
+    user_id = inline_query.from_user.id
+    # A user typing to two bots has a pending query with each of them
+    key = (inline_query.bot.id, user_id)
+    previous = _pending_queries.get(key)
+    if previous is not None and not previous.done():
+        previous.cancel()
+
+    task = asyncio.create_task(_answer(inline_query, repo))
+    _pending_queries[key] = task
+    try:
+        await task
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        logger.debug(f'Inline query of user {user_id} is superseded by a newer one')
+    except Exception as e:
+        logger.error(f'Error answering inline query: {e}')
+    finally:
+        if _pending_queries.get(key) is task:
+            del _pending_queries[key]
@@ -0,0 +1,84 @@
+'''
+Handlers for scheduled forecast subscriptions
+'''
+import re
+import logging
+from datetime import datetime, timezone
+
+from aiogram.types import Message
+from aiogram.filters import CommandObject
+
+from core.handlers.basic import check_authorization, get_geocode_location, get_location_forecast_entry
+from core.repository import Repository
+from core.utils.scheduler import CATCH_UP_MINUTES, to_delivery_minute
+from core.utils.util import is_delivery_due
+from core.utils.locales import resolve_locale
+
+logger = logging.getLogger(__name__)
+
+TIME_PATTERN = re.compile(r'^(?:[01]?\d|2[0-3]):[0-5]\d$')
+
+def create_or_update_subscription(repo: Repository, user_id: int, chat_id: int, city_id: int,
+                                  latitude: float, longitude: float,
+                                  delivery_time: str, utc_offset: int, language: str = 'en', bot_id: int = 0) -> bool:
+    '''
+    Create a subscription or change the delivery time of an existing one.
+
+    A subscription whose delivery time has just passed is not caught up, it is first delivered tomorrow.
+    '''
+    now = datetime.now(timezone.utc)
+    delivery_minute = to_delivery_minute(delivery_time, utc_offset)
+    last_sent_at = now if is_delivery_due(delivery_minute, now.hour * 60 + now.minute, CATCH_UP_MINUTES) else None
+    return repo.save_subscription(user_id, chat_id, city_id, latitude, longitude,
+                                  delivery_time, utc_offset, delivery_minute, last_sent_at, language, bot_id)
+
+async def cmd_subscribe(message: Message, command: CommandObject, repo: Repository) -> None:
+    """Handler for the /subscribe command."""
+
+    if not await check_authorization(message, repo):
+        return
+
+    parts = (command.args or '').rsplit(maxsplit=1)
+    if len(parts) != 2 or not TIME_PATTERN.match(parts[1]):
+        await message.answer("Error, pass the city name and the local delivery time. For example, /subscribe Moscow 07:30.")
+        return
+    name, delivery_time = parts[0], parts[1].zfill(5)
+
+    location = await get_geocode_location(message, name, repo)
+    if location is None:
+        await message.answer("Error, unknown location arguments passed.")
+        return
+    lat, lon = location["lat"], location["lon"]
+
+    # The forecast carries the time zone offset of the location
+    entry = await get_location_forecast_entry(repo, location)
+    if entry is None:
+        await message.answer("Error, don't get data of weather forecast.")
+        return
+    utc_offset = int(entry['forecast_data'].get('utc_offset_seconds', 0))
+
+    saved = create_or_update_subscription(
+        repo, message.from_user.id, message.chat.id, entry['city_id'], lat, lon, delivery_time, utc_offset,
+        resolve_locale(message.from_user.language_code), message.bot.id
+    )
+    if not saved:
+        await message.answer("Error, the subscription is not saved.")
+        return
+    await message.answer(f'You will get the forecast for {name} every day at {delivery_time}.')
+    logger.info(f'User {message.from_user.id} subscribed to {name} at {delivery_time}.')
+
+async def cmd_unsubscribe(message: Message, command: CommandObject, repo: Repository) -> None:
+    """Handler for the /unsubscribe command."""
+
+    if not await check_authorization(message, repo):
+        return
+
+    city_id = None
+    if command.args:
+        city = repo.get_city_by_name(command.args)
+        if city is None:
+            await message.answer("Error, unknown location arguments passed.")
+            return
+        city_id = city.id
+    count = repo.delete_subscriptions(message.from_user.id, city_id, message.bot.id)
+    await message.answer(f'Subscriptions removed: {count}.')
@@ -1,71 +1,141 @@
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from collections import OrderedDict
+from typing import Dict, Hashable, List, NamedTuple, Optional
+
+from aiogram.types import InlineKeyboardMarkup
 from aiogram.filters.callback_data import CallbackData
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+
+class CityCallback(CallbackData, prefix="city"):
+    """
+    Callback data for city selection, carries the location ID (cities.id).
+    """
+    city_id: int
+
 
-# Define callback data for city selection
-city_callback = CallbackData("city", "city_id")
+class RecentCity(NamedTuple):
+    city_id: int
+    name: str
+    lat: float
+    lon: float
 
-def get_cities_keyboard(cities: list) -> InlineKeyboardMarkup:
+
+def get_cities_keyboard(cities: List[RecentCity]) -> InlineKeyboardMarkup:
     """
     Creates and returns an inline keyboard markup for city selection.
 
     Args:
-        cities (list): List of city names.
+        cities (List[RecentCity]): List of cities.
 
     Returns:
-        InlineKeyboardMarkup: An inline keyboard markup with city options.
+        InlineKeyboardMarkup: An inline keyboard markup with city options, one city per row.
     """
-    keyboard = InlineKeyboardMarkup()
-    for city_id, city_name in enumerate(cities, start=1):
-        keyboard.add(InlineKeyboardButton(
-            text=city_name,
-            callback_data=city_callback.new(city_id=city_id)
-        ))
-    return keyboard
+    builder = InlineKeyboardBuilder()
+    for city in cities:
+        builder.button(text=city.name, callback_data=CityCallback(city_id=city.city_id))
+    builder.adjust(1)
+    return builder.as_markup()
 
 
-'''
-    Example usage:
-    
-    bot = Bot(token=API_TOKEN)
-    dp = Dispatcher(bot)
-    # Sample weather data
-    weather_data = {
-        1: {"city": "New York", "temperature": 70, "condition": "Sunny"},
-        2: {"city": "London", "temperature": 60, "condition": "Cloudy"},
-        3: {"city": "Tokyo", "temperature": 75, "condition": "Rainy"},
-    }
-
-    # List of cities
-    cities = ["New York", "London", "Tokyo"]
-
-    # Handler for the /start command
-    @dp.message(commands=['start'])
-    async def send_welcome(message: types.Message):
+class RecentCities:
     """
-    Sends a welcome message and presents the city selection keyboard.
+    Most recently used cities of every user with a cached keyboard.
 
-    Args:
-        message (types.Message): The message object.
-    """
-        keyboard = get_cities_keyboard(cities)
-        await message.reply("Welcome to the Weather Bot! Please select a city:", reply_markup=keyboard)
+    A user is any hashable key, the bot uses (bot ID, Telegram ID) since users are separate per bot.
 
-    # Handler for city selection callbacks
-    @dp.callback_query(city_callback.filter())
-    async def handle_city_selection(call: types.CallbackQuery, callback_data: dict):
-    """
-    Handles the user's city selection from the inline keyboard.
+    Both the number of users and the number of cities per user are bounded,
+    the least recently active users are evicted first. The keyboard markup of a user
+    is rebuilt only when the user's list changes.
 
-    Args:
-        call (types.CallbackQuery): The callback query object.
-        callback_data (dict): The callback data.
+    Attributes:
+        max_users (int): Maximum number of users kept.
+        max_cities (int): Maximum number of cities per user.
     """
-        city_id = int(callback_data["city_id"])
-        city_weather = weather_data[city_id]
-
-        await bot.answer_callback_query(call.id)
-        await bot.send_message(
-            call.from_user.id,
-            f"Weather in {city_weather['city']}: {city_weather['temperature']}°F, {city_weather['condition']}"
-        )
-'''
\ No newline at end of file
+
+    def __init__(self, max_users: int = 10000, max_cities: int = 5) -> None:
+        self.max_users = max_users
+        self.max_cities = max_cities
+        self._cities: OrderedDict[Hashable, List[RecentCity]] = OrderedDict()
+        self._markups: Dict[Hashable, InlineKeyboardMarkup] = {}
+
+    def touch(self, user_id: Hashable, city_id: int, name: str, lat: float, lon: float) -> bool:
+        """
+        Move the city to the front of the user's list.
+
+        Returns:
+            bool: True if the list has changed.
+        """
+        cities = self._cities.get(user_id)
+        if cities is None:
+            cities = []
+            self._cities[user_id] = cities
+            while len(self._cities) > self.max_users:
+                evicted, _ = self._cities.popitem(last=False)
+                self._markups.pop(evicted, None)
+        else:
+            self._cities.move_to_end(user_id)
+
+        if cities and cities[0].city_id == city_id:
+            return False
+        cities[:] = [city for city in cities if city.city_id != city_id]
+        cities.insert(0, RecentCity(city_id, name, lat, lon))
+        del cities[self.max_cities:]
+        self._markups.pop(user_id, None)
+        return True
+
+    def get(self, user_id: Hashable, city_id: int) -> Optional[RecentCity]:
+        """
+        Return the city from the user's list.
+        """
+        for city in self._cities.get(user_id, ()):
+            if city.city_id == city_id:
+                return city
+        return None
+
+    def remap(self, city_ids: Dict[int, Optional[int]]) -> None:
+        """
+        Replace removed cities in every list with the city they were merged into, or drop them (None).
+        """
+        for user_id, cities in self._cities.items():
+            if not any(city.city_id in city_ids for city in cities):
+                continue
+            remapped: List[RecentCity] = []
+            for city in cities:
+                city_id = city_ids.get(city.city_id, city.city_id)
+                if city_id is not None and all(other.city_id != city_id for other in remapped):
+                    remapped.append(city._replace(city_id=city_id))
+            cities[:] = remapped
+            self._markups.pop(user_id, None)
+
+    def keyboard(self, user_id: Hashable) -> Optional[InlineKeyboardMarkup]:
+        """
+        Return the cached keyboard of the user's recent cities, or None if the list is empty.
+        """
+        markup = self._markups.get(user_id)
+        if markup is None:
+            cities = self._cities.get(user_id)
+            if not cities:
+                return None
+            markup = get_cities_keyboard(cities)
+            self._markups[user_id] = markup
+        return markup
+
+
+'''
+    Example usage:
+
+    recent_cities = RecentCities()
+
+    # Handler for the /weather command remembers the city and attaches the keyboard
+    @dp.message(Command('weather'))
+    async def send_weather(message: types.Message):
+        recent_cities.touch(message.from_user.id, city_id, name, lat, lon)
+        await message.answer(text, reply_markup=recent_cities.keyboard(message.from_user.id))
+
+    # Handler for city selection callbacks
+    @dp.callback_query(CityCallback.filter())
+    async def handle_city_selection(call: types.CallbackQuery, callback_data: CityCallback):
+        city = recent_cities.get(call.from_user.id, callback_data.city_id)
+        await call.answer()
+        await call.message.answer(f"Weather in {city.name}: ...")
+'''
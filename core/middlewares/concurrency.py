@@ -0,0 +1,162 @@
+'''
+Concurrency governor: bounded update handling with load shedding and a graceful drain
+'''
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Number of updates of one command handled at the same time, they hold DB sessions and upstream calls
+COMMAND_CONCURRENCY: Dict[str, int] = {
+    'weather': 20,
+    'chart': 4,
+    'subscribe': 10,
+}
+BUSY_TEXT = 'The bot is busy right now, please try again in a minute.'
+
+
+def command_name(update: Update) -> Optional[str]:
+    '''
+    Name of the command of a message update, e.g. "weather" for "/weather@my_bot Moscow".
+    '''
+    message = update.message
+    if message is None or not message.text or not message.text.startswith('/'):
+        return None
+    return message.text.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+
+
+class ConcurrencyGovernor(BaseMiddleware):
+    '''
+    Limit the number of updates handled at the same time.
+
+    An update first takes a slot of its command (if the command has a limit) and then a global slot.
+    At most `max_pending` updates wait for slots, each for at most `max_wait` seconds, further
+    updates are shed with a short "busy" reply. Registered as an outer update middleware.
+
+    Attributes:
+        max_pending (int): Maximum number of updates waiting for a slot.
+        max_wait (float): Seconds an update waits for a slot before it is shed.
+        in_flight (int): Number of updates being handled.
+        pending (int): Number of updates waiting for a slot.
+        shed (int): Number of updates rejected so far.
+    '''
+
+    def __init__(self, limit: int = 100, command_limits: Optional[Dict[str, int]] = None,
+                 max_pending: int = 500, max_wait: float = 10.0) -> None:
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self._global = asyncio.Semaphore(limit)
+        limits = COMMAND_CONCURRENCY if command_limits is None else command_limits
+        self._commands = {name: asyncio.Semaphore(value) for name, value in limits.items()}
+        self.in_flight = 0
+        self.pending = 0
+        self.shed = 0
+        self._draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def _update_idle(self) -> None:
+        if self.in_flight == 0 and self.pending == 0:
+            self._idle.set()
+        else:
+            self._idle.clear()
+
+    async def _acquire(self, semaphores: List[asyncio.Semaphore]) -> bool:
+        '''
+        Take all slots within max_wait, on failure the taken slots are released.
+        '''
+        deadline = time.monotonic() + self.max_wait
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+                acquired.append(semaphore)
+            return True
+        except asyncio.TimeoutError:
+            for semaphore in acquired:
+                semaphore.release()
+            return False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        if self._draining:
+            return await self._reject(event)
+
+        command = self._commands.get(command_name(event))
+        semaphores = [command, self._global] if command is not None else [self._global]
+        if not any(semaphore.locked() for semaphore in semaphores):
+            # Free slots are taken without suspending, so nothing can take them in between
+            for semaphore in semaphores:
+                await semaphore.acquire()
+        else:
+            if self.pending >= self.max_pending:
+                return await self._reject(event)
+            self.pending += 1
+            self._idle.clear()
+            try:
+                acquired = await self._acquire(semaphores)
+            finally:
+                self.pending -= 1
+                self._update_idle()
+            if not acquired or self._draining:
+                if acquired:
+                    for semaphore in semaphores:
+                        semaphore.release()
+                return await self._reject(event)
+
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            for semaphore in semaphores:
+                semaphore.release()
+            self.in_flight -= 1
+            self._update_idle()
+
+    async def _reject(self, update: Update) -> None:
+        self.shed += 1
+        logger.info(f'Update {update.update_id} is shed: {self.in_flight} in flight, {self.pending} pending')
+        try:
+            if update.message is not None:
+                await update.message.answer(BUSY_TEXT)
+            elif update.callback_query is not None:
+                await update.callback_query.answer(BUSY_TEXT)
+        except Exception as e:
+            logger.error(f'Error replying to a shed update: {e}')
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        '''
+        Stop accepting updates and wait for the updates in flight, registered first on dp.shutdown.
+        '''
+        timeout = float(os.getenv('CONCURRENCY_DRAIN_TIMEOUT', '30')) if timeout is None else timeout
+        self._draining = True
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            logger.info(f'Updates are drained in {(time.perf_counter() - started) * 1000:.1f} ms')
+        except asyncio.TimeoutError:
+            logger.warning(f'{self.in_flight} updates are still in flight after the {timeout} s drain deadline')
+
+
+def create_concurrency_governor() -> ConcurrencyGovernor:
+    '''
+    Create the governor configured by CONCURRENCY_LIMIT, CONCURRENCY_MAX_PENDING and CONCURRENCY_MAX_WAIT.
+    '''
+    return ConcurrencyGovernor(
+        limit=int(os.getenv('CONCURRENCY_LIMIT', '100')),
+        max_pending=int(os.getenv('CONCURRENCY_MAX_PENDING', '500')),
+        max_wait=float(os.getenv('CONCURRENCY_MAX_WAIT', '10')),
+    )
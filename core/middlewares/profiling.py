@@ -0,0 +1,78 @@
+'''
+Profiling middleware: slow-update log with per-stage timings and on-demand cProfile sampling
+'''
+import os
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from aiogram.types.update import UpdateTypeLookupError
+
+from core.utils.profiling import MAX_REPORT_LENGTH, start_timings, format_timings, profiler
+from core.utils.stats import bot_stats
+
+logger = logging.getLogger(__name__)
+
+SLOW_UPDATE_MS = float(os.getenv('SLOW_UPDATE_MS', '1000'))
+
+
+def describe_update(update: Update) -> str:
+    '''
+    Short description of an update for the log, e.g. "message /weather" or "callback_query".
+    '''
+    try:
+        description = update.event_type
+    except UpdateTypeLookupError:
+        return 'unknown'
+    if update.message is not None and update.message.text and update.message.text.startswith('/'):
+        description += ' ' + update.message.text.split(maxsplit=1)[0]
+    return description
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    '''
+    Measure every update, log the stage timings of the slow ones and feed the armed profiler.
+
+    Registered as an outer update middleware, so the whole dispatch path is measured.
+
+    Attributes:
+        threshold (float): Updates taking longer than this (in seconds) are logged.
+    '''
+
+    def __init__(self, threshold_ms: float = SLOW_UPDATE_MS) -> None:
+        self.threshold = threshold_ms / 1000
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        timings = start_timings()
+        profile = profiler.sample()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            total = time.perf_counter() - started
+            user = data.get('event_from_user')
+            bot_stats.record_update(user.id if user else None, describe_update(event), total)
+            if profile is not None:
+                chat_id = profiler.chat_id
+                report = profiler.finish(profile)
+                if report is not None:
+                    await self._send_report(data, chat_id, report)
+            if total >= self.threshold and isinstance(event, Update):
+                logger.warning(
+                    f'Slow update {event.update_id} ({describe_update(event)}) took {total * 1000:.1f} ms: '
+                    f'{format_timings(timings, total)}'
+                )
+
+    @staticmethod
+    async def _send_report(data: Dict[str, Any], chat_id: int, report: str) -> None:
+        try:
+            await data['bot'].send_message(chat_id, report[:MAX_REPORT_LENGTH])
+        except Exception as e:
+            logger.error(f'Error sending the profile report: {e}')
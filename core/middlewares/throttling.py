@@ -0,0 +1,181 @@
+'''
+Flood control middleware: per-user and per-chat sliding window limits for each command
+'''
+import os
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.filters import CommandObject
+from aiogram.types import Message, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# (number of messages, window in seconds) allowed for one user per command
+COMMAND_LIMITS: Dict[str, Tuple[int, float]] = {
+    'weather': (5, 60.0),
+    'chart': (3, 60.0),
+    'login': (3, 60.0),
+    'signup': (3, 60.0),
+}
+DEFAULT_LIMIT: Tuple[int, float] = (20, 60.0)
+# A chat is shared by many users, so it gets a proportionally larger budget
+CHAT_LIMIT_FACTOR = 5
+
+# Trim, count and add in one atomic call, so concurrent replicas can not all pass the check.
+# Returns 1 for an allowed hit, 2 for the first rejected hit in the window and 0 otherwise
+SLIDING_WINDOW_SCRIPT = '''
+local now, window, limit, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ttl)
+    return 1
+end
+if redis.call('SET', KEYS[2], 1, 'NX', 'EX', ttl) then return 2 end
+return 0
+'''
+
+
+class MemorySlidingWindow:
+    '''
+    In-memory sliding window counters with a bounded number of tracked keys.
+
+    Every key keeps at most `limit` timestamps, and the least recently used keys are evicted
+    once `max_keys` is reached or their window has passed, so memory does not grow with the
+    number of users seen.
+
+    Attributes:
+        max_keys (int): Maximum number of tracked keys.
+    '''
+
+    def __init__(self, max_keys: int = 10000) -> None:
+        self.max_keys = max_keys
+        # key -> [timestamps, window, warned until]
+        self._entries: OrderedDict[str, list] = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, (hits, window, warned_until) = next(iter(self._entries.items()))
+            idle = not hits or now - hits[-1] > window
+            if len(self._entries) >= self.max_keys or (idle and now > warned_until):
+                self._entries.popitem(last=False)
+            else:
+                break
+
+    async def hit(self, key: str, limit: int, window: float) -> Tuple[bool, bool]:
+        '''
+        Register a hit for the key.
+
+        Args:
+            key (str): Counter key.
+            limit (int): Number of hits allowed in the window.
+            window (float): Window length in seconds.
+
+        Returns:
+            Tuple[bool, bool]: Whether the hit is allowed and, if not, whether it is the first
+                               rejected hit in the window, so the user is warned only once.
+        '''
+        now = time.monotonic()
+        self._evict(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [deque(maxlen=limit), window, 0.0]
+            self._entries[key] = entry
+        else:
+            self._entries.move_to_end(key)
+        hits = entry[0]
+        while hits and now - hits[0] > window:
+            hits.popleft()
+
+        if len(hits) < limit:
+            hits.append(now)
+            return True, False
+        if now > entry[2]:
+            entry[2] = hits[0] + window
+            return False, True
+        return False, False
+
+
+class RedisSlidingWindow:
+    '''
+    Sliding window counters kept in Redis sorted sets, shared by all bot replicas.
+
+    Keys expire together with their window, so idle users do not occupy memory.
+    '''
+
+    def __init__(self, redis, prefix: str = 'throttle') -> None:
+        self.redis = redis
+        self.prefix = prefix
+        self._hit = redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+    async def hit(self, key: str, limit: int, window: float) -> Tuple[bool, bool]:
+        '''
+        Register a hit for the key, see `MemorySlidingWindow.hit`.
+        '''
+        now = time.time()
+        rkey = f'{self.prefix}:{key}'
+        # Simultaneous hits have the same score, a random member keeps them apart
+        member = f'{now}:{uuid.uuid4().hex}'
+        result = await self._hit(keys=[rkey, f'{rkey}:warned'], args=[now, window, limit, member, int(window) + 1])
+        return result == 1, result == 2
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    '''
+    Drop commands from a user or chat that exceeds its sliding window limit.
+
+    The middleware is registered as an inner message middleware, so only updates that matched
+    a handler are counted. The first rejected message in a window gets a short reply, further
+    ones are dropped silently.
+    '''
+
+    def __init__(self, storage, limits: Optional[Dict[str, Tuple[int, float]]] = None,
+                 default: Tuple[int, float] = DEFAULT_LIMIT) -> None:
+        self.storage = storage
+        self.limits = COMMAND_LIMITS if limits is None else limits
+        self.default = default
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or event.from_user is None:
+            return await handler(event, data)
+
+        command: Optional[CommandObject] = data.get('command')
+        name = command.command.lower() if command else 'text'
+        limit, window = self.limits.get(name, self.default)
+
+        # Every bot has its own limits, activity on one bot does not throttle the user on another
+        bot_id = data['bot'].id
+        allowed, warn = await self.storage.hit(f'{bot_id}:user:{event.from_user.id}:{name}', limit, window)
+        if allowed and event.chat.id != event.from_user.id:
+            allowed, warn = await self.storage.hit(f'{bot_id}:chat:{event.chat.id}:{name}',
+                                                   limit * CHAT_LIMIT_FACTOR, window)
+
+        if not allowed:
+            logger.info(f'Throttled /{name} from user {event.from_user.id} in chat {event.chat.id}')
+            if warn:
+                await event.answer(f'Too many requests, try again in {int(window)} seconds.')
+            return None
+        return await handler(event, data)
+
+
+def create_throttling_middleware() -> ThrottlingMiddleware:
+    '''
+    Create the throttling middleware with the backend selected by THROTTLE_BACKEND (memory or redis).
+    '''
+    backend = os.getenv('THROTTLE_BACKEND', 'memory')
+    if backend == 'redis':
+        from redis.asyncio import Redis
+        storage = RedisSlidingWindow(Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')))
+    else:
+        storage = MemorySlidingWindow(max_keys=int(os.getenv('THROTTLE_MAX_KEYS', '10000')))
+    logger.info(f'Throttling backend: {backend}')
+    return ThrottlingMiddleware(storage)
@@ -1,24 +1,24 @@
 import os
+import logging
 
-from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, JSON, ForeignKey, Index
+from sqlalchemy import Column, Integer, BigInteger, Float, String, DateTime, Boolean, JSON, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
 
-from datetime import datetime
+from typing import Optional, Dict, Any
 
-from dotenv import load_dotenv
+from core.utils.util import utcnow
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-db_url = os.getenv('DB_URL')
+# The connection to the database, created by init_db() and not at import time
+engine: Optional[Engine] = None
 
-# Create a connection to the database
-engine = create_engine(db_url)
-
-# Creating a session factory to work with the database
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Creating a session factory to work with the database, it is bound to the engine by init_db()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 # Base class for models
 Base = declarative_base()
@@ -28,13 +28,20 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, unique=True, index=True, nullable=False)
+    # The same Telegram user is registered separately with every bot
+    bot_id = Column(BigInteger, nullable=True, server_default='0')
+    # Telegram IDs do not fit into 32 bits
+    user_id = Column(BigInteger, index=True, nullable=False)
     token = Column(String, unique=True, index=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_active = Column(Boolean, default=True)
 
-    ities = relationship("City", back_populates="user", cascade="all, delete-orphan")
+    cities = relationship("City", back_populates="user", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index('uq_user_bot_user_id', 'bot_id', 'user_id', unique=True),
+    )
 
     def __repr__(self):
         return f"User(user_id={self.user_id}, created_at={self.created_at}, is_active={self.is_active})"
@@ -42,6 +49,7 @@ class User(Base):
     def to_dict(self):
         return {
             "id": self.id,
+            "bot_id": self.bot_id,
             "user_id": self.user_id,
             "token": self.token,
             "created_at": self.created_at.isoformat() if self.created_at else None,
@@ -84,12 +92,20 @@ class Forecast(Base):
     __tablename__ = "weather_forecasts"
 
     id = Column(Integer, primary_key=True, index=True)
-    city_id = Column(Integer, ForeignKey('cities.id', ondelete='CASCADE'), nullable=False, index=True)
+    city_id = Column(Integer, ForeignKey('cities.id', ondelete='CASCADE'), nullable=False)
     forecast_data = Column(JSON)
-    timestamp = Column(DateTime(timezone=True), default=lambda: datetime.now(datetime.timezone.utc))
+    # Aware UTC, never naive local time; is_forecast_old() reads naive values (SQLite) as UTC
+    timestamp = Column(DateTime(timezone=True), default=utcnow)
     
     city = relationship("City", back_populates="forecast")
 
+    __table_args__ = (
+        # One forecast per city, the conflict target of the upsert
+        Index('uq_forecast_city_id', 'city_id', unique=True),
+        # Used by the retention job to find expired forecasts
+        Index('idx_forecast_timestamp', 'timestamp'),
+    )
+
     def __repr__(self):
         return f"Forecast(id={self.id}, city_id={self.city_id})"
     
@@ -101,6 +117,167 @@ class Forecast(Base):
             "timestamp": self.timestamp.isoformat() if self.timestamp else None
             }
 
+# The Subscription model
+class Subscription(Base):
+    __tablename__ = "subscriptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # The bot that delivers the forecast
+    bot_id = Column(BigInteger, nullable=True, server_default='0')
+    # Telegram IDs do not fit into 32 bits (e.g. supergroup chat IDs -100...)
+    user_id = Column(BigInteger, nullable=False, index=True)
+    chat_id = Column(BigInteger, nullable=False)
+    city_id = Column(Integer, ForeignKey('cities.id', ondelete='CASCADE'), nullable=False, index=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    # Local delivery time as entered by the user, e.g. "07:30"
+    delivery_time = Column(String, nullable=False)
+    # Offset of the location's time zone, refreshed from every fetched forecast
+    utc_offset = Column(Integer, nullable=False, default=0)
+    # Delivery time converted to minutes since UTC midnight, used to select due subscriptions
+    delivery_minute = Column(Integer, nullable=False)
+    last_sent_at = Column(DateTime(timezone=True), nullable=True)
+    # Locale of the delivered text, taken from the Telegram language_code
+    language = Column(String, nullable=True, server_default='en')
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    city = relationship("City")
+
+    __table_args__ = (
+        Index('idx_subscription_delivery', 'delivery_minute'),
+        Index('idx_subscription_user_city', 'bot_id', 'user_id', 'city_id', unique=True),
+    )
+
+    def __repr__(self):
+        return f"Subscription(user_id={self.user_id}, city_id={self.city_id}, delivery_time={self.delivery_time})"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "bot_id": self.bot_id,
+            "user_id": self.user_id,
+            "chat_id": self.chat_id,
+            "city_id": self.city_id,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "delivery_time": self.delivery_time,
+            "utc_offset": self.utc_offset,
+            "delivery_minute": self.delivery_minute,
+            "last_sent_at": self.last_sent_at.isoformat() if self.last_sent_at else None,
+            "language": self.language,
+            }
+
+
+def _engine_options(db_url: str) -> Dict[str, Any]:
+    '''
+    Connection pool settings for the engine, configured with environment variables.
+    '''
+    options: Dict[str, Any] = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+    if make_url(db_url).get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+            pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        )
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    '''
+    WAL lets readers work while a forecast is written, NORMAL sync is safe with WAL.
+    '''
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))}")
+    cursor.close()
+
+def init_db(db_url: Optional[str] = None) -> Engine:
+    '''
+    Create the database engine and bind the session factory to it.
+
+    Called once from dp.startup (or by manage.py), repeated calls return the existing engine.
+    The schema is not touched here, it is managed by `python manage.py migrate`.
+    '''
+    global engine
+    if engine is None:
+        db_url = db_url or os.getenv('DB_URL')
+        if not db_url:
+            raise ValueError('DB_URL is not set, set it or use REPOSITORY_BACKEND=memory')
+        engine = create_engine(db_url, **_engine_options(db_url))
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _set_sqlite_pragmas)
+        SessionLocal.configure(bind=engine)
+        logger.info(f'Database engine is created for {engine.url.get_backend_name()}')
+    return engine
+
+# Cities used to be stored with the Telegram ID of the user instead of users.id,
+# such rows get the first user registered with that Telegram ID
+REWRITE_CITY_OWNERS = text(
+    'UPDATE cities SET user_id = (SELECT MIN(id) FROM users WHERE users.user_id = cities.user_id) '
+    'WHERE user_id NOT IN (SELECT id FROM users) AND user_id IN (SELECT user_id FROM users)'
+)
 
-# Creating tables in the database
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+def create_schema(bind: Engine) -> None:
+    '''
+    Create missing tables and indexes in the database.
+    '''
+    # Free pages can be returned to the file system by the maintenance job without a full VACUUM
+    if bind.dialect.name == 'sqlite':
+        with bind.connect() as connection:
+            if connection.execute(text('PRAGMA auto_vacuum')).scalar() != 2:
+                connection.execute(text('PRAGMA auto_vacuum=INCREMENTAL'))
+                # The mode of an existing database changes only after a full VACUUM
+                connection.execute(text('VACUUM'))
+    # A unique index can not be created while a city has several forecasts, keep the newest one
+    if inspect(bind).has_table(Forecast.__tablename__):
+        with bind.begin() as connection:
+            connection.execute(text(
+                'DELETE FROM weather_forecasts WHERE id NOT IN '
+                '(SELECT MAX(id) FROM weather_forecasts GROUP BY city_id)'
+            ))
+    # Creating tables in the database
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as connection:
+        connection.execute(REWRITE_CITY_OWNERS)
+    # create_all skips existing tables, add nullable columns declared after the table was created
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}'
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+            with bind.begin() as connection:
+                connection.execute(text(ddl))
+            logger.info(f'Column {table.name}.{column.name} is added')
+    # Integer columns declared as BigInteger later are widened, SQLite integers are 64-bit already
+    if bind.dialect.name == 'postgresql':
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                old_type = existing.get(column.name)
+                if isinstance(column.type, BigInteger) and isinstance(old_type, Integer) \
+                        and not isinstance(old_type, BigInteger):
+                    with bind.begin() as connection:
+                        connection.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE BIGINT'))
+                    logger.info(f'Column {table.name}.{column.name} is widened to BIGINT')
+    # Unique indexes whose columns changed are recreated below
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name']: index for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            old = existing.get(index.name)
+            if old is not None and (old['column_names'] != [c.name for c in index.columns]
+                                    or bool(old['unique']) != bool(index.unique)):
+                with bind.begin() as connection:
+                    connection.execute(text(f'DROP INDEX {index.name}'))
+                logger.info(f'Index {index.name} is dropped to be recreated')
+    # create_all skips existing tables, add indexes declared after the table was created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+import logging
+
+from core.repository.base import Repository, UserRecord, CityRecord, ForecastRecord, SubscriptionRecord, SubscriberRecord
+from core.repository.orm import SQLAlchemyRepository
+from core.repository.raw import RawSQLRepository
+from core.repository.memory import InMemoryRepository
+
+logger = logging.getLogger(__name__)
+
+REPOSITORY_BACKENDS = {
+    'orm': SQLAlchemyRepository,
+    'raw': RawSQLRepository,
+    'memory': InMemoryRepository,
+}
+
+
+def create_repository() -> Repository:
+    '''
+    Create the repository selected by REPOSITORY_BACKEND (orm, raw or memory).
+    '''
+    backend = os.getenv('REPOSITORY_BACKEND', 'orm')
+    if backend not in REPOSITORY_BACKENDS:
+        raise ValueError(f'Unknown REPOSITORY_BACKEND {backend!r}, expected one of {", ".join(REPOSITORY_BACKENDS)}')
+    logger.info(f'Repository backend: {backend}')
+    return REPOSITORY_BACKENDS[backend]()
@@ -0,0 +1,172 @@
+'''
+Storage interface used by the handlers, the backends are injected through the dispatcher
+'''
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+
+@dataclass
+class UserRecord:
+    id: int
+    user_id: int
+    token: str
+    is_active: bool = True
+    bot_id: int = 0
+
+
+@dataclass
+class CityRecord:
+    id: int
+    user_id: int
+    name: str
+    latitude: float
+    longitude: float
+
+
+@dataclass
+class ForecastRecord:
+    city_id: int
+    forecast_data: dict
+    timestamp: datetime
+
+
+@dataclass
+class SubscriptionRecord:
+    id: int
+    bot_id: int
+    user_id: int
+    chat_id: int
+    city_id: int
+    latitude: float
+    longitude: float
+    delivery_time: str
+    utc_offset: int
+    delivery_minute: int
+    last_sent_at: Optional[datetime]
+    language: Optional[str]
+    city_name: Optional[str] = None
+
+
+@dataclass
+class SubscriberRecord:
+    chat_id: int
+    language: str
+    bot_id: int = 0
+
+
+class Repository(ABC):
+    '''
+    Users, cities, forecasts and subscriptions.
+
+    Methods are synchronous and every call is a short unit of work. Lookups return None
+    (or skip missing keys in batch lookups) when nothing is found or the storage fails.
+
+    Users and subscriptions belong to a bot (`bot_id`, the ID from the bot token), cities and
+    forecasts are shared by all bots.
+    '''
+
+    ### Users
+    @abstractmethod
+    def get_user(self, user_id: int, bot_id: int = 0) -> Optional[UserRecord]:
+        '''
+        Get a user of the bot by the Telegram ID.
+        '''
+
+    @abstractmethod
+    def create_user(self, user_id: int, token: str, bot_id: int = 0) -> UserRecord:
+        '''
+        Add a user of the bot with the hash of the login token.
+        '''
+
+    @abstractmethod
+    def assign_default_bot(self, bot_id: int) -> int:
+        '''
+        Assign users and subscriptions stored before the multi-bot mode (bot_id 0) to the bot.
+        '''
+
+    ### Cities
+    @abstractmethod
+    def create_city(self, user_id: int, name: str, latitude: float, longitude: float, bot_id: int = 0) -> CityRecord:
+        '''
+        Add a city found by the bot's user with the given Telegram ID.
+        '''
+
+    def get_city_by_name(self, name: str) -> Optional[CityRecord]:
+        '''
+        Get the first city with the name.
+        '''
+        return self.get_cities_by_names([name]).get(name)
+
+    @abstractmethod
+    def get_cities_by_names(self, names: Iterable[str]) -> Dict[str, CityRecord]:
+        '''
+        Get the first city for each of the names in one lookup.
+        '''
+
+    @abstractmethod
+    def list_cities(self) -> List[CityRecord]:
+        '''
+        Get all cities ordered by ID.
+        '''
+
+    ### Forecasts
+    def get_forecast(self, city_id: int) -> Optional[ForecastRecord]:
+        '''
+        Get the stored forecast of the city.
+        '''
+        return self.get_forecasts([city_id]).get(city_id)
+
+    @abstractmethod
+    def get_forecasts(self, city_ids: Iterable[int]) -> Dict[int, ForecastRecord]:
+        '''
+        Get the stored forecasts of the cities in one lookup.
+        '''
+
+    def upsert_forecast(self, city_id: int, forecast_data: dict) -> Optional[ForecastRecord]:
+        '''
+        Store the forecast of the city, replacing the previous one.
+        '''
+        return self.upsert_forecasts({city_id: forecast_data}).get(city_id)
+
+    @abstractmethod
+    def upsert_forecasts(self, forecasts: Dict[int, dict]) -> Dict[int, ForecastRecord]:
+        '''
+        Store the forecasts by city ID in one unit of work, returns the stored records.
+        '''
+
+    ### Subscriptions
+    @abstractmethod
+    def save_subscription(self, user_id: int, chat_id: int, city_id: int, latitude: float, longitude: float,
+                          delivery_time: str, utc_offset: int, delivery_minute: int,
+                          last_sent_at: Optional[datetime], language: str, bot_id: int = 0) -> bool:
+        '''
+        Create the user's subscription for the city or replace its settings.
+        '''
+
+    @abstractmethod
+    def get_due_subscriptions(self, minute: int, window: int, sent_before: datetime) -> List[SubscriptionRecord]:
+        '''
+        Get the subscriptions with a delivery minute in [minute - window, minute] not delivered since sent_before.
+
+        The window wraps past midnight, at minute 5 it also covers the minutes from 1440 + 5 - window.
+        '''
+
+    @abstractmethod
+    def mark_subscriptions_sent(self, subscriptions: List[SubscriptionRecord], sent_at: datetime) -> None:
+        '''
+        Store the delivery time and the refreshed utc_offset and delivery_minute of the subscriptions.
+        '''
+
+    @abstractmethod
+    def get_subscribers(self, city_id: int) -> List[SubscriberRecord]:
+        '''
+        Get the chats subscribed to the city, one per bot and chat.
+        '''
+
+    @abstractmethod
+    def delete_subscriptions(self, user_id: int, city_id: Optional[int] = None, bot_id: int = 0) -> int:
+        '''
+        Delete the user's subscription for the city, or all of the user's subscriptions.
+        '''
@@ -0,0 +1,135 @@
+'''
+In-memory repository for tests and benchmarks
+'''
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.utils.util import utcnow, is_delivery_due
+from core.repository.base import Repository, UserRecord, CityRecord, ForecastRecord, SubscriptionRecord, SubscriberRecord
+
+
+class InMemoryRepository(Repository):
+    '''
+    Repository kept in dictionaries, nothing is persisted.
+
+    A lock makes it safe to use from worker threads as well as from the event loop.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (bot ID, Telegram ID) -> user
+        self._users: Dict[Tuple[int, int], UserRecord] = {}
+        self._cities: Dict[int, CityRecord] = {}
+        # name -> ID of the first city with the name
+        self._city_names: Dict[str, int] = {}
+        self._forecasts: Dict[int, ForecastRecord] = {}
+        # (bot ID, user ID, city ID) -> subscription fields
+        self._subscriptions: Dict[Tuple[int, int, int], dict] = {}
+        self._subscription_ids = 0
+
+    ### Users
+    def get_user(self, user_id: int, bot_id: int = 0) -> Optional[UserRecord]:
+        return self._users.get((bot_id, user_id))
+
+    def create_user(self, user_id: int, token: str, bot_id: int = 0) -> UserRecord:
+        with self._lock:
+            if (bot_id, user_id) in self._users:
+                raise ValueError(f'User {user_id} of bot {bot_id} already exists')
+            user = UserRecord(id=len(self._users) + 1, user_id=user_id, token=token, bot_id=bot_id)
+            self._users[(bot_id, user_id)] = user
+            return user
+
+    def assign_default_bot(self, bot_id: int) -> int:
+        with self._lock:
+            legacy = [key for key in self._users if key[0] == 0]
+            for key in legacy:
+                user = self._users.pop(key)
+                user.bot_id = bot_id
+                self._users[(bot_id, key[1])] = user
+            for key in [key for key in self._subscriptions if key[0] == 0]:
+                self._subscriptions[(bot_id,) + key[1:]] = self._subscriptions.pop(key)
+            return len(legacy)
+
+    ### Cities
+    def create_city(self, user_id: int, name: str, latitude: float, longitude: float, bot_id: int = 0) -> CityRecord:
+        with self._lock:
+            owner = self._users.get((bot_id, user_id))
+            city = CityRecord(id=len(self._cities) + 1, user_id=owner.id if owner else user_id,
+                              name=name, latitude=latitude, longitude=longitude)
+            self._cities[city.id] = city
+            self._city_names.setdefault(name, city.id)
+            return city
+
+    def get_cities_by_names(self, names: Iterable[str]) -> Dict[str, CityRecord]:
+        found = {}
+        for name in names:
+            city_id = self._city_names.get(name)
+            if city_id is not None:
+                found[name] = self._cities[city_id]
+        return found
+
+    def list_cities(self) -> List[CityRecord]:
+        with self._lock:
+            return list(self._cities.values())
+
+    ### Forecasts
+    def get_forecasts(self, city_ids: Iterable[int]) -> Dict[int, ForecastRecord]:
+        return {city_id: self._forecasts[city_id] for city_id in city_ids if city_id in self._forecasts}
+
+    def upsert_forecasts(self, forecasts: Dict[int, dict]) -> Dict[int, ForecastRecord]:
+        timestamp = utcnow()
+        records = {city_id: ForecastRecord(city_id, data, timestamp) for city_id, data in forecasts.items()}
+        with self._lock:
+            self._forecasts.update(records)
+        return records
+
+    ### Subscriptions
+    def save_subscription(self, user_id: int, chat_id: int, city_id: int, latitude: float, longitude: float,
+                          delivery_time: str, utc_offset: int, delivery_minute: int,
+                          last_sent_at: Optional[datetime], language: str, bot_id: int = 0) -> bool:
+        with self._lock:
+            existing = self._subscriptions.get((bot_id, user_id, city_id))
+            if existing is None:
+                self._subscription_ids += 1
+            self._subscriptions[(bot_id, user_id, city_id)] = {
+                'id': existing['id'] if existing else self._subscription_ids, 'chat_id': chat_id, 'latitude': latitude, 'longitude': longitude,
+                'delivery_time': delivery_time, 'utc_offset': utc_offset, 'delivery_minute': delivery_minute,
+                'last_sent_at': last_sent_at, 'language': language,
+            }
+        return True
+
+    def get_due_subscriptions(self, minute: int, window: int, sent_before: datetime) -> List[SubscriptionRecord]:
+        with self._lock:
+            items = list(self._subscriptions.items())
+        due = []
+        for (bot_id, user_id, city_id), fields in items:
+            if not is_delivery_due(fields['delivery_minute'], minute, window):
+                continue
+            if fields['last_sent_at'] is not None and fields['last_sent_at'] >= sent_before:
+                continue
+            city = self._cities.get(city_id)
+            due.append(SubscriptionRecord(bot_id=bot_id, user_id=user_id, city_id=city_id,
+                                          city_name=city.name if city else None, **fields))
+        return due
+
+    def mark_subscriptions_sent(self, subscriptions: List[SubscriptionRecord], sent_at: datetime) -> None:
+        with self._lock:
+            for sub in subscriptions:
+                fields = self._subscriptions.get((sub.bot_id, sub.user_id, sub.city_id))
+                if fields is not None:
+                    fields.update(last_sent_at=sent_at, utc_offset=sub.utc_offset, delivery_minute=sub.delivery_minute)
+
+    def get_subscribers(self, city_id: int) -> List[SubscriberRecord]:
+        with self._lock:
+            chats = {(key[0], fields['chat_id']): fields['language'] for key, fields in self._subscriptions.items()
+                     if key[2] == city_id}
+        return [SubscriberRecord(chat_id, language, bot_id) for (bot_id, chat_id), language in chats.items()]
+
+    def delete_subscriptions(self, user_id: int, city_id: Optional[int] = None, bot_id: int = 0) -> int:
+        with self._lock:
+            keys = [key for key in self._subscriptions
+                    if key[:2] == (bot_id, user_id) and city_id in (None, key[2])]
+            for key in keys:
+                del self._subscriptions[key]
+            return len(keys)
@@ -0,0 +1,234 @@
+'''
+SQLAlchemy ORM repository
+'''
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from core.model.models import SessionLocal, User, City, Forecast, Subscription
+from core.utils.locales import DEFAULT_LOCALE
+from core.utils.util import utcnow
+from core.repository.base import Repository, UserRecord, CityRecord, ForecastRecord, SubscriptionRecord, SubscriberRecord
+
+logger = logging.getLogger(__name__)
+
+# Dialects with native INSERT ... ON CONFLICT support
+UPSERT_DIALECTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert,
+}
+
+
+def _user(user: User) -> UserRecord:
+    return UserRecord(id=user.id, user_id=user.user_id, token=user.token, is_active=user.is_active,
+                      bot_id=user.bot_id or 0)
+
+
+def _city(city: City) -> CityRecord:
+    return CityRecord(id=city.id, user_id=city.user_id, name=city.name,
+                      latitude=city.latitude, longitude=city.longitude)
+
+
+class SQLAlchemyRepository(Repository):
+    '''
+    Repository on the ORM models, every call uses its own short session.
+    '''
+
+    ### Users
+    def get_user(self, user_id: int, bot_id: int = 0) -> Optional[UserRecord]:
+        with SessionLocal() as db:
+            user = db.query(User).filter(User.bot_id == bot_id, User.user_id == user_id).first()
+            return _user(user) if user else None
+
+    def create_user(self, user_id: int, token: str, bot_id: int = 0) -> UserRecord:
+        with SessionLocal() as db:
+            user = User(bot_id=bot_id, user_id=user_id, token=token)
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+            return _user(user)
+
+    def assign_default_bot(self, bot_id: int) -> int:
+        with SessionLocal() as db:
+            count = db.query(User).filter((User.bot_id == 0) | User.bot_id.is_(None)) \
+                .update({User.bot_id: bot_id}, synchronize_session=False)
+            db.query(Subscription).filter((Subscription.bot_id == 0) | Subscription.bot_id.is_(None)) \
+                .update({Subscription.bot_id: bot_id}, synchronize_session=False)
+            db.commit()
+            return count
+
+    ### Cities
+    def create_city(self, user_id: int, name: str, latitude: float, longitude: float, bot_id: int = 0) -> CityRecord:
+        with SessionLocal() as db:
+            # cities.user_id references users.id, not the Telegram ID
+            owner_id = db.query(User.id).filter(User.bot_id == bot_id, User.user_id == user_id).scalar()
+            city = City(user_id=owner_id if owner_id is not None else user_id,
+                        name=name, latitude=latitude, longitude=longitude)
+            db.add(city)
+            db.commit()
+            db.refresh(city)
+            return _city(city)
+
+    def get_cities_by_names(self, names: Iterable[str]) -> Dict[str, CityRecord]:
+        names = list(set(names))
+        if not names:
+            return {}
+        try:
+            with SessionLocal() as db:
+                first_ids = db.query(func.min(City.id)).filter(City.name.in_(names)).group_by(City.name)
+                return {city.name: _city(city) for city in db.query(City).filter(City.id.in_(first_ids))}
+        except Exception as e:
+            logger.error(f'Error getting cities by names: {e}')
+            return {}
+
+    def list_cities(self) -> List[CityRecord]:
+        with SessionLocal() as db:
+            rows = db.query(City.id, City.user_id, City.name, City.latitude, City.longitude).order_by(City.id)
+            return [CityRecord(*row) for row in rows]
+
+    ### Forecasts
+    def get_forecasts(self, city_ids: Iterable[int]) -> Dict[int, ForecastRecord]:
+        city_ids = list(set(city_ids))
+        if not city_ids:
+            return {}
+        try:
+            with SessionLocal() as db:
+                rows = db.query(Forecast.city_id, Forecast.forecast_data, Forecast.timestamp) \
+                    .filter(Forecast.city_id.in_(city_ids))
+                return {row.city_id: ForecastRecord(*row) for row in rows}
+        except Exception as e:
+            logger.error(f'Error querying weather forecasts: {e}')
+            return {}
+
+    def upsert_forecasts(self, forecasts: Dict[int, dict]) -> Dict[int, ForecastRecord]:
+        '''
+        On SQLite and PostgreSQL this is a single INSERT ... ON CONFLICT (city_id) DO UPDATE statement,
+        other databases fall back to a query followed by updates and inserts.
+        '''
+        if not forecasts:
+            return {}
+        timestamp = utcnow()
+        records = {city_id: ForecastRecord(city_id, data, timestamp) for city_id, data in forecasts.items()}
+        with SessionLocal() as db:
+            try:
+                dialect = db.get_bind().dialect.name
+                if dialect in UPSERT_DIALECTS:
+                    statement = UPSERT_DIALECTS[dialect](Forecast.__table__).values([
+                        {'city_id': city_id, 'forecast_data': data, 'timestamp': timestamp}
+                        for city_id, data in forecasts.items()
+                    ])
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[Forecast.__table__.c.city_id],
+                        set_={
+                            'forecast_data': statement.excluded.forecast_data,
+                            'timestamp': statement.excluded.timestamp,
+                        },
+                    )
+                    db.execute(statement)
+                else:
+                    existing = {f.city_id: f for f in db.query(Forecast).filter(Forecast.city_id.in_(list(forecasts)))}
+                    for city_id, data in forecasts.items():
+                        forecast = existing.get(city_id)
+                        if forecast is None:
+                            db.add(Forecast(city_id=city_id, forecast_data=data, timestamp=timestamp))
+                        else:
+                            forecast.forecast_data = data
+                            forecast.timestamp = timestamp
+                db.commit()
+                # The stored values are known, no need to read the rows back
+                return records
+            except Exception as e:
+                logger.error(f'Error creating or updating weather forecasts: {e}')
+                db.rollback()
+                return {}
+
+    ### Subscriptions
+    def save_subscription(self, user_id: int, chat_id: int, city_id: int, latitude: float, longitude: float,
+                          delivery_time: str, utc_offset: int, delivery_minute: int,
+                          last_sent_at: Optional[datetime], language: str, bot_id: int = 0) -> bool:
+        with SessionLocal() as db:
+            try:
+                subscription = db.query(Subscription).filter(
+                    Subscription.bot_id == bot_id, Subscription.user_id == user_id, Subscription.city_id == city_id
+                ).first()
+                if subscription is None:
+                    subscription = Subscription(bot_id=bot_id, user_id=user_id, city_id=city_id)
+                    db.add(subscription)
+                subscription.chat_id = chat_id
+                subscription.latitude = latitude
+                subscription.longitude = longitude
+                subscription.delivery_time = delivery_time
+                subscription.utc_offset = utc_offset
+                subscription.delivery_minute = delivery_minute
+                subscription.last_sent_at = last_sent_at
+                subscription.language = language
+                db.commit()
+                return True
+            except Exception as e:
+                logger.error(f'Error creating subscription: {e}')
+                db.rollback()
+                return False
+
+    def get_due_subscriptions(self, minute: int, window: int, sent_before: datetime) -> List[SubscriptionRecord]:
+        in_window = Subscription.delivery_minute.between(minute - window, minute)
+        if minute < window:
+            in_window = (Subscription.delivery_minute <= minute) | (Subscription.delivery_minute >= minute - window + 1440)
+        with SessionLocal() as db:
+            rows = db.query(Subscription, City.name).outerjoin(City, City.id == Subscription.city_id).filter(
+                in_window,
+                (Subscription.last_sent_at.is_(None)) | (Subscription.last_sent_at < sent_before)
+            )
+            return [
+                SubscriptionRecord(
+                    id=sub.id, bot_id=sub.bot_id or 0, user_id=sub.user_id, chat_id=sub.chat_id, city_id=sub.city_id,
+                    latitude=sub.latitude, longitude=sub.longitude, delivery_time=sub.delivery_time,
+                    utc_offset=sub.utc_offset, delivery_minute=sub.delivery_minute, last_sent_at=sub.last_sent_at,
+                    language=sub.language, city_name=name,
+                )
+                for sub, name in rows
+            ]
+
+    def mark_subscriptions_sent(self, subscriptions: List[SubscriptionRecord], sent_at: datetime) -> None:
+        with SessionLocal() as db:
+            try:
+                db.bulk_update_mappings(Subscription, [
+                    {
+                        'id': sub.id,
+                        'last_sent_at': sent_at,
+                        'utc_offset': sub.utc_offset,
+                        'delivery_minute': sub.delivery_minute,
+                    }
+                    for sub in subscriptions
+                ])
+                db.commit()
+            except Exception as e:
+                logger.error(f'Error marking subscriptions as delivered: {e}')
+                db.rollback()
+
+    def get_subscribers(self, city_id: int) -> List[SubscriberRecord]:
+        try:
+            with SessionLocal() as db:
+                rows = db.query(Subscription.chat_id, Subscription.language, Subscription.bot_id) \
+                    .filter(Subscription.city_id == city_id).distinct()
+                return [SubscriberRecord(row.chat_id, row.language or DEFAULT_LOCALE, row.bot_id or 0) for row in rows]
+        except Exception as e:
+            logger.error(f'Error querying subscribers: {e}')
+            return []
+
+    def delete_subscriptions(self, user_id: int, city_id: Optional[int] = None, bot_id: int = 0) -> int:
+        with SessionLocal() as db:
+            try:
+                query = db.query(Subscription).filter(Subscription.bot_id == bot_id, Subscription.user_id == user_id)
+                if city_id is not None:
+                    query = query.filter(Subscription.city_id == city_id)
+                count = query.delete(synchronize_session=False)
+                db.commit()
+                return count
+            except Exception as e:
+                logger.error(f'Error deleting subscriptions: {e}')
+                db.rollback()
+                return 0
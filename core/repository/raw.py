@@ -0,0 +1,68 @@
+'''
+Raw SQL repository for the hot read paths
+'''
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Boolean, DateTime, JSON, bindparam, text
+
+from core.model import models
+from core.repository.base import UserRecord, CityRecord, ForecastRecord
+from core.repository.orm import SQLAlchemyRepository
+
+logger = logging.getLogger(__name__)
+
+# Compiled once, the result types convert JSON and timestamps like the ORM does
+SELECT_USER = text(
+    'SELECT id, user_id, token, is_active, bot_id FROM users WHERE bot_id = :bot_id AND user_id = :user_id'
+).columns(is_active=Boolean)
+SELECT_CITIES_BY_NAMES = text(
+    'SELECT c.id, c.user_id, c.name, c.latitude, c.longitude FROM cities c '
+    'JOIN (SELECT MIN(id) AS id FROM cities WHERE name IN :names GROUP BY name) f ON f.id = c.id'
+).bindparams(bindparam('names', expanding=True))
+SELECT_CITIES = text('SELECT id, user_id, name, latitude, longitude FROM cities ORDER BY id')
+SELECT_FORECASTS = text(
+    'SELECT city_id, forecast_data, timestamp FROM weather_forecasts WHERE city_id IN :city_ids'
+).bindparams(bindparam('city_ids', expanding=True)).columns(forecast_data=JSON, timestamp=DateTime(timezone=True))
+
+
+class RawSQLRepository(SQLAlchemyRepository):
+    '''
+    Repository that reads with precompiled SQL on a pooled connection.
+
+    The reads skip the session, the identity map and ORM object construction, rows are turned
+    into records directly. Writes are inherited from the ORM repository.
+    '''
+
+    def get_user(self, user_id: int, bot_id: int = 0) -> Optional[UserRecord]:
+        with models.engine.connect() as connection:
+            row = connection.execute(SELECT_USER, {'bot_id': bot_id, 'user_id': user_id}).first()
+        return UserRecord(*row) if row else None
+
+    def get_cities_by_names(self, names: Iterable[str]) -> Dict[str, CityRecord]:
+        names = list(set(names))
+        if not names:
+            return {}
+        try:
+            with models.engine.connect() as connection:
+                rows = connection.execute(SELECT_CITIES_BY_NAMES, {'names': names}).all()
+        except Exception as e:
+            logger.error(f'Error getting cities by names: {e}')
+            return {}
+        return {row.name: CityRecord(*row) for row in rows}
+
+    def list_cities(self) -> List[CityRecord]:
+        with models.engine.connect() as connection:
+            return [CityRecord(*row) for row in connection.execute(SELECT_CITIES)]
+
+    def get_forecasts(self, city_ids: Iterable[int]) -> Dict[int, ForecastRecord]:
+        city_ids = list(set(city_ids))
+        if not city_ids:
+            return {}
+        try:
+            with models.engine.connect() as connection:
+                rows = connection.execute(SELECT_FORECASTS, {'city_ids': city_ids}).all()
+        except Exception as e:
+            logger.error(f'Error querying weather forecasts: {e}')
+            return {}
+        return {row.city_id: ForecastRecord(*row) for row in rows}
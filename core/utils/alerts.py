@@ -0,0 +1,251 @@
+'''
+Severe-weather alerts from forecast changes
+
+When a forecast is refreshed, the new hourly series are compared with the stored ones. Only if
+they differ are the threshold rules evaluated over the whole series at once, and only hazards
+that were not in the previous forecast are queued for the subscribers of the city.
+'''
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from aiogram import Bot
+
+from core.repository import Repository
+from core.utils.locales import DEFAULT_LOCALE, label
+from core.utils.scheduler import RateLimitedSender, forecast_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Wind gusts in km/h and hourly precipitation in mm that raise an alert
+ALERT_GUSTS = float(os.getenv('ALERT_GUSTS', '70'))
+ALERT_PRECIPITATION = float(os.getenv('ALERT_PRECIPITATION', '10'))
+# Only hazards within this number of hours from now are reported
+ALERT_HORIZON = int(os.getenv('ALERT_HORIZON', '48'))
+ALERT_QUEUE_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    '''
+    A hazard found in one hourly series, either by weather code class or by a threshold.
+    '''
+    name: str
+    variable: str
+    codes: Tuple[int, ...] = ()
+    threshold: Optional[float] = None
+
+    def evaluate(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Return the mask of the hazardous hours, missing values (nan) never match.
+        '''
+        if self.codes:
+            return np.isin(values, self.codes)
+        with np.errstate(invalid='ignore'):
+            return values >= self.threshold
+
+
+ALERT_RULES: Tuple[AlertRule, ...] = (
+    AlertRule('thunderstorm', 'weather_code', codes=(95, 96, 99)),
+    AlertRule('heavy_snow', 'weather_code', codes=(75, 86)),
+    AlertRule('strong_gusts', 'wind_gusts_10m', threshold=ALERT_GUSTS),
+    AlertRule('heavy_precipitation', 'precipitation', threshold=ALERT_PRECIPITATION),
+)
+ALERT_VARIABLES = tuple(sorted({rule.variable for rule in ALERT_RULES}))
+
+
+@dataclass
+class Alert:
+    rule: str
+    start: str # local time of the first hazardous hour, e.g. "2024-06-01T15:00"
+    end: str # local time of the last hazardous hour
+    peak: Optional[float] = None # the maximum value for threshold rules
+
+
+def forecast_changed(old: Dict[str, Any], new: Dict[str, Any]) -> bool:
+    '''
+    Return True if the time axis or any series used by the rules differ.
+    '''
+    old_hourly, new_hourly = old.get('hourly') or {}, new.get('hourly') or {}
+    return any(old_hourly.get(name) != new_hourly.get(name) for name in ('time',) + ALERT_VARIABLES)
+
+
+def _series(hourly: Dict[str, Any], name: str, size: int) -> np.ndarray:
+    # None (missing in the API response) becomes nan
+    values = np.array((hourly.get(name) or [])[:size], dtype=float)
+    return np.pad(values, (0, size - values.size), constant_values=np.nan)
+
+
+def _runs(indices: np.ndarray) -> List[np.ndarray]:
+    '''
+    Split sorted hour indices into runs of consecutive hours.
+    '''
+    return np.split(indices, np.flatnonzero(np.diff(indices) != 1) + 1)
+
+
+def detect_alerts(old: Optional[Dict[str, Any]], new: Dict[str, Any], now: Optional[datetime] = None) -> List[Alert]:
+    '''
+    Find the hazards of the new forecast that the old forecast did not have at the same hours.
+
+    Args:
+        old (Optional[Dict[str, Any]]): The stored forecast data, without it nothing is reported.
+        new (Dict[str, Any]): The fetched forecast data.
+        now (Optional[datetime]): Current time, UTC now by default.
+
+    Returns:
+        List[Alert]: One alert per rule and run of consecutive hazardous hours.
+    '''
+    if old is None or not forecast_changed(old, new):
+        return []
+    hourly, old_hourly = new['hourly'], old.get('hourly') or {}
+    times = np.array(hourly.get('time') or [], dtype=str)
+    old_times = np.array(old_hourly.get('time') or [], dtype=str)
+    if times.size == 0:
+        return []
+
+    # Hours of the new forecast between now and the horizon in the location's local time
+    now = (now or datetime.now(timezone.utc)) + timedelta(seconds=int(new.get('utc_offset_seconds', 0)))
+    start = (now.replace(minute=0, second=0, microsecond=0)).strftime('%Y-%m-%dT%H:%M')
+    end = (now + timedelta(hours=ALERT_HORIZON)).strftime('%Y-%m-%dT%H:%M')
+    window = (times >= start) & (times < end)
+
+    # Position of every new hour in the old time axis, both are sorted ISO strings
+    if old_times.size:
+        positions = np.searchsorted(old_times, times).clip(0, old_times.size - 1)
+        matched = old_times[positions] == times
+    else:
+        positions, matched = np.zeros(times.size, dtype=int), np.zeros(times.size, dtype=bool)
+
+    new_values = {name: _series(hourly, name, times.size) for name in ALERT_VARIABLES}
+    old_values = {name: _series(old_hourly, name, old_times.size) for name in ALERT_VARIABLES}
+
+    alerts = []
+    for rule in ALERT_RULES:
+        hazard = rule.evaluate(new_values[rule.variable])
+        known = matched & rule.evaluate(old_values[rule.variable])[positions] if old_times.size else matched
+        indices = np.flatnonzero(hazard & ~known & window)
+        if indices.size == 0:
+            continue
+        for run in _runs(indices):
+            peak = float(np.nanmax(new_values[rule.variable][run])) if rule.threshold is not None else None
+            alerts.append(Alert(rule.name, str(times[run[0]]), str(times[run[-1]]), peak))
+    return alerts
+
+
+def format_alerts(name: str, alerts: List[Alert], locale: str = DEFAULT_LOCALE) -> str:
+    '''
+    Render the alerts of a city as the text of a message in the locale.
+    '''
+    lines = [label('alert', locale).format(name=name)]
+    for alert in sorted(alerts, key=lambda alert: alert.start):
+        period = alert.start.replace('T', ' ')
+        if alert.end != alert.start:
+            period += '–' + (alert.end[11:] if alert.end[:10] == alert.start[:10] else alert.end.replace('T', ' '))
+        line = f'\U000026A0 {label(alert.rule, locale)}: {period}'
+        if alert.peak is not None:
+            line += f" ({label('up_to', locale)} {round(alert.peak, 1)})"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+class AlertDispatcher:
+    '''
+    Detect alerts on forecast refreshes and deliver them in the background.
+
+    Detection runs in the refresh path and costs one list comparison when the forecast did not
+    change. Found alerts are queued and a worker sends them to the subscribers of the city
+    through the rate limited sender shared with the scheduled forecasts.
+
+    Attributes:
+        sender (RateLimitedSender): The sender used for the fan-out.
+        sent (int): Number of delivered alert messages.
+    '''
+
+    def __init__(self, sender: Optional[RateLimitedSender] = None, max_queue: int = ALERT_QUEUE_SIZE) -> None:
+        self.sender = sender or RateLimitedSender()
+        self.sent = 0
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, city_id: int, name: str, old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> List[Alert]:
+        '''
+        Compare a refreshed forecast with the stored one and queue the new hazards.
+        '''
+        try:
+            alerts = detect_alerts(old, new)
+        except Exception as e:
+            logger.error(f'Error detecting alerts for {name}: {e}')
+            return []
+        if alerts:
+            try:
+                self._queue.put_nowait((city_id, name, alerts))
+                logger.info(f'{len(alerts)} alerts are queued for {name}')
+            except asyncio.QueueFull:
+                logger.warning(f'Alert queue is full, alerts for {name} are dropped')
+        return alerts
+
+    async def start(self, bots: List[Bot], repo: Repository) -> None:
+        '''
+        Start the delivery worker, registered on dp.startup.
+        '''
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(list(bots), repo))
+            logger.info('Alert dispatcher is started')
+
+    async def stop(self) -> None:
+        '''
+        Stop the delivery worker, registered on dp.shutdown.
+        '''
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info('Alert dispatcher is stopped')
+
+    async def _run(self, bots: List[Bot], repo: Repository) -> None:
+        while True:
+            city_id, name, alerts = await self._queue.get()
+            try:
+                await self.deliver(bots, repo, city_id, name, alerts)
+            except Exception as e:
+                logger.error(f'Error delivering alerts for {name}: {e}')
+
+    async def deliver(self, bots: List[Bot], repo: Repository, city_id: int, name: str, alerts: List[Alert]) -> int:
+        '''
+        Send the alerts to every subscriber of the city through the bot of the subscription.
+
+        Subscriptions made before the multi-bot mode (bot_id 0) are served by the first bot.
+
+        Returns:
+            int: Number of delivered messages.
+        '''
+        subscribers = await asyncio.to_thread(repo.get_subscribers, city_id)
+        by_id = {bot.id: bot for bot in bots}
+        by_id[0] = bots[0]
+        texts: Dict[str, str] = {}
+        delivered = 0
+        for subscriber in subscribers:
+            bot = by_id.get(subscriber.bot_id)
+            if bot is None:
+                continue
+            locale = subscriber.language or DEFAULT_LOCALE
+            if locale not in texts:
+                texts[locale] = format_alerts(name, alerts, locale)
+            if await self.sender.send(bot, subscriber.chat_id, texts[locale]):
+                delivered += 1
+        self.sent += delivered
+        logger.info(f'Alerts for {name} are delivered to {delivered} of {len(subscribers)} chats')
+        return delivered
+
+
+# Shares the per-bot send budget with the scheduled forecasts
+alert_dispatcher = AlertDispatcher(sender=forecast_scheduler.sender)
+# Cities followed only through subscriptions are refreshed by the scheduler
+forecast_scheduler.add_listener(alert_dispatcher.submit)
@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, List, Optional, Tuple
+
+
+class TTLCache:
+    '''
+    A bounded in-process cache with per-entry expiration.
+
+    Entries are kept in least recently used order, the oldest entry is evicted when the cache is full.
+    Expired entries are dropped when they are read.
+
+    Attributes:
+        maxsize (int): Maximum number of entries.
+        ttl (float): Time to live of an entry in seconds.
+        hits (int): Number of successful lookups.
+        misses (int): Number of failed lookups.
+    '''
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiration time, value)
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        '''
+        Return the value for the key if it is cached and not expired, otherwise the default.
+        '''
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        '''
+        Store the value for the key, optionally with its own time to live.
+        '''
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        '''
+        Remove the key and return its value.
+        '''
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def dump(self) -> List[Tuple[Hashable, float, Any]]:
+        '''
+        Return the live entries as (key, wall clock expiration time, value), oldest first.
+        '''
+        now, wall = time.monotonic(), time.time()
+        return [(key, wall + expires - now, value) for key, (expires, value) in self._data.items() if expires >= now]
+
+    def load(self, items: Iterable[Tuple[Hashable, float, Any]]) -> int:
+        '''
+        Restore entries produced by dump(), entries that expired in the meantime are skipped.
+
+        Returns:
+            int: Number of restored entries.
+        '''
+        wall = time.time()
+        loaded = 0
+        for key, expires_at, value in items:
+            if expires_at > wall:
+                self.set(key, value, ttl=expires_at - wall)
+                loaded += 1
+        return loaded
+
+    def remove_if(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        '''
+        Remove the entries for which predicate(key, value) is true.
+
+        Returns:
+            int: Number of removed entries.
+        '''
+        keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,95 @@
+'''
+Rendering of forecast charts in a process pool
+'''
+import os
+import io
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from core.utils.weather import DayWeather
+
+logger = logging.getLogger(__name__)
+
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', '1'))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def render_chart(name: str, times: List[str], temperature: List[float], precipitation: List[float]) -> bytes:
+    '''
+    Render temperature and precipitation over the forecast horizon as a PNG image.
+
+    Runs in a worker process, matplotlib is imported there and never in the bot process.
+
+    Args:
+        name (str): Name of the location, used as the title.
+        times (List[str]): Time labels in ISO format.
+        temperature (List[float]): Temperature values.
+        precipitation (List[float]): Precipitation values.
+
+    Returns:
+        bytes: The PNG image.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    positions = range(len(times))
+    hourly = len(times) > 24
+    # An hourly series over several days is labelled at midnights only
+    ticks = [i for i, t in enumerate(times) if i == 0 or t.endswith('T00:00')] if hourly else list(positions)
+
+    fig, ax_temp = plt.subplots(figsize=(10, 5), dpi=100)
+    ax_prec = ax_temp.twinx()
+    ax_prec.bar(positions, precipitation, width=1.0 if hourly else 0.8, color='tab:blue', alpha=0.3, label='Precipitation, mm')
+    ax_temp.plot(positions, temperature, color='tab:red', marker=None if hourly else 'o', label='Temperature, °C')
+    ax_temp.set_xticks(ticks)
+    ax_temp.set_xticklabels([times[i].replace('T', '\n') for i in ticks], fontsize=7)
+    ax_temp.set_ylabel('Temperature, °C')
+    ax_prec.set_ylabel('Precipitation, mm')
+    ax_prec.set_ylim(bottom=0)
+    ax_temp.set_zorder(ax_prec.get_zorder() + 1)
+    ax_temp.patch.set_visible(False)
+    ax_temp.grid(alpha=0.3)
+    ax_temp.set_title(f'Weather forecast for {name}')
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    '''
+    Return the process pool for rendering, created on first use.
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CHART_WORKERS)
+    return _executor
+
+
+async def shutdown_executor() -> None:
+    '''
+    Stop the rendering processes, registered on dp.shutdown.
+    '''
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def render_forecast_chart(name: str, weather_forecast: List[DayWeather]) -> bytes:
+    '''
+    Render the chart for a forecast in the process pool without blocking the event loop.
+    '''
+    times, temperature, precipitation = [], [], []
+    for day in weather_forecast:
+        times.extend(day.time)
+        temperature.extend(day.temperature_2m)
+        precipitation.extend(day.precipitation)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), render_chart, name, times, temperature, precipitation)
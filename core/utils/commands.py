@@ -8,6 +8,9 @@ COMMANDS = [
     {'command': 'start', 'description': 'The start of work'},
     {'command': 'help', 'description': 'I need a help'},
     {'command': 'weather', 'description': 'Geat a weather'},
+    {'command': 'chart', 'description': 'Get a forecast chart'},
+    {'command': 'subscribe', 'description': 'Get a daily forecast'},
+    {'command': 'unsubscribe', 'description': 'Stop daily forecasts'},
 ]
 
 async def set_commands(bot: Bot):
@@ -0,0 +1,100 @@
+'''
+FSM storage backends: Redis for horizontally scaled workers, memory for a single process
+'''
+import os
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+# Merge a JSON object into the stored data and refresh the TTL in one atomic round trip
+UPDATE_DATA_SCRIPT = '''
+local current = redis.call('HGET', KEYS[1], 'data')
+local data = {}
+if current then data = cjson.decode(current) end
+for k, v in pairs(cjson.decode(ARGV[1])) do data[k] = v end
+local encoded = cjson.encode(data)
+redis.call('HSET', KEYS[1], 'data', encoded)
+if tonumber(ARGV[2]) > 0 then redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+return encoded
+'''
+
+
+class PipelinedRedisStorage(BaseStorage):
+    '''
+    FSM storage that keeps the state and the data of a key in one Redis hash.
+
+    Every write and its TTL refresh are sent as a single pipeline, update_data is an atomic
+    server-side merge.
+    Conversations expire after `ttl` seconds of inactivity.
+
+    Attributes:
+        redis: The redis.asyncio client.
+        prefix (str): Prefix of the keys.
+        ttl (int): Time to live of a conversation in seconds, 0 keeps it forever.
+    '''
+
+    def __init__(self, redis, prefix: str = 'fsm', ttl: int = 86400) -> None:
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+        self._update_data = redis.register_script(UPDATE_DATA_SCRIPT)
+
+    def _key(self, key: StorageKey) -> str:
+        parts = [self.prefix, str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(str(key.thread_id))
+        parts.append(key.destiny)
+        return ':'.join(parts)
+
+    async def _write(self, key: StorageKey, field: str, value: Optional[str]) -> None:
+        rkey = self._key(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if value is None:
+                pipe.hdel(rkey, field)
+            else:
+                pipe.hset(rkey, field, value)
+            if self.ttl:
+                pipe.expire(rkey, self.ttl)
+            await pipe.execute()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, 'state', state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        value = await self.redis.hget(self._key(key), 'state')
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._write(key, 'data', json.dumps(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self.redis.hget(self._key(key), 'data')
+        return json.loads(value) if value else {}
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        encoded = await self._update_data(keys=[self._key(key)], args=[json.dumps(data), self.ttl])
+        return json.loads(encoded)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+def create_fsm_storage() -> BaseStorage:
+    '''
+    Create the FSM storage selected by FSM_STORAGE (memory or redis).
+    '''
+    backend = os.getenv('FSM_STORAGE', 'memory')
+    if backend == 'redis':
+        from redis.asyncio import Redis
+        redis = Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+        storage: BaseStorage = PipelinedRedisStorage(redis, ttl=int(os.getenv('FSM_TTL', '86400')))
+    else:
+        storage = MemoryStorage()
+    logger.info(f'FSM storage backend: {backend}')
+    return storage
@@ -1,7 +1,10 @@
 import requests as req
 import logging
+import time
 from typing import Optional, Dict, Any
 
+from core.utils.stats import bot_stats
+
 logger = logging.getLogger(__name__)
 
 class Geocode:
@@ -43,8 +46,15 @@ class Geocode:
         '''
         Helper method to make the API request and handle the response.
         '''
-        response = req.get(url=self.url, params=params)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = req.get(url=self.url, params=params)
+        finally:
+            ok = response is not None and response.status_code == req.codes.ok
+            bot_stats.record_upstream('geocode', time.perf_counter() - started, ok)
         if response.status_code != req.codes.ok:
+            logger.error('The request to %s failed with status code %s', self.url, response.status_code)
             return None
         return response.json()
         
@@ -0,0 +1,130 @@
+'''
+Localized weather descriptions
+
+The catalogs are compiled once, when the module is imported at startup, into tables indexed
+by the WMO weather code, so a description is resolved with a single list lookup at render time.
+'''
+from typing import Dict, List, Optional
+
+DEFAULT_LOCALE = 'en'
+
+# WMO weather interpretation codes, see https://open-meteo.com/en/docs
+WEATHER_CODES: Dict[str, Dict[int, str]] = {
+    'en': {
+        0: 'clear sky \U00002600 ',
+        1: 'mainly clear \U00002600 ',
+        2: 'partly cloudy \U000026C5 ',
+        3: 'overcast \U00002601 ',
+        45: 'fog \U0001F32B ',
+        48: 'depositing rime fog ',
+        51: 'drizzle: light intensity \U0001F327 ',
+        53: 'drizzle: moderate intensity \U0001F327 ',
+        55: 'drizzle: dense intensity \U0001F327 ',
+        56: 'freezing drizzle: light intensity \U0001F326 ',
+        57: 'freezing drizzle: dense intensity \U0001F326 ',
+        61: 'rain: light intensity \U0001F326 ',
+        63: 'rain: moderate intensity \U0001F326 ',
+        65: 'rain: heavy intensity \U0001F326 ',
+        66: 'freezing rain: light intensity ',
+        67: 'freezing rain: heavy intensity ',
+        71: 'snow fall: slight intensity \U00002744 ',
+        73: 'snow fall: moderate intensity \U0001F328 ',
+        75: 'snow fall: heavy intensity \U0001F328 ',
+        77: 'snow grains ',
+        80: 'rain showers: slight \U0001F327 ',
+        81: 'rain showers: moderate \U0001F327 ',
+        82: 'rain showers: violent \U0001F327 ',
+        85: 'snow showers slight ',
+        86: 'snow showers heavy ',
+        95: 'thunderstorm: slight or moderate \U000026C8 ',
+        96: 'thunderstorm with slight hail \U000026A1 ',
+        99: 'thunderstorm with heavy hail \U000026A1 ',
+    },
+    'ru': {
+        0: 'ясно \U00002600 ',
+        1: 'преимущественно ясно \U00002600 ',
+        2: 'переменная облачность \U000026C5 ',
+        3: 'пасмурно \U00002601 ',
+        45: 'туман \U0001F32B ',
+        48: 'отложения инейного тумана ',
+        51: 'морось: легкая \U0001F327 ',
+        53: 'морось: умеренная \U0001F327 ',
+        55: 'морось: плотная \U0001F327 ',
+        56: 'моросящий дождь: легкий \U0001F326 ',
+        57: 'моросящий дождь: плотный \U0001F326 ',
+        61: 'дождь: слабый \U0001F326 ',
+        63: 'дождь: умеренный \U0001F326 ',
+        65: 'дождь: сильный \U0001F326 ',
+        66: 'ледяной дождь: легкая интенсивность ',
+        67: 'ледяной дождь: сильная интенсивность ',
+        71: 'снегопад: слабый \U00002744 ',
+        73: 'снегопад: умеренный \U0001F328 ',
+        75: 'снегопад: сильный \U0001F328 ',
+        77: 'снежные зерна ',
+        80: 'ливни: слабые \U0001F327 ',
+        81: 'ливни: умеренные \U0001F327 ',
+        82: 'ливни: сильные \U0001F327 ',
+        85: 'снежные ливни слабые ',
+        86: 'снежные ливни сильные ',
+        95: 'гроза: слабая или умеренная \U000026C8 ',
+        96: 'гроза с небольшим градом \U000026A1 ',
+        99: 'гроза с сильным градом \U000026A1 ',
+    },
+}
+
+# Labels of the rendered forecast and alerts
+LABELS: Dict[str, Dict[str, str]] = {
+    'en': {'title': 'Weather forecast for {name}:', 'time': 'Time', 'temperature': 'Temperature', 'forecast': 'Forecast',
+           'mean': 'mean', 'precipitation': 'Precipitation', 'gusts': 'Gusts',
+           'alert': 'Weather alert for {name}:', 'thunderstorm': 'Thunderstorm', 'heavy_snow': 'Heavy snow',
+           'strong_gusts': 'Strong wind gusts', 'heavy_precipitation': 'Heavy precipitation', 'up_to': 'up to'},
+    'ru': {'title': 'Прогноз погоды для {name}:', 'time': 'Время', 'temperature': 'Температура', 'forecast': 'Прогноз',
+           'mean': 'средняя', 'precipitation': 'Осадки', 'gusts': 'Порывы',
+           'alert': 'Предупреждение о погоде для {name}:', 'thunderstorm': 'Гроза', 'heavy_snow': 'Сильный снег',
+           'strong_gusts': 'Сильные порывы ветра', 'heavy_precipitation': 'Сильные осадки', 'up_to': 'до'},
+}
+
+UNKNOWN_CODE = '? '
+
+
+def compile_catalogs() -> Dict[str, List[str]]:
+    '''
+    Compile the catalogs into lists indexed by the weather code.
+
+    Codes missing in a locale fall back to the default locale.
+    '''
+    size = max(max(catalog) for catalog in WEATHER_CODES.values()) + 1
+    default = WEATHER_CODES[DEFAULT_LOCALE]
+    return {
+        locale: [catalog.get(code, default.get(code, UNKNOWN_CODE)) for code in range(size)]
+        for locale, catalog in WEATHER_CODES.items()
+    }
+
+
+_TABLES: Dict[str, List[str]] = compile_catalogs()
+
+
+def resolve_locale(language_code: Optional[str]) -> str:
+    '''
+    Map a Telegram language_code (e.g. "ru" or "pt-br") to a supported locale.
+    '''
+    if language_code:
+        language = language_code.split('-')[0].lower()
+        if language in _TABLES:
+            return language
+    return DEFAULT_LOCALE
+
+
+def describe(code: int, locale: str = DEFAULT_LOCALE) -> str:
+    '''
+    Return the description of a weather code in the locale.
+    '''
+    table = _TABLES.get(locale) or _TABLES[DEFAULT_LOCALE]
+    return table[code] if 0 <= code < len(table) else UNKNOWN_CODE
+
+
+def label(key: str, locale: str = DEFAULT_LOCALE) -> str:
+    '''
+    Return a label of the rendered forecast in the locale.
+    '''
+    return (LABELS.get(locale) or LABELS[DEFAULT_LOCALE])[key]
@@ -0,0 +1,256 @@
+'''
+Periodic database maintenance: forecast retention and city compaction
+'''
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.engine import Engine
+
+from core.repository import Repository, SQLAlchemyRepository
+from core.utils.util import utcnow
+from core.model.models import SessionLocal, User, City, Forecast, Subscription, REWRITE_CITY_OWNERS, init_db
+
+logger = logging.getLogger(__name__)
+
+# Forecasts older than this are deleted, the bot refreshes them after 12 hours anyway
+FORECAST_HARD_TTL = timedelta(hours=int(os.getenv('FORECAST_HARD_TTL_HOURS', '168')))
+MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '500'))
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL_HOURS', '24')) * 3600
+# Number of free SQLite pages returned to the file system per run
+VACUUM_PAGES = int(os.getenv('MAINTENANCE_VACUUM_PAGES', '2000'))
+
+
+@dataclass
+class MaintenanceReport:
+    '''
+    What a maintenance run reclaimed.
+    '''
+    forecasts_deleted: int = 0
+    cities_merged: int = 0
+    orphan_cities_deleted: int = 0
+    pages_freed: int = 0
+    size_before: int = 0
+    size_after: int = 0
+    duration: float = 0.0
+    # Removed city ID -> the ID of the city it was merged into, None for deleted orphans
+    removed_cities: Dict[int, Optional[int]] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return (
+            f'forecasts deleted: {self.forecasts_deleted}, cities merged: {self.cities_merged}, '
+            f'orphan cities deleted: {self.orphan_cities_deleted}, pages freed: {self.pages_freed}, '
+            f'size: {self.size_before} -> {self.size_after} bytes, took {self.duration:.2f} s'
+        )
+
+
+def purge_old_forecasts(cutoff: datetime, batch_size: int = MAINTENANCE_BATCH_SIZE) -> int:
+    '''
+    Delete forecasts older than the cutoff in bounded batches, one short transaction per batch.
+    '''
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = [row.id for row in db.query(Forecast.id).filter(Forecast.timestamp < cutoff).limit(batch_size)]
+            if not ids:
+                return deleted
+            db.query(Forecast).filter(Forecast.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            deleted += len(ids)
+        finally:
+            db.close()
+        if len(ids) < batch_size:
+            return deleted
+
+
+def delete_orphan_cities() -> List[int]:
+    '''
+    Delete cities whose user no longer exists (SQLite does not enforce the cascade).
+
+    Cities still owned by a Telegram ID (the database was not migrated yet) are given
+    their users.id owner first, so they are not taken for orphans.
+    '''
+    db = SessionLocal()
+    try:
+        db.execute(REWRITE_CITY_OWNERS)
+        users = db.query(User.id)
+        orphans = db.query(City.id).filter(~City.user_id.in_(users))
+        ids = [row.id for row in orphans]
+        for i in range(0, len(ids), MAINTENANCE_BATCH_SIZE):
+            batch = ids[i:i + MAINTENANCE_BATCH_SIZE]
+            db.query(Forecast).filter(Forecast.city_id.in_(batch)).delete(synchronize_session=False)
+            db.query(Subscription).filter(Subscription.city_id.in_(batch)).delete(synchronize_session=False)
+            db.query(City).filter(City.id.in_(batch)).delete(synchronize_session=False)
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+
+def merge_duplicate_cities() -> Dict[int, int]:
+    '''
+    Merge cities with the same name into the row with the lowest ID.
+
+    The first row is the one returned by name lookups, subscriptions are moved to it
+    and the newest forecast is kept for it. A user keeps one subscription per bot.
+
+    Returns:
+        Dict[int, int]: The ID of every merged city mapped to the ID it was merged into.
+    '''
+    db = SessionLocal()
+    merged: Dict[int, int] = {}
+    try:
+        names = db.query(City.name, func.min(City.id)).group_by(City.name).having(func.count(City.id) > 1).all()
+        for name, keep_id in names:
+            duplicate_ids = [row.id for row in db.query(City.id).filter(City.name == name, City.id != keep_id)]
+            city_ids = duplicate_ids + [keep_id]
+
+            newest = db.query(Forecast).filter(Forecast.city_id.in_(city_ids)) \
+                .order_by(Forecast.timestamp.desc()).first()
+            db.query(Forecast).filter(
+                Forecast.city_id.in_(city_ids), Forecast.id != (newest.id if newest else None)
+            ).delete(synchronize_session=False)
+            if newest is not None:
+                newest.city_id = keep_id
+
+            # One subscription per (bot, user) survives: the one of the kept city, else the oldest
+            owners: Dict[Tuple[int, int], List[Tuple[int, int]]] = defaultdict(list)
+            for sub_id, bot_id, user_id, city_id in db.query(
+                Subscription.id, Subscription.bot_id, Subscription.user_id, Subscription.city_id
+            ).filter(Subscription.city_id.in_(city_ids)):
+                owners[(bot_id or 0, user_id)].append((city_id != keep_id, sub_id))
+            extra_ids = [sub_id for subs in owners.values() for _, sub_id in sorted(subs)[1:]]
+            if extra_ids:
+                db.query(Subscription).filter(Subscription.id.in_(extra_ids)).delete(synchronize_session=False)
+            db.query(Subscription).filter(Subscription.city_id.in_(duplicate_ids)) \
+                .update({Subscription.city_id: keep_id}, synchronize_session=False)
+
+            db.query(City).filter(City.id.in_(duplicate_ids)).delete(synchronize_session=False)
+            db.commit()
+            merged.update(dict.fromkeys(duplicate_ids, keep_id))
+        return merged
+    finally:
+        db.close()
+
+
+def _sqlite_size(engine: Engine) -> int:
+    with engine.connect() as connection:
+        page_count = connection.execute(text('PRAGMA page_count')).scalar()
+        page_size = connection.execute(text('PRAGMA page_size')).scalar()
+    return page_count * page_size
+
+
+def vacuum_and_analyze(engine: Engine, report: MaintenanceReport) -> None:
+    '''
+    Return free pages to the file system and refresh the planner statistics.
+    '''
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            free_before = connection.execute(text('PRAGMA freelist_count')).scalar()
+            # Works when the database was created (or migrated) with auto_vacuum=INCREMENTAL.
+            # Every step of the statement frees one page, executescript runs it to completion
+            connection.connection.executescript(f'PRAGMA incremental_vacuum({VACUUM_PAGES});')
+            free_after = connection.execute(text('PRAGMA freelist_count')).scalar()
+            connection.execute(text('PRAGMA optimize'))
+            report.pages_freed = max(0, free_before - free_after)
+    elif engine.dialect.name == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            for table in (Forecast.__tablename__, City.__tablename__, Subscription.__tablename__):
+                connection.execute(text(f'VACUUM (ANALYZE) {table}'))
+
+
+def run_maintenance(engine: Engine, now: Optional[datetime] = None) -> MaintenanceReport:
+    '''
+    Run all maintenance steps and report what was reclaimed.
+    '''
+    started = time.perf_counter()
+    report = MaintenanceReport()
+    is_sqlite = engine.dialect.name == 'sqlite'
+    if is_sqlite:
+        report.size_before = _sqlite_size(engine)
+
+    report.forecasts_deleted = purge_old_forecasts((now or utcnow()) - FORECAST_HARD_TTL)
+    orphan_ids = delete_orphan_cities()
+    merged = merge_duplicate_cities()
+    report.orphan_cities_deleted = len(orphan_ids)
+    report.cities_merged = len(merged)
+    report.removed_cities = {**dict.fromkeys(orphan_ids), **merged}
+    vacuum_and_analyze(engine, report)
+
+    if is_sqlite:
+        report.size_after = _sqlite_size(engine)
+    report.duration = time.perf_counter() - started
+    logger.info(f'Database maintenance: {report}')
+    return report
+
+
+class MaintenanceJob:
+    '''
+    Run the database maintenance periodically in a worker thread.
+
+    Listeners are called on the event loop with the removed city IDs after a run that
+    deleted or merged cities, so in-process caches can drop or remap them.
+
+    Attributes:
+        interval (float): Seconds between runs.
+    '''
+
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL) -> None:
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[Dict[int, Optional[int]]], None]] = []
+
+    def add_listener(self, listener: Callable[[Dict[int, Optional[int]]], None]) -> None:
+        '''
+        Call the listener with {removed city ID: merged into ID or None} after every run that removed cities.
+        '''
+        self._listeners.append(listener)
+
+    async def start(self, repo: Repository) -> None:
+        '''
+        Start the maintenance loop, registered on dp.startup.
+
+        The maintenance works on the SQL tables, with a repository without a database it is not started.
+        '''
+        if not isinstance(repo, SQLAlchemyRepository):
+            logger.info(f'Database maintenance is disabled for the {type(repo).__name__} backend')
+            return
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        '''
+        Stop the maintenance loop, registered on dp.shutdown.
+        '''
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                report = await asyncio.to_thread(run_maintenance, init_db())
+            except Exception as e:
+                logger.error(f'Error running database maintenance: {e}')
+                continue
+            if report.removed_cities:
+                for listener in self._listeners:
+                    try:
+                        listener(report.removed_cities)
+                    except Exception as e:
+                        logger.error(f'Error updating caches after database maintenance: {e}')
+
+
+maintenance_job = MaintenanceJob()
@@ -0,0 +1,66 @@
+from bisect import bisect_left
+from typing import Any, Callable, Iterable, List, Tuple
+
+
+class PrefixIndex:
+    '''
+    A sorted index of names for prefix (autocomplete) search.
+
+    Names are compared case-insensitively, the first value added for a name is kept.
+    A lookup is a binary search followed by a scan over the matching entries only.
+    '''
+
+    def __init__(self, items: Iterable[Tuple[str, Any]] = ()) -> None:
+        # (casefolded name, name, value), sorted by the casefolded name
+        self._entries: List[Tuple[str, str, Any]] = []
+        self._keys: List[str] = []
+        self.update(items)
+
+    def update(self, items: Iterable[Tuple[str, Any]]) -> None:
+        '''
+        Add many names at once with a single sort.
+        '''
+        seen = set(self._keys)
+        for name, value in items:
+            key = name.strip().casefold()
+            if key and key not in seen:
+                seen.add(key)
+                self._entries.append((key, name.strip(), value))
+        self._entries.sort(key=lambda entry: entry[0])
+        self._keys = [entry[0] for entry in self._entries]
+
+    def add(self, name: str, value: Any) -> None:
+        '''
+        Add a name to the index unless it is already there.
+        '''
+        key = name.strip().casefold()
+        i = bisect_left(self._keys, key)
+        if not key or (i < len(self._keys) and self._keys[i] == key):
+            return
+        self._keys.insert(i, key)
+        self._entries.insert(i, (key, name.strip(), value))
+
+    def remap(self, function: Callable[[Any], Any]) -> None:
+        '''
+        Replace every value with function(value), entries mapped to None are removed.
+        '''
+        entries = [(key, name, function(value)) for key, name, value in self._entries]
+        self._entries = [entry for entry in entries if entry[2] is not None]
+        self._keys = [entry[0] for entry in self._entries]
+
+    def search(self, prefix: str, limit: int = 10) -> List[Tuple[str, Any]]:
+        '''
+        Return up to `limit` (name, value) pairs whose name starts with the prefix.
+        '''
+        key = prefix.strip().casefold()
+        if not key:
+            return []
+        out = []
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and len(out) < limit and self._keys[i].startswith(key):
+            out.append((self._entries[i][1], self._entries[i][2]))
+            i += 1
+        return out
+
+    def __len__(self) -> int:
+        return len(self._keys)
@@ -0,0 +1,165 @@
+'''
+Per-update stage timings and on-demand cProfile sampling of the dispatch path
+'''
+import io
+import time
+import pstats
+import cProfile
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+# Reports are cut to fit into one Telegram message
+MAX_REPORT_LENGTH = 4000
+
+# Seconds spent in every stage of the update being handled, set by the profiling middleware
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('update_timings', default=None)
+
+
+def start_timings() -> Dict[str, float]:
+    '''
+    Start collecting the stage timings of the current update.
+    '''
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    '''
+    Add the time spent in the block to the stage of the current update.
+
+    Outside of an update (e.g. in the scheduler) the block is not measured.
+    '''
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def timed_stage(name: str) -> Callable:
+    '''
+    Decorator measuring a coroutine function as a stage of the current update.
+    '''
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def format_timings(timings: Dict[str, float], total: float) -> str:
+    '''
+    Format the stage timings in milliseconds, the time not covered by a stage is reported as "other".
+    '''
+    parts = [f'{name} {seconds * 1000:.1f} ms' for name, seconds in sorted(timings.items(), key=lambda x: -x[1])]
+    parts.append(f'other {max(0.0, total - sum(timings.values())) * 1000:.1f} ms')
+    return ', '.join(parts)
+
+
+class UpdateProfiler:
+    '''
+    Profile a sample of the next updates with cProfile.
+
+    The profiler is enabled while at least one sampled update is being handled. Updates handled
+    concurrently in the same event loop are included in the profile as well.
+
+    Attributes:
+        remaining (int): Number of updates still to be profiled.
+        every (int): Only every n-th update is profiled.
+        chat_id (Optional[int]): Chat receiving the report.
+    '''
+
+    def __init__(self) -> None:
+        self.remaining = 0
+        self.every = 1
+        self.chat_id: Optional[int] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._seen = 0
+        self._active = 0
+
+    @property
+    def armed(self) -> bool:
+        return self._profile is not None
+
+    def arm(self, updates: int, every: int, chat_id: int) -> None:
+        '''
+        Profile `updates` of the next updates, sampling one in `every`.
+        '''
+        self.disarm()
+        self.remaining = updates
+        self.every = max(1, every)
+        self.chat_id = chat_id
+        self._profile = cProfile.Profile()
+        self._seen = 0
+
+    def disarm(self) -> Optional[str]:
+        '''
+        Stop profiling and return the report, if anything was profiled.
+        '''
+        profile, self._profile = self._profile, None
+        self.remaining = 0
+        if profile is None:
+            return None
+        if self._active:
+            profile.disable()
+            self._active = 0
+        return self.report(profile)
+
+    def sample(self) -> Optional[cProfile.Profile]:
+        '''
+        Start profiling the update being dispatched if it is sampled.
+
+        Returns:
+            Optional[cProfile.Profile]: The running profile to pass to finish(), or None.
+        '''
+        profile = self._profile
+        if profile is None or self.remaining <= 0:
+            return None
+        self._seen += 1
+        if (self._seen - 1) % self.every:
+            return None
+        self.remaining -= 1
+        if self._active == 0:
+            profile.enable()
+        self._active += 1
+        return profile
+
+    def finish(self, profile: cProfile.Profile) -> Optional[str]:
+        '''
+        Finish a sampled update, returns the report once the last sampled update is done.
+        '''
+        if profile is not self._profile:
+            # The profiler was stopped or re-armed while the update was handled
+            return None
+        self._active -= 1
+        if self._active == 0:
+            profile.disable()
+            if self.remaining <= 0:
+                return self.disarm()
+        return None
+
+    @staticmethod
+    def report(profile: cProfile.Profile, limit: int = 20) -> str:
+        '''
+        Return the top entries of the profile by cumulative time.
+        '''
+        stream = io.StringIO()
+        try:
+            stats = pstats.Stats(profile, stream=stream)
+        except TypeError:
+            return 'No calls were profiled.'
+        stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue().strip()
+
+
+profiler = UpdateProfiler()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    '''
+    Raised when a request can not be served within the upstream quota:
+    the daily cap is spent, the waiting queue is full or the request deadline has passed.
+    '''
+
+
+class TokenBucket:
+    '''
+    A token bucket limiter.
+
+    Attributes:
+        rate (float): Number of tokens added per second.
+        capacity (float): Maximum number of tokens the bucket can hold (burst size).
+    '''
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        '''
+        Return the number of seconds to wait before a token is available.
+        '''
+        self._refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def consume(self) -> bool:
+        '''
+        Take one token from the bucket if available.
+        '''
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        '''
+        Wait until a token is available and take it.
+        '''
+        while not self.consume():
+            await asyncio.sleep(self.delay())
+
+
+class QuotaGovernor:
+    '''
+    An async governor that paces calls to a rate limited upstream API.
+
+    Requests are put into a bounded waiting queue and executed one by one by a single worker,
+    which takes a token from the bucket before every call and keeps a daily call counter.
+    Identical requests that are already waiting share one upstream call.
+
+    Attributes:
+        name (str): Name of the upstream, used in log messages.
+        bucket (TokenBucket): Limiter for the per second rate.
+        daily_limit (int): Maximum number of upstream calls per UTC day, 0 disables the cap.
+        max_queue (int): Maximum number of requests waiting for a token.
+        max_wait (float): Maximum number of seconds a request may wait in the queue.
+    '''
+
+    def __init__(self, name: str, rate: float = 1.0, burst: int = 1, daily_limit: int = 0,
+                 max_queue: int = 100, max_wait: float = 10.0) -> None:
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.daily_limit = daily_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.day = datetime.now(timezone.utc).date()
+        self.calls_today = 0
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _check_daily_limit(self) -> bool:
+        today = datetime.now(timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.calls_today = 0
+        return not self.daily_limit or self.calls_today < self.daily_limit
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        return self._queue
+
+    async def _run(self) -> None:
+        '''
+        Worker loop: pops queued requests and executes them at the allowed pace.
+        '''
+        queue = self._queue
+        while True:
+            key, func, deadline = await queue.get()
+            future = self._pending.get(key)
+            try:
+                if future is None or future.done():
+                    continue
+                if time.monotonic() + self.bucket.delay() > deadline:
+                    future.set_exception(QuotaExceeded(f'{self.name}: request deadline exceeded'))
+                    continue
+                if not self._check_daily_limit():
+                    future.set_exception(QuotaExceeded(f'{self.name}: daily limit of {self.daily_limit} calls reached'))
+                    continue
+                await self.bucket.acquire()
+                self.calls_today += 1
+                try:
+                    result = await asyncio.to_thread(func)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            finally:
+                if future is not None and future.done():
+                    self._pending.pop(key, None)
+                queue.task_done()
+
+    async def submit(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        '''
+        Execute a blocking upstream call within the quota.
+
+        Args:
+            key (Hashable): Deduplication key, identical queued requests share one call.
+            func (Callable[[], Any]): Blocking function that performs the upstream call.
+
+        Returns:
+            Any: The result of the function.
+
+        Raises:
+            QuotaExceeded: If the request can not be served within the quota.
+        '''
+        future = self._pending.get(key)
+        if future is None:
+            if not self._check_daily_limit():
+                raise QuotaExceeded(f'{self.name}: daily limit of {self.daily_limit} calls reached')
+            queue = self._ensure_worker()
+            if queue.full():
+                raise QuotaExceeded(f'{self.name}: waiting queue is full')
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            queue.put_nowait((key, func, time.monotonic() + self.max_wait))
+        else:
+            logger.info(f'{self.name}: joined an identical queued request for {key}')
+        return await asyncio.shield(future)
+
+    def stats(self) -> Tuple[int, int]:
+        '''
+        Return the number of calls made today and the number of requests waiting in the queue.
+        '''
+        return self.calls_today, len(self._pending)
@@ -0,0 +1,238 @@
+'''
+Delivery engine for scheduled forecast subscriptions
+'''
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from core.repository import Repository, SubscriptionRecord
+from core.utils.quota import TokenBucket
+from core.utils.weather import WeatherForecast, format_forecast
+from core.utils.locales import DEFAULT_LOCALE
+from core.utils.util import is_forecast_old
+
+logger = logging.getLogger(__name__)
+
+# Size of a location grid cell in degrees, subscribers in one cell share a forecast
+GRID_STEP = float(os.getenv('SUBSCRIPTION_GRID_STEP', '0.1'))
+# Open-Meteo accepts many coordinates per request, keep the URL reasonably short
+BATCH_SIZE = int(os.getenv('SUBSCRIPTION_BATCH_SIZE', '50'))
+# Deliveries missed by less than this number of minutes (e.g. after a restart) are still sent
+CATCH_UP_MINUTES = 30
+
+
+def grid_cell(lat: float, lon: float, step: float = GRID_STEP) -> Tuple[int, int]:
+    '''
+    Return the grid cell that contains the given coordinates.
+    '''
+    return int(lat // step), int(lon // step)
+
+
+def to_delivery_minute(delivery_time: str, utc_offset: int) -> int:
+    '''
+    Convert a local "HH:MM" time to minutes since UTC midnight.
+
+    Args:
+        delivery_time (str): Local delivery time.
+        utc_offset (int): Offset of the local time zone in seconds.
+
+    Returns:
+        int: Minutes since UTC midnight.
+    '''
+    hours, minutes = map(int, delivery_time.split(':'))
+    return (hours * 60 + minutes - utc_offset // 60) % 1440
+
+
+class RateLimitedSender:
+    '''
+    Send messages within the Telegram broadcast limit (about 30 messages per second per bot).
+    '''
+
+    def __init__(self, rate: float = 25.0) -> None:
+        self.rate = rate
+        self._buckets: Dict[int, TokenBucket] = {}
+
+    async def send(self, bot: Bot, chat_id: int, text: str) -> bool:
+        '''
+        Send a message, waiting for a token and honouring flood wait replies.
+
+        Returns:
+            bool: True if the message was delivered.
+        '''
+        bucket = self._buckets.get(bot.id)
+        if bucket is None:
+            bucket = self._buckets[bot.id] = TokenBucket(self.rate, self.rate)
+        for _ in range(3):
+            await bucket.acquire()
+            try:
+                await bot.send_message(chat_id, text)
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning(f'Flood wait for {e.retry_after} seconds while sending to {chat_id}')
+                await asyncio.sleep(e.retry_after)
+            except TelegramForbiddenError:
+                logger.info(f'Chat {chat_id} blocked the bot, the forecast is not delivered')
+                return False
+            except Exception as e:
+                logger.error(f'Error sending forecast to {chat_id}: {e}')
+                return False
+        return False
+
+
+class ForecastScheduler:
+    '''
+    Deliver daily forecasts to subscribers.
+
+    Once a minute the scheduler selects due subscriptions and groups them by location grid cell.
+    Cities with a fresh stored forecast reuse it, for the other cities one forecast is fetched
+    per cell (many cells per upstream request) and stored for every city of the cell.
+    The text is rendered once per city and locale and fanned out through a rate limited sender.
+
+    Attributes:
+        interval (float): Seconds between scheduler ticks.
+        sender (RateLimitedSender): The sender used for the fan-out.
+    '''
+
+    def __init__(self, interval: float = 60.0, sender: Optional[RateLimitedSender] = None) -> None:
+        self.interval = interval
+        self.sender = sender or RateLimitedSender()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[int, str, Optional[Dict[str, Any]], Dict[str, Any]], Any]] = []
+
+    def add_listener(self, listener: Callable[[int, str, Optional[Dict[str, Any]], Dict[str, Any]], Any]) -> None:
+        '''
+        Call the listener with (city ID, name, stored forecast data, fetched forecast data) for every
+        city whose stored forecast is replaced by a scheduled fetch.
+        '''
+        self._listeners.append(listener)
+
+    async def start(self, bots: List[Bot], repo: Repository) -> None:
+        '''
+        Start the scheduler loop, registered on dp.startup.
+        '''
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(list(bots), repo))
+            logger.info('Forecast scheduler is started')
+
+    async def stop(self) -> None:
+        '''
+        Stop the scheduler loop, registered on dp.shutdown.
+        '''
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info('Forecast scheduler is stopped')
+
+    async def _run(self, bots: List[Bot], repo: Repository) -> None:
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                await self.tick(bots, repo, now)
+            except Exception as e:
+                logger.error(f'Error delivering scheduled forecasts: {e}')
+            await asyncio.sleep(max(1.0, self.interval - datetime.now(timezone.utc).second))
+
+    async def _fetch_cells(self, cells: List[Tuple[float, float]]) -> List[Optional[dict]]:
+        '''
+        Fetch forecasts for the cell coordinates in batches, one upstream call per batch.
+        '''
+        results: List[Optional[dict]] = []
+        for i in range(0, len(cells), BATCH_SIZE):
+            batch = cells[i:i + BATCH_SIZE]
+            try:
+                data = await asyncio.to_thread(WeatherForecast.quest_many, batch)
+            except Exception as e:
+                logger.error(f'Error fetching scheduled forecasts: {e}')
+                data = None
+            results.extend(data if data is not None and len(data) == len(batch) else [None] * len(batch))
+        return results
+
+    async def tick(self, bots: List[Bot], repo: Repository, now: datetime) -> None:
+        '''
+        Deliver all subscriptions due at the given time, each through the bot it was made with.
+
+        Subscriptions made before the multi-bot mode (bot_id 0) are delivered by the first bot.
+        '''
+        minute = now.hour * 60 + now.minute
+        # A delivery of the current window is sent after its start, the one of the previous day long before
+        window_start = now.replace(second=0, microsecond=0) - timedelta(minutes=CATCH_UP_MINUTES)
+        due = await asyncio.to_thread(repo.get_due_subscriptions, minute, CATCH_UP_MINUTES, window_start)
+        if not due:
+            return
+        by_id = {bot.id: bot for bot in bots}
+        by_id[0] = bots[0]
+
+        groups: Dict[Tuple[int, int], List[SubscriptionRecord]] = defaultdict(list)
+        for sub in due:
+            groups[grid_cell(sub.latitude, sub.longitude)].append(sub)
+        stored = await asyncio.to_thread(repo.get_forecasts, {sub.city_id for sub in due if sub.city_id is not None})
+        city_data: Dict[int, Dict[str, Any]] = {
+            city_id: record.forecast_data for city_id, record in stored.items() if not is_forecast_old(record.timestamp)
+        }
+        # One fetch per cell that has a city without a fresh forecast
+        cells = [cell for cell, subscribers in groups.items()
+                 if any(sub.city_id not in city_data for sub in subscribers)]
+        coordinates = [(groups[cell][0].latitude, groups[cell][0].longitude) for cell in cells]
+        logger.info(f'Delivering {len(due)} forecasts, {len(cells)} of {len(groups)} locations are fetched')
+
+        cell_data = dict(zip(cells, await self._fetch_cells(coordinates)))
+        fetched: Dict[int, Dict[str, Any]] = {}
+        names: Dict[int, str] = {}
+        for cell, data in cell_data.items():
+            if data is None:
+                continue
+            for sub in groups[cell]:
+                if sub.city_id is not None and sub.city_id not in city_data:
+                    fetched[sub.city_id] = data
+                    names[sub.city_id] = sub.city_name or f'{sub.latitude}, {sub.longitude}'
+        if fetched:
+            await asyncio.to_thread(repo.upsert_forecasts, fetched)
+            city_data.update(fetched)
+            # The same path as a refresh by /weather, e.g. severe-weather alerts for the subscribers
+            for city_id, data in fetched.items():
+                if city_id not in stored:
+                    continue
+                for listener in self._listeners:
+                    try:
+                        listener(city_id, names[city_id], stored[city_id].forecast_data, data)
+                    except Exception as e:
+                        logger.error(f'Error handling the scheduled forecast of {names[city_id]}: {e}')
+
+        delivered: List[SubscriptionRecord] = []
+        # Cities sharing a cell get their own title, render once per city and locale
+        texts: Dict[Tuple[Tuple[int, int], Optional[int], str], str] = {}
+        for cell, subscribers in groups.items():
+            for sub in subscribers:
+                data = city_data.get(sub.city_id) or cell_data.get(cell)
+                if data is None:
+                    continue
+                locale = sub.language or DEFAULT_LOCALE
+                key = (cell, sub.city_id, locale)
+                if key not in texts:
+                    name = sub.city_name or f'{sub.latitude}, {sub.longitude}'
+                    weather_forecast = WeatherForecast(sub.longitude, sub.latitude).create_forecast(data)
+                    texts[key] = format_forecast(name, weather_forecast, locale)
+                bot = by_id.get(sub.bot_id or 0)
+                if bot is None:
+                    logger.warning(f'Bot {sub.bot_id} of subscription {sub.id} is not running, skipped')
+                    continue
+                if await self.sender.send(bot, sub.chat_id, texts[key]):
+                    sub.utc_offset = int(data.get('utc_offset_seconds', 0))
+                    sub.delivery_minute = to_delivery_minute(sub.delivery_time, sub.utc_offset)
+                    delivered.append(sub)
+
+        if delivered:
+            await asyncio.to_thread(repo.mark_subscriptions_sent, delivered, now)
+
+
+forecast_scheduler = ForecastScheduler()
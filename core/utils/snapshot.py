@@ -0,0 +1,150 @@
+'''
+On-disk snapshots of the hot in-process caches for a warm restart
+
+File layout: header (magic, format version, CRC32 and length of the payload) followed by
+the zlib-compressed JSON payload {cache name: [[key, wall clock expiration time, value], ...]}.
+'''
+import os
+import mmap
+import json
+import zlib
+import time
+import struct
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from core.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', 'files/cache.snapshot')
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', '300'))
+
+MAGIC = b'WBSN'
+VERSION = 1
+HEADER = struct.Struct('<4sHII')
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+def _decode(value: Dict[str, Any]) -> Any:
+    if len(value) == 1 and '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    return value
+
+
+class CacheSnapshot:
+    '''
+    Save named caches to a file and restore them on startup, expiration times are kept.
+
+    Attributes:
+        path (str): Path of the snapshot file.
+        caches (Dict[str, TTLCache]): The caches by name.
+        interval (float): Seconds between periodic snapshots, 0 saves only on shutdown.
+    '''
+
+    def __init__(self, caches: Dict[str, TTLCache], path: str = SNAPSHOT_PATH,
+                 interval: float = SNAPSHOT_INTERVAL) -> None:
+        self.caches = caches
+        self.path = path
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def encode(self) -> bytes:
+        '''
+        Serialize the live entries of all caches into the snapshot format.
+        '''
+        payload = {name: cache.dump() for name, cache in self.caches.items()}
+        data = zlib.compress(json.dumps(payload, default=_encode, separators=(',', ':')).encode())
+        return HEADER.pack(MAGIC, VERSION, zlib.crc32(data), len(data)) + data
+
+    def write(self, data: bytes) -> None:
+        '''
+        Atomically replace the snapshot file.
+        '''
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> int:
+        '''
+        Restore the caches from the snapshot file, a missing, stale or corrupt file is ignored.
+
+        Returns:
+            int: Number of restored entries.
+        '''
+        try:
+            with open(self.path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if len(mm) < HEADER.size:
+                    raise ValueError('truncated header')
+                magic, version, crc, length = HEADER.unpack_from(mm)
+                if magic != MAGIC or version != VERSION:
+                    logger.warning(f'Cache snapshot {self.path} has an unsupported format, ignored')
+                    return 0
+                data = mm[HEADER.size:HEADER.size + length]
+            if len(data) != length or zlib.crc32(data) != crc:
+                raise ValueError('checksum mismatch')
+            payload = json.loads(zlib.decompress(data), object_hook=_decode)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.warning(f'Cache snapshot {self.path} is not loaded: {e}')
+            return 0
+
+        loaded = 0
+        for name, items in payload.items():
+            cache = self.caches.get(name)
+            if cache is not None:
+                loaded += cache.load(items)
+        return loaded
+
+    async def save(self) -> None:
+        '''
+        Take a snapshot of the caches, the file is written in a worker thread.
+        '''
+        started = time.perf_counter()
+        try:
+            data = self.encode()
+            await asyncio.to_thread(self.write, data)
+        except Exception as e:
+            logger.error(f'Error saving the cache snapshot: {e}')
+            return
+        logger.info(f'Cache snapshot saved, {len(data)} bytes in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+    async def start(self) -> None:
+        '''
+        Restore the caches and start the periodic snapshots, registered on dp.startup.
+        '''
+        started = time.perf_counter()
+        loaded = self.load()
+        logger.info(f'Cache snapshot restored {loaded} entries in {(time.perf_counter() - started) * 1000:.1f} ms')
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        '''
+        Stop the periodic snapshots and save the final one, registered on dp.shutdown.
+        '''
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
@@ -0,0 +1,11 @@
+'''
+FSM states of the multi-step dialogs
+'''
+from aiogram.fsm.state import State, StatesGroup
+
+
+class AuthStates(StatesGroup):
+    '''
+    Login dialog: /login issues a token, /signup confirms it.
+    '''
+    waiting_signup = State()
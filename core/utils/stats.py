@@ -0,0 +1,235 @@
+'''
+Operational statistics maintained incrementally in memory
+
+Every structure has a bounded size and constant update cost, so /stats never touches the database:
+a space-saving sketch for the top requested cities, a log-bucket quantile sketch for latencies
+and HyperLogLog counters for the number of distinct active users.
+'''
+import math
+import time
+import hashlib
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from core.utils.cache import TTLCache
+
+
+class SpaceSaving:
+    '''
+    Space-saving sketch of the most frequent items.
+
+    At most `capacity` items are tracked. A new item replaces the least frequent one and inherits
+    its count, which is kept as the maximum overestimation of the new item's count.
+
+    Attributes:
+        capacity (int): Maximum number of tracked items.
+    '''
+
+    def __init__(self, capacity: int = 100) -> None:
+        self.capacity = capacity
+        # item -> [count, error]
+        self._counts: Dict[Hashable, List[int]] = {}
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        entry = self._counts.get(item)
+        if entry is not None:
+            entry[0] += count
+            return
+        if len(self._counts) < self.capacity:
+            self._counts[item] = [count, 0]
+            return
+        evicted = min(self._counts, key=lambda key: self._counts[key][0])
+        minimum = self._counts.pop(evicted)[0]
+        self._counts[item] = [minimum + count, minimum]
+
+    def top(self, n: int = 10) -> List[Tuple[Hashable, int, int]]:
+        '''
+        Return the n most frequent items as (item, estimated count, maximum overestimation).
+        '''
+        items = sorted(self._counts.items(), key=lambda x: -x[1][0])[:n]
+        return [(item, count, error) for item, (count, error) in items]
+
+
+class QuantileSketch:
+    '''
+    Streaming quantile estimator with a bounded relative error.
+
+    Values are counted in logarithmic buckets, so any quantile is estimated within `accuracy`
+    of the true value and memory grows only with the logarithm of the value range.
+
+    Attributes:
+        accuracy (float): Relative accuracy of the estimates.
+        count (int): Number of observed values.
+    '''
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: Counter = Counter()
+        self._zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value <= 0:
+            self._zeros += 1
+        else:
+            self._buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        '''
+        Return the estimated q-quantile (0 <= q <= 1), or None if nothing was observed.
+        '''
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+
+class HyperLogLog:
+    '''
+    Approximate number of distinct items with 2**precision one-byte registers.
+
+    The standard error is about 1.04 / sqrt(2**precision), 1.6% with the default precision.
+    '''
+
+    def __init__(self, precision: int = 12) -> None:
+        self.precision = precision
+        self._m = 1 << precision
+        self._registers = bytearray(self._m)
+        self._alpha = 0.7213 / (1 + 1.079 / self._m)
+
+    def add(self, item: Hashable) -> None:
+        value = int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), 'big')
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def __len__(self) -> int:
+        estimate = self._alpha * self._m * self._m / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * self._m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = self._m * math.log(self._m / zeros)
+        return int(round(estimate))
+
+
+class BotStats:
+    '''
+    Counters behind the /stats command.
+
+    The upstream clients record from worker threads, so every update is done under a lock.
+
+    Attributes:
+        started_at (float): Wall clock time the counters were created.
+        updates (int): Number of handled updates.
+        commands (SpaceSaving): Handled update kinds, e.g. "message /weather".
+        cities (SpaceSaving): Cities whose forecast was requested.
+        latency (Dict[str, QuantileSketch]): Latencies in seconds, "update" or "upstream:<name>".
+        upstream_calls (Counter): Upstream requests by API name.
+        upstream_errors (Counter): Failed upstream requests by API name.
+    '''
+
+    def __init__(self, top_k: int = 100) -> None:
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.updates = 0
+        self.commands = SpaceSaving(50)
+        self.cities = SpaceSaving(top_k)
+        self.latency: Dict[str, QuantileSketch] = {}
+        self.upstream_calls: Counter = Counter()
+        self.upstream_errors: Counter = Counter()
+        self._all_users = HyperLogLog()
+        # The distinct users of the current and the previous UTC day
+        self._daily_users: Dict[str, HyperLogLog] = {}
+        self._caches: Dict[str, TTLCache] = {}
+
+    def track_cache(self, name: str, cache: TTLCache) -> None:
+        '''
+        Report the hit rate of the cache.
+        '''
+        self._caches[name] = cache
+
+    def _observe(self, name: str, seconds: float) -> None:
+        sketch = self.latency.get(name)
+        if sketch is None:
+            sketch = self.latency[name] = QuantileSketch()
+        sketch.add(seconds)
+
+    def _day(self, day: str) -> HyperLogLog:
+        users = self._daily_users.get(day)
+        if users is None:
+            users = self._daily_users[day] = HyperLogLog()
+            for old in sorted(self._daily_users)[:-2]:
+                del self._daily_users[old]
+        return users
+
+    def record_update(self, user_id: Optional[int], kind: str, seconds: float) -> None:
+        with self._lock:
+            self.updates += 1
+            self.commands.add(kind)
+            self._observe('update', seconds)
+            if user_id is not None:
+                self._all_users.add(user_id)
+                self._day(datetime.now(timezone.utc).strftime('%Y-%m-%d')).add(user_id)
+
+    def record_city(self, name: str) -> None:
+        with self._lock:
+            self.cities.add(name.strip().casefold())
+
+    def record_upstream(self, name: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.upstream_calls[name] += 1
+            if not ok:
+                self.upstream_errors[name] += 1
+            self._observe(f'upstream:{name}', seconds)
+
+    def report(self, top: int = 10) -> str:
+        '''
+        Render the statistics as the text of a message.
+        '''
+        with self._lock:
+            today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+            uptime = int(time.time() - self.started_at)
+            lines = [
+                f'Uptime: {uptime // 3600} h {uptime % 3600 // 60} min, updates: {self.updates}',
+                f'Active users: today ~{len(self._day(today))}, since start ~{len(self._all_users)}',
+                '',
+                'Top cities:',
+            ]
+            lines += [f'  {name}: {count}' + (f' (±{error})' if error else '')
+                      for name, count, error in self.cities.top(top)] or ['  -']
+
+            lines += ['', 'Updates:']
+            lines += [f'  {kind}: {count}' for kind, count, _ in self.commands.top(top)] or ['  -']
+
+            lines += ['', 'Cache hit rates:']
+            for name, cache in self._caches.items():
+                lookups = cache.hits + cache.misses
+                rate = f'{cache.hits / lookups:.1%}' if lookups else '-'
+                lines.append(f'  {name}: {rate} of {lookups}, {len(cache)} entries')
+
+            lines += ['', 'Upstream calls:']
+            lines += [f'  {name}: {count}, errors {self.upstream_errors[name]}'
+                      for name, count in self.upstream_calls.most_common()] or ['  -']
+
+            lines += ['', 'Latency p50 / p90 / p99, ms:']
+            for name, sketch in sorted(self.latency.items()):
+                p50, p90, p99 = (sketch.quantile(q) * 1000 for q in (0.5, 0.9, 0.99))
+                lines.append(f'  {name}: {p50:.0f} / {p90:.0f} / {p99:.0f} ({sketch.count})')
+        return '\n'.join(lines)
+
+
+bot_stats = BotStats()
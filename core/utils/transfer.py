@@ -0,0 +1,297 @@
+'''
+Streaming bulk export and import of tables as newline-delimited JSON or CSV
+
+Rows flow through generators in chunks, so memory does not depend on the table size. Every chunk
+is one transaction followed by a checkpoint, an interrupted run continues from the last checkpoint.
+'''
+import os
+import csv
+import sys
+import json
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional
+
+from sqlalchemy import JSON, Boolean, DateTime, Float, Integer, Table, bindparam, select, text
+from sqlalchemy.engine import Engine
+
+from core.model.models import User, City, Forecast
+from core.repository.orm import UPSERT_DIALECTS
+
+logger = logging.getLogger(__name__)
+
+# Tables in the order they have to be imported
+TABLES: Dict[str, Table] = {
+    User.__tablename__: User.__table__,
+    City.__tablename__: City.__table__,
+    Forecast.__tablename__: Forecast.__table__,
+}
+CHUNK_SIZE = 5000
+FORMATS = ('ndjson', 'csv')
+
+
+def detect_format(path: str) -> str:
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Checkpoint:
+    '''
+    Progress of a transfer stored next to the data file as <path>.checkpoint.
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.path = f'{path}.checkpoint'
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, **state: Any) -> None:
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+### Export
+def iter_rows(engine: Engine, table: Table, after_id: int = 0, chunk_size: int = CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    '''
+    Yield the rows ordered by ID in chunks, every chunk is a separate keyset query.
+    '''
+    while True:
+        with engine.connect() as connection:
+            query = select(table).where(table.c.id > after_id).order_by(table.c.id).limit(chunk_size)
+            rows = [dict(row._mapping) for row in connection.execute(query)]
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]['id']
+
+
+def _to_text(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_table(engine: Engine, name: str, path: str, fmt: Optional[str] = None,
+                 chunk_size: int = CHUNK_SIZE, resume: bool = False) -> int:
+    '''
+    Write the table to a file ("-" for stdout).
+
+    Returns:
+        int: Number of exported rows.
+    '''
+    table = TABLES[name]
+    fmt = fmt or detect_format(path)
+    checkpoint = Checkpoint(path) if path != '-' else None
+    state = checkpoint.load() if checkpoint and resume else {}
+    after_id, exported = state.get('last_id', 0), state.get('rows', 0)
+    columns = [column.name for column in table.columns]
+
+    file: IO[str] = sys.stdout if path == '-' else open(path, 'a' if state else 'w', newline='')
+    try:
+        writer = csv.DictWriter(file, fieldnames=columns) if fmt == 'csv' else None
+        if writer is not None and not state:
+            writer.writeheader()
+        for rows in iter_rows(engine, table, after_id, chunk_size):
+            for row in rows:
+                if writer is not None:
+                    writer.writerow({
+                        key: json.dumps(value) if isinstance(value, (dict, list)) else _to_text(value)
+                        for key, value in row.items()
+                    })
+                else:
+                    file.write(json.dumps(row, default=_to_text, ensure_ascii=False) + '\n')
+            file.flush()
+            exported += len(rows)
+            if checkpoint:
+                checkpoint.save(table=name, last_id=rows[-1]['id'], rows=exported)
+            logger.info(f'{name}: {exported} rows exported')
+    finally:
+        if file is not sys.stdout:
+            file.close()
+    if checkpoint:
+        checkpoint.clear()
+    return exported
+
+
+### Import
+def _converters(table: Table, fmt: str) -> Dict[str, Callable[[Any], Any]]:
+    '''
+    Parse the values of every column, CSV values are all strings, NDJSON only lacks datetimes.
+    '''
+    converters: Dict[str, Callable[[Any], Any]] = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            converters[column.name] = datetime.fromisoformat
+        elif fmt != 'csv':
+            continue
+        elif isinstance(column.type, JSON):
+            converters[column.name] = json.loads
+        elif isinstance(column.type, Boolean):
+            converters[column.name] = lambda value: value.lower() in ('1', 'true', 't', 'yes')
+        elif isinstance(column.type, Integer):
+            converters[column.name] = int
+        elif isinstance(column.type, Float):
+            converters[column.name] = float
+    return converters
+
+
+def read_records(file: IO[str], fmt: str) -> Iterator[Dict[str, Any]]:
+    if fmt == 'csv':
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def convert_defaults(table: Table, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Parse the constant column values given as text (e.g. by manage.py import --set) like CSV values.
+    '''
+    converters = _converters(table, 'csv')
+    converted = {}
+    for key, value in defaults.items():
+        if key not in table.columns:
+            raise ValueError(f'Unknown column {key} of {table.name}')
+        if isinstance(value, str):
+            value = converters[key](value) if value and key in converters else value or None
+        converted[key] = value
+    return converted
+
+
+def convert_records(records: Iterable[Dict[str, Any]], table: Table, fmt: str,
+                    defaults: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    '''
+    Keep the known columns, parse their values and fill the constant columns.
+    '''
+    converters = _converters(table, fmt)
+    columns = set(table.columns.keys())
+    defaults = convert_defaults(table, defaults or {})
+    for record in records:
+        row = dict(defaults)
+        for key, value in record.items():
+            if key not in columns:
+                continue
+            if value is None or (value == '' and fmt == 'csv'):
+                row[key] = None
+            else:
+                converter = converters.get(key)
+                row[key] = converter(value) if converter else value
+        yield row
+
+
+class BulkInsert:
+    '''
+    INSERT statement compiled once per column set and run with the driver's executemany.
+
+    SQLAlchemy builds parameters per row with every column's processing, here only the columns
+    that need a bind processor (e.g. JSON, DateTime on SQLite) are processed.
+    '''
+
+    def __init__(self, engine: Engine, table: Table) -> None:
+        self.engine = engine
+        self.table = table
+        dialect = engine.dialect.name
+        if dialect in UPSERT_DIALECTS:
+            self.statement = UPSERT_DIALECTS[dialect](table).on_conflict_do_nothing()
+        else:
+            self.statement = table.insert()
+        self._compiled: Dict[tuple, tuple] = {}
+
+    def _compile(self, columns: tuple) -> tuple:
+        compiled = self.statement.values({name: bindparam(name) for name in columns}).compile(dialect=self.engine.dialect)
+        names = compiled.positiontup if compiled.positional else list(columns)
+        processors = [self.table.c[name].type.bind_processor(self.engine.dialect) for name in names]
+        # The compiler adds the columns with Python side defaults, their values are filled here
+        defaults = {name: self.table.c[name].default for name in names if name not in columns}
+        return str(compiled), names, processors, defaults, compiled.positional
+
+    def execute(self, connection, rows: List[Dict[str, Any]]) -> None:
+        '''
+        Insert the rows, one executemany per column set, so missing keys get the column defaults.
+        '''
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for columns, group in groups.items():
+            self._execute(connection, columns, group)
+
+    def _execute(self, connection, columns: tuple, rows: List[Dict[str, Any]]) -> None:
+        if columns not in self._compiled:
+            self._compiled[columns] = self._compile(columns)
+        sql, names, processors, defaults, positional = self._compiled[columns]
+        params = []
+        for row in rows:
+            if defaults:
+                row = dict(row)
+                for name, default in defaults.items():
+                    row[name] = default.arg(None) if default.is_callable else default.arg
+            values = [row.get(name) for name in names]
+            for i, processor in enumerate(processors):
+                if processor is not None and values[i] is not None:
+                    values[i] = processor(values[i])
+            params.append(tuple(values) if positional else dict(zip(names, values)))
+        connection.exec_driver_sql(sql, params)
+
+
+def import_table(engine: Engine, name: str, path: str, fmt: Optional[str] = None, chunk_size: int = CHUNK_SIZE,
+                 resume: bool = False, defaults: Optional[Dict[str, Any]] = None) -> int:
+    '''
+    Insert the rows of a file ("-" for stdin) into the table in chunks.
+
+    Rows that conflict with existing ones (e.g. the same ID) are skipped on SQLite and PostgreSQL,
+    so a chunk repeated after a crash is harmless.
+
+    Returns:
+        int: Number of processed rows.
+    '''
+    table = TABLES[name]
+    fmt = fmt or detect_format(path)
+    checkpoint = Checkpoint(path) if path != '-' else None
+    done = checkpoint.load().get('rows', 0) if checkpoint and resume else 0
+
+    insert = BulkInsert(engine, table)
+
+    file: IO[str] = sys.stdin if path == '-' else open(path, newline='')
+    try:
+        rows = convert_records(islice(read_records(file, fmt), done, None), table, fmt, defaults)
+        for chunk in chunked(rows, chunk_size):
+            with engine.begin() as connection:
+                insert.execute(connection, chunk)
+            done += len(chunk)
+            if checkpoint:
+                checkpoint.save(table=name, rows=done)
+            logger.info(f'{name}: {done} rows imported')
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+    if engine.dialect.name == 'postgresql':
+        # Explicit IDs do not advance the sequence
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE(MAX(id), 1)) FROM {name}")
+            )
+    if checkpoint:
+        checkpoint.clear()
+    return done
@@ -1,5 +1,5 @@
 import hashlib
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, Tuple
 
 def extract_lat_lon(data: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
@@ -12,6 +12,48 @@ def generate_token_hash(token: str) -> str:
     """Generate a SHA-256 hash of the given token."""
     return hashlib.sha256(token.encode()).hexdigest()
 
+# A stored forecast is refreshed from the API when it is older than this
+FORECAST_MAX_AGE = timedelta(hours=12)
+
+def utcnow() -> datetime:
+    """Return the current time as an aware UTC datetime, the format of stored timestamps."""
+    return datetime.now(timezone.utc)
+
+def as_utc(timestamp: datetime) -> datetime:
+    """Make a stored timestamp aware, SQLite returns naive datetimes which are in UTC."""
+    return timestamp.replace(tzinfo=timezone.utc) if timestamp.tzinfo is None else timestamp
+
+def is_delivery_due(delivery_minute: int, minute: int, window: int) -> bool:
+    """Check if a delivery minute is in [minute - window, minute], the window wraps past UTC midnight."""
+    return (minute - delivery_minute) % 1440 <= window
+
 def is_forecast_old(timestamp: datetime) -> bool:
     """Check if the given timestamp is older than 12 hours."""
-    return datetime.now() - timestamp > timedelta(hours=12)
\ No newline at end of file
+    return utcnow() - as_utc(timestamp) > FORECAST_MAX_AGE
+
+def forecast_ttl(timestamp: datetime) -> float:
+    """Return the number of seconds the forecast with the given timestamp stays fresh."""
+    return max(0.0, (FORECAST_MAX_AGE - (utcnow() - as_utc(timestamp))).total_seconds())
+
+def parse_forecast_options(args: str) -> Tuple[str, bool, Optional[Tuple[int, ...]]]:
+    """
+    Split /weather arguments into the city name and the view options.
+
+    "Moscow week" selects the daily aggregates for the whole horizon,
+    a trailing list of hours such as "Moscow 6,12,18" selects the sampled hours.
+
+    Returns:
+        Tuple[str, bool, Optional[Tuple[int, ...]]]: The city name, the weekly flag and the sample hours.
+    """
+    words = args.split()
+    week, hours = False, None
+    while len(words) > 1:
+        last = words[-1]
+        if last.lower() == 'week' and not week:
+            week = True
+        elif hours is None and all(part.isdigit() and int(part) < 24 for part in last.split(',')):
+            hours = tuple(sorted(set(int(part) for part in last.split(','))))
+        else:
+            break
+        words.pop()
+    return ' '.join(words), week, hours
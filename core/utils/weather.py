@@ -1,11 +1,24 @@
 import requests as req
 import logging
+import os
+import time
+import warnings
 #from datetime import datetime, timedelta
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Sequence
+
+import numpy as np
+
+from core.utils.locales import WEATHER_CODES, DEFAULT_LOCALE, describe, label
+from core.utils.stats import bot_stats
 
 logger = logging.getLogger(__name__)
 
+# Days fetched with every request, the weekly view is served from the same data
+FORECAST_DAYS = int(os.getenv('FORECAST_DAYS', '7'))
+# Hours of the day sampled by default: night, morning, day and evening
+DEFAULT_SAMPLE_HOURS: Tuple[int, ...] = (1, 7, 14, 19)
+
 @dataclass
 class DayWeather:
     '''
@@ -20,7 +33,7 @@ class DayWeather:
     rain:list[float]
     showers:list[float]
     snowfall:list[float]
-    weather_code:list[str]
+    weather_code:list[int] # WMO code, resolved to text by core.utils.locales.describe at render time
     pressure_msl:list[float]
     surface_pressure:list[float]
     cloud_cover:list[int]
@@ -59,36 +72,10 @@ class WeatherForecast:
     current: A string of comma-separated weather parameters to fetch from the API.
     '''
 
-    weather_code_dict_en = {
-        0 : 'clear sky \U00002600 ', # ясно 
-        1 : 'mainly clear \U00002600 ', # преимущественно ясно 
-        2 : 'partly cloudy \U000026C5 ', # переменная облачность 
-        3 : 'overcast \U00002601 ', # пасмурно
-        45 : 'fog \U00001F32B ', # туман
-        48 : 'depositing rime fog ', # отложения инейного тумана
-        51 : 'drizzle: light intensity \U00004204 ', # морось легкая
-        53 : 'drizzle: moderate intensity \U00004204 ', # морось умеренная
-        55 : 'drizzle: dense intensity \U00004204 ', # морось плотная
-        56 : 'freezing drizzle: light intensity \U0001F326 ', # моросящий дождь: легкий
-        57 : 'freezing drizzle: dense intensity \U0001F326 ', # моросящий дождь: плотный
-        61 : 'rain: light intensity \U0001F326 ', # дождь: слабый
-        63 : 'rain: moderate intensity \U0001F326 ', # дождь: умеренный
-        65 : 'rain: heavy intensity \U0001F326 ', # дождь: сильный
-        66 : 'freezing rain: light intensity ', # ледяной дождь: легкая интенсивность
-        67 : 'freezing rain: heavy intensity ', # ледяной дождь: сильная интенсивность
-        71 : 'snow fall: slight intensity \U00002744 ', # снегопад: слабый
-        73 : 'snow fall: moderate intensity \U0001F328 ', # снегопад: умеренный
-        75 : 'snow fall: heavy intensity \U0001F328 ', # снегопад: сильный
-        77 : 'snow grains ', # снежные зерна
-        80 : 'rain showers: slight \U0001F327 ', # ливни: слабые
-        81 : 'rain showers: moderate \U0001F327 ', # ливни: умеренные
-        82 : 'rain showers: violent \U0001F327 ', # ливни: сильные
-        85 : 'snow showers slight ', # снежные ливни слабые
-        86 : 'snow showers heavy ', # снежные ливни сильные
-        95 : 'thunderstorm: slight or moderate \U000026C8 ', # гроза: слабая или умеренная
-        96 : 'thunderstorm with slight hail \U000026A1 ', # гроза с небольшим градом
-        99 : 'thunderstorm with heavy hail \U000026A1 ' # гроза с сильным градом
-    }
+    weather_code_dict_en = WEATHER_CODES['en']
+    '''
+    weather_code_dict_en: English descriptions of the weather codes, see core.utils.locales for other locales.
+    '''
 
     def __init__(self, lon: float, lat: float) -> None:
         '''
@@ -112,7 +99,13 @@ class WeatherForecast:
         Returns:
             Optional[Dict[str, Any]]: The JSON response from the API or None if the request fails.
         '''
-        response = req.get(url=self.url, params=params)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = req.get(url=self.url, params=params)
+        finally:
+            ok = response is not None and response.status_code == req.codes.ok
+            bot_stats.record_upstream('open-meteo', time.perf_counter() - started, ok)
 
         logger.info(f'The request to {self.url} has been made with parameters: {params}')
         if response.status_code != req.codes.ok:
@@ -121,18 +114,20 @@ class WeatherForecast:
         logger.info('The request was successful')
         return response.json()
     
-    def _create_day_weather(self, forecast: Dict[str, Any], start_index: int) -> DayWeather:
+    def _create_day_weather(self, forecast: Dict[str, Any], start_index: int,
+                            hours: Sequence[int] = DEFAULT_SAMPLE_HOURS) -> DayWeather:
         '''
         Helper method to create a DayWeather object from the forecast data.
 
         Args:
             forecast (Dict[str, Any]): The forecast data from the API.
             start_index (int): The starting index for the hourly data.
+            hours (Sequence[int]): Hours of the day to sample.
 
         Returns:
             DayWeather: A DayWeather object containing the weather data for specific times of a day.
         '''
-        time_indices = [start_index + 1, start_index + 7, start_index + 14, start_index + 19]
+        time_indices = [start_index + hour for hour in hours]
         return DayWeather(
             time=[forecast['hourly']['time'][i] for i in time_indices],
             temperature_2m=[forecast['hourly']['temperature_2m'][i] for i in time_indices],
@@ -142,7 +137,7 @@ class WeatherForecast:
             rain=[forecast['hourly']['rain'][i] for i in time_indices],
             showers=[forecast['hourly']['showers'][i] for i in time_indices],
             snowfall=[forecast['hourly']['snowfall'][i] for i in time_indices],
-            weather_code=[self.weather_code_dict_en[forecast['hourly']['weather_code'][i]] for i in time_indices],
+            weather_code=[forecast['hourly']['weather_code'][i] for i in time_indices],
             pressure_msl=[forecast['hourly']['pressure_msl'][i] for i in time_indices],
             surface_pressure=[forecast['hourly']['surface_pressure'][i] for i in time_indices],
             cloud_cover=[forecast['hourly']['cloud_cover'][i] for i in time_indices],
@@ -151,7 +146,7 @@ class WeatherForecast:
             wind_gusts_10m=[forecast['hourly']['wind_gusts_10m'][i] for i in time_indices]
         )
     
-    def quest(self, forecast_day: int = 3) -> Optional[List[DayWeather]]:
+    def quest(self, forecast_day: int = FORECAST_DAYS) -> Optional[List[DayWeather]]:
         '''        
         Fetch weather forecast data from the Open-Meteo API.
 
@@ -167,7 +162,8 @@ class WeatherForecast:
         sends the request, and processes the response into a list of DayWeather objects.
 
         Args:
-            forecast_day (int, optional): The number of forecast days to retrieve. Defaults to 3.
+            forecast_day (int, optional): The number of forecast days to retrieve. Defaults to FORECAST_DAYS,
+                                          enough for the sampled and the weekly views.
 
         Returns:
             Optional[List[DayWeather]]: A list of DayWeather objects containing the weather forecast data,
@@ -183,19 +179,175 @@ class WeatherForecast:
             'forecast_days':str(forecast_day)
         }
         return self._make_request(method)
+
+    @classmethod
+    def quest_many(cls, locations: List[Tuple[float, float]], forecast_day: int = FORECAST_DAYS) -> Optional[List[Dict[str, Any]]]:
+        '''
+        Fetch weather forecast data for several locations with a single request.
+
+        The Open-Meteo API accepts comma-separated lists of coordinates and answers
+        with a list of forecasts in the same order.
+
+        Args:
+            locations (List[Tuple[float, float]]): A list of (latitude, longitude) pairs.
+            forecast_day (int, optional): The number of forecast days to retrieve. Defaults to FORECAST_DAYS.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: A list of forecast data, one per location,
+                                            or None if the request fails.
+        '''
+        if not locations:
+            return []
+        logger.info(f'Fetching weather data for {len(locations)} locations from Open-Meteo API...')
+        method = {
+            'latitude': ','.join(str(lat) for lat, _ in locations),
+            'longitude': ','.join(str(lon) for _, lon in locations),
+            'hourly': cls.current,
+            'timezone': 'auto',
+            'forecast_days': str(forecast_day)
+        }
+        data = cls(locations[0][1], locations[0][0])._make_request(method)
+        if data is None:
+            return None
+        # A single location is answered with a plain object
+        return data if isinstance(data, list) else [data]
     
-    def create_forecast(self, forecast: Dict[str, Any]) -> Optional[List[DayWeather]]:
+    def create_forecast(self, forecast: Dict[str, Any], hours: Optional[Sequence[int]] = None,
+                        days: int = 3) -> Optional[List[DayWeather]]:
         '''
         Create a list of DayWeather objects from the forecast data.
         
         Args:
             forecast (Dict[str, Any]): The forecast data from the API.
+            hours (Optional[Sequence[int]]): Hours of the day to sample, DEFAULT_SAMPLE_HOURS if None.
+            days (int): Number of days to create, limited by the available data.
         
         Returns:
             Optional[List[DayWeather]]: A list of DayWeather objects or None if the data is invalid.
         '''
-        first_day = self._create_day_weather(forecast, 0)
-        second_day = self._create_day_weather(forecast, 24)
-        third_day = self._create_day_weather(forecast, 48)
-        
-        return [first_day, second_day, third_day]
\ No newline at end of file
+        hours = DEFAULT_SAMPLE_HOURS if hours is None else hours
+        days = min(days, len(forecast['hourly']['time']) // 24)
+        return [self._create_day_weather(forecast, day * 24, hours) for day in range(days)]
+
+
+@dataclass
+class DayAggregate:
+    '''
+    A dataclass to hold the daily aggregates of the hourly forecast.
+    '''
+    date:str
+    temperature_min:float
+    temperature_max:float
+    temperature_mean:float
+    precipitation_sum:float
+    wind_gusts_max:float
+    weather_code:int # the most frequent code of the day, the more severe one on a tie, -1 without data
+
+
+def aggregate_days(forecast: Dict[str, Any], days: Optional[int] = None) -> List[DayAggregate]:
+    '''
+    Compute the daily aggregates of the hourly forecast in one vectorized pass.
+
+    The hourly arrays are reshaped to (days, 24) and reduced along the hour axis,
+    missing values (null in the API response) are ignored.
+
+    Args:
+        forecast (Dict[str, Any]): The forecast data from the API.
+        days (Optional[int]): Number of days to aggregate, all full days if None.
+
+    Returns:
+        List[DayAggregate]: One aggregate per day.
+    '''
+    hourly = forecast['hourly']
+    count = len(hourly['time']) // 24
+    if days is not None:
+        count = min(count, days)
+    if count == 0:
+        return []
+    size = count * 24
+
+    def series(name: str) -> np.ndarray:
+        return np.array(hourly[name][:size], dtype=float).reshape(count, 24)
+
+    temperature = series('temperature_2m')
+    precipitation = series('precipitation')
+    gusts = series('wind_gusts_10m')
+    raw_codes = series('weather_code')
+    known = ~np.isnan(raw_codes)
+    codes = np.where(known, raw_codes, 0).astype(int).clip(0, 99)
+
+    with warnings.catch_warnings():
+        # A day without any value gives nan, that is fine for the report
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        t_min = np.nanmin(temperature, axis=1)
+        t_max = np.nanmax(temperature, axis=1)
+        t_mean = np.nanmean(temperature, axis=1)
+        g_max = np.nanmax(gusts, axis=1)
+    p_sum = np.nansum(precipitation, axis=1)
+
+    # Code histogram of every day, the reversed argmax prefers the higher (more severe) code on a tie
+    # Missing hours have zero weight, so gaps do not count as clear sky
+    histogram = np.bincount((codes + np.arange(count)[:, None] * 100).ravel(), weights=known.ravel(),
+                            minlength=count * 100).reshape(count, 100)
+    dominant = np.where(known.any(axis=1), 99 - np.argmax(histogram[:, ::-1], axis=1), -1)
+
+    return [
+        DayAggregate(
+            date=str(hourly['time'][day * 24])[:10],
+            temperature_min=round(float(t_min[day]), 1),
+            temperature_max=round(float(t_max[day]), 1),
+            temperature_mean=round(float(t_mean[day]), 1),
+            precipitation_sum=round(float(p_sum[day]), 1),
+            wind_gusts_max=round(float(g_max[day]), 1),
+            weather_code=int(dominant[day]),
+        )
+        for day in range(count)
+    ]
+
+
+def render_forecast_lines(weather_forecast: List[DayWeather], locale: str = DEFAULT_LOCALE) -> List[str]:
+    '''
+    Render every sampled time of the forecast into a text line in the locale.
+
+    Args:
+        weather_forecast (List[DayWeather]): The forecast to render.
+        locale (str): Locale of the weather descriptions and labels.
+
+    Returns:
+        List[str]: One line per sampled time.
+    '''
+    time_label, temperature_label, forecast_label = label('time', locale), label('temperature', locale), label('forecast', locale)
+    return [
+        f'{time_label}: {time}, {temperature_label}: {day.temperature_2m[i]}, {forecast_label}: {describe(day.weather_code[i], locale)}'
+        for day in weather_forecast
+        for i, time in enumerate(day.time)
+    ]
+
+
+def format_forecast(name: str, weather_forecast: List[DayWeather], locale: str = DEFAULT_LOCALE) -> str:
+    '''
+    Render a list of DayWeather objects into a single message text.
+
+    Args:
+        name (str): Name of the location.
+        weather_forecast (List[DayWeather]): The forecast to render.
+        locale (str): Locale of the weather descriptions and labels.
+
+    Returns:
+        str: The message text.
+    '''
+    lines = [label('title', locale).format(name=name)]
+    lines.extend(render_forecast_lines(weather_forecast, locale))
+    return '\n'.join(lines)
+
+
+def render_aggregate_lines(aggregates: List[DayAggregate], locale: str = DEFAULT_LOCALE) -> List[str]:
+    '''
+    Render the daily aggregates into a text line per day in the locale.
+    '''
+    return [
+        f"{day.date}: {day.temperature_min}..{day.temperature_max} ({label('mean', locale)} {day.temperature_mean}), "
+        f"{label('precipitation', locale)}: {day.precipitation_sum}, {label('gusts', locale)}: {day.wind_gusts_max}, "
+        f"{describe(day.weather_code, locale)}"
+        for day in aggregates
+    ]
@@ -15,7 +15,7 @@ wait_for_db() {
 # Function for performing database migrations
 migrate_database() {
     echo "Running database migrations..."
-#    python manage.py migrate
+    python manage.py migrate
 }
 
 # Function for setting up the environment
@@ -0,0 +1,81 @@
+'''
+Management commands for the bot deployment
+
+    python manage.py migrate    - create missing tables and indexes
+    python manage.py maintain   - delete expired forecasts, merge duplicate cities, vacuum
+    python manage.py export cities cities.ndjson    - stream a table to NDJSON or CSV
+    python manage.py import cities cities.ndjson    - bulk load a table from NDJSON or CSV
+'''
+import sys
+import time
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from core.model.models import init_db, create_schema
+
+logger = logging.getLogger(__name__)
+
+def migrate(args: argparse.Namespace) -> None:
+    """Create missing tables and indexes in the database."""
+    started = time.perf_counter()
+    engine = init_db(args.db_url)
+    create_schema(engine)
+    print(f'Schema is up to date ({(time.perf_counter() - started) * 1000:.1f} ms)')
+
+def maintain(args: argparse.Namespace) -> None:
+    """Run the database maintenance once and print the report."""
+    from core.utils.maintenance import run_maintenance
+    report = run_maintenance(init_db(args.db_url))
+    print(f'Maintenance finished: {report}')
+
+def export(args: argparse.Namespace) -> None:
+    """Stream a table to a file."""
+    from core.utils.transfer import export_table
+    started = time.perf_counter()
+    count = export_table(init_db(args.db_url), args.table, args.path, args.format, args.chunk_size, args.resume)
+    print(f'{count} rows of {args.table} exported in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+
+def import_(args: argparse.Namespace) -> None:
+    """Bulk load a table from a file."""
+    from core.utils.transfer import import_table
+    defaults = dict(value.split('=', 1) for value in args.set)
+    started = time.perf_counter()
+    count = import_table(init_db(args.db_url), args.table, args.path, args.format, args.chunk_size,
+                         args.resume, defaults)
+    print(f'{count} rows of {args.table} imported in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+
+def add_transfer_arguments(parser: argparse.ArgumentParser) -> None:
+    from core.utils.transfer import TABLES, FORMATS, CHUNK_SIZE
+    parser.add_argument('table', choices=list(TABLES))
+    parser.add_argument('path', help='NDJSON or CSV file, "-" for stdin/stdout')
+    parser.add_argument('--format', choices=FORMATS, default=None, help='By the file extension by default')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per transaction')
+    parser.add_argument('--resume', action='store_true', help='Continue from <path>.checkpoint')
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Weather bot management commands')
+    parser.add_argument('--db-url', default=None, help='Database URL, DB_URL from the environment by default')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('migrate', help='Create missing tables and indexes').set_defaults(func=migrate)
+    subparsers.add_parser('maintain', help='Run the database maintenance once').set_defaults(func=maintain)
+    export_parser = subparsers.add_parser('export', help='Stream a table to NDJSON or CSV')
+    add_transfer_arguments(export_parser)
+    export_parser.set_defaults(func=export)
+    import_parser = subparsers.add_parser('import', help='Bulk load a table from NDJSON or CSV')
+    add_transfer_arguments(import_parser)
+    import_parser.add_argument('--set', action='append', default=[], metavar='COLUMN=VALUE',
+                               help='Value of a column missing in the file, e.g. user_id=1')
+    import_parser.set_defaults(func=import_)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    args.func(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import copy
+import unittest
+from datetime import datetime, timezone
+
+from core.utils.alerts import detect_alerts, format_alerts, forecast_changed
+
+HOURS = 72
+# 06:00 UTC is 09:00 local time at the forecast location
+NOW = datetime(2024, 6, 1, 6, tzinfo=timezone.utc)
+
+
+def make_forecast(first_day: int = 1) -> dict:
+    return {
+        'utc_offset_seconds': 3 * 3600,
+        'hourly': {
+            'time': [f'2024-06-{first_day + i // 24:02d}T{i % 24:02d}:00' for i in range(HOURS)],
+            'weather_code': [3] * HOURS,
+            'wind_gusts_10m': [20.0] * HOURS,
+            'precipitation': [0.0] * HOURS,
+        },
+    }
+
+
+class DetectAlertsTest(unittest.TestCase):
+    def test_unchanged_forecast(self):
+        old = make_forecast()
+        self.assertFalse(forecast_changed(old, copy.deepcopy(old)))
+        self.assertEqual(detect_alerts(old, copy.deepcopy(old), NOW), [])
+
+    def test_no_baseline(self):
+        self.assertEqual(detect_alerts(None, make_forecast(), NOW), [])
+
+    def test_new_hazards_are_grouped_into_runs(self):
+        old, new = make_forecast(), make_forecast()
+        new['hourly']['weather_code'][15:18] = [95, 96, 95]
+        new['hourly']['wind_gusts_10m'][30] = 85.5
+        alerts = detect_alerts(old, new, NOW)
+        self.assertEqual([(a.rule, a.start, a.end, a.peak) for a in alerts], [
+            ('thunderstorm', '2024-06-01T15:00', '2024-06-01T17:00', None),
+            ('strong_gusts', '2024-06-02T06:00', '2024-06-02T06:00', 85.5),
+        ])
+
+    def test_hazards_outside_the_window_are_ignored(self):
+        old, new = make_forecast(), make_forecast()
+        new['hourly']['precipitation'][5] = 20.0    # before now
+        new['hourly']['weather_code'][70] = 75      # beyond the horizon
+        self.assertEqual(detect_alerts(old, new, NOW), [])
+
+    def test_known_hazards_are_not_repeated(self):
+        old = make_forecast()
+        old['hourly']['weather_code'][15] = 95
+        new = copy.deepcopy(old)
+        new['hourly']['wind_gusts_10m'][40] = 10.0
+        self.assertEqual(detect_alerts(old, new, NOW), [])
+
+    def test_shifted_time_axis_is_aligned(self):
+        old = make_forecast()
+        old['hourly']['weather_code'][40] = 95
+        new = make_forecast(first_day=2)
+        new['hourly']['weather_code'][16] = 95
+        self.assertEqual(detect_alerts(old, new, NOW), [])
+
+    def test_missing_values_never_match(self):
+        old, new = make_forecast(), make_forecast()
+        new['hourly']['wind_gusts_10m'][20] = None
+        self.assertEqual(detect_alerts(old, new, NOW), [])
+
+    def test_format(self):
+        old, new = make_forecast(), make_forecast()
+        new['hourly']['weather_code'][15:17] = [95, 95]
+        text = format_alerts('Moscow', detect_alerts(old, new, NOW))
+        self.assertEqual(text, 'Weather alert for Moscow:\n⚠ Thunderstorm: 2024-06-01 15:00–16:00')
@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+
+from aiogram.types import Update
+
+from core.middlewares.concurrency import ConcurrencyGovernor
+
+
+class ConcurrencyGovernorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_limit_and_shedding(self):
+        governor = ConcurrencyGovernor(limit=2, command_limits={}, max_pending=1, max_wait=5)
+        release = asyncio.Event()
+        running = []
+
+        async def handler(event, data):
+            running.append(event.update_id)
+            await release.wait()
+            return event.update_id
+
+        tasks = [asyncio.create_task(governor(handler, Update(update_id=i), {})) for i in range(4)]
+        await asyncio.sleep(0.05)
+        # Two run, one waits and the last one is shed
+        self.assertEqual(running, [0, 1])
+        self.assertEqual((governor.in_flight, governor.pending, governor.shed), (2, 1, 1))
+
+        release.set()
+        results = await asyncio.gather(*tasks)
+        self.assertEqual(results, [0, 1, 2, None])
+        self.assertEqual((governor.in_flight, governor.pending), (0, 0))
+
+    async def test_wait_timeout_sheds(self):
+        governor = ConcurrencyGovernor(limit=1, command_limits={}, max_pending=10, max_wait=0.05)
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            await release.wait()
+
+        first = asyncio.create_task(governor(handler, Update(update_id=1), {}))
+        await asyncio.sleep(0)
+        await governor(handler, Update(update_id=2), {})
+        self.assertEqual(governor.shed, 1)
+        release.set()
+        await first
+
+    async def test_drain_waits_for_updates_in_flight(self):
+        governor = ConcurrencyGovernor(limit=1, command_limits={})
+
+        async def handler(event, data):
+            await asyncio.sleep(0.05)
+            return True
+
+        task = asyncio.create_task(governor(handler, Update(update_id=1), {}))
+        await asyncio.sleep(0)
+        await governor.drain(timeout=1)
+        self.assertTrue(task.done())
+        # New updates are rejected once draining started
+        self.assertIsNone(await governor(handler, Update(update_id=2), {}))
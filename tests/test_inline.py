@@ -0,0 +1,53 @@
+import unittest
+from types import SimpleNamespace
+
+from core.handlers import inline
+from core.handlers.basic import auth_cache, city_index, forecast_cache
+from core.repository import InMemoryRepository
+
+
+class FakeInlineQuery:
+    def __init__(self, query: str, user_id: int, bot_id: int) -> None:
+        self.query = query
+        self.from_user = SimpleNamespace(id=user_id, language_code='en')
+        self.bot = SimpleNamespace(id=bot_id)
+        self.answers = []
+
+    async def answer(self, results, **kwargs) -> None:
+        self.answers.append((results, kwargs))
+
+
+class InlineSearchTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.debounce, inline.INLINE_DEBOUNCE = inline.INLINE_DEBOUNCE, 0
+        city_index.add('Zelenograd', (901, 55.98, 37.18))
+        inline.inline_answers.clear()
+        auth_cache.clear()
+
+    def tearDown(self):
+        inline.INLINE_DEBOUNCE = self.debounce
+        forecast_cache.pop(901)
+        city_index.remap(lambda value: None if value[0] == 901 else value)
+
+    async def test_unauthorized_user_gets_no_results(self):
+        query = FakeInlineQuery('zeleno', 10, 1)
+        await inline.inline_city_search(query, InMemoryRepository())
+        results, kwargs = query.answers[0]
+        self.assertEqual(results, [])
+        self.assertEqual(kwargs['button'].start_parameter, 'login')
+
+    async def test_registered_user_gets_the_city(self):
+        repo = InMemoryRepository()
+        repo.create_user(10, 'hash', bot_id=1)
+        query = FakeInlineQuery('zeleno', 10, 1)
+        await inline.inline_city_search(query, repo)
+        self.assertEqual([result.title for result in query.answers[0][0]], ['Zelenograd'])
+
+    def test_forecast_shorter_than_a_day(self):
+        forecast_cache.set(901, {'forecast_data': {'hourly': {'time': ['2024-06-01T00:00'] * 5}}})
+        results = inline.build_results('zeleno')
+        self.assertEqual(results[0].input_message_content.message_text, '/weather Zelenograd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from core.repository import ForecastRecord, InMemoryRepository
+from core.utils.scheduler import ForecastScheduler, RateLimitedSender, to_delivery_minute
+from core.utils.weather import WeatherForecast
+
+
+class FakeBot:
+    def __init__(self, bot_id: int) -> None:
+        self.id = bot_id
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.sent.append((chat_id, text))
+
+
+class InMemoryRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = InMemoryRepository()
+
+    def test_users_are_separate_per_bot(self):
+        self.repo.create_user(10, 'hash', bot_id=1)
+        self.assertIsNotNone(self.repo.get_user(10, bot_id=1))
+        self.assertIsNone(self.repo.get_user(10, bot_id=2))
+        with self.assertRaises(ValueError):
+            self.repo.create_user(10, 'hash', bot_id=1)
+
+    def test_cities_are_owned_by_users_id(self):
+        user = self.repo.create_user(10, 'hash', bot_id=1)
+        city = self.repo.create_city(10, 'Moscow', 55.75, 37.62, bot_id=1)
+        self.assertEqual(city.user_id, user.id)
+        self.assertEqual(self.repo.get_city_by_name('Moscow'), city)
+        self.assertIsNone(self.repo.get_city_by_name('moscow'))
+
+    def test_forecast_upsert(self):
+        self.assertIsNone(self.repo.get_forecast(1))
+        self.repo.upsert_forecast(1, {'a': 1})
+        self.repo.upsert_forecast(1, {'a': 2})
+        self.assertEqual(self.repo.get_forecast(1).forecast_data, {'a': 2})
+
+    def test_subscriptions(self):
+        for bot_id, user_id, chat_id in ((1, 10, 100), (1, 11, 100), (2, 10, 200)):
+            self.repo.save_subscription(user_id, chat_id, 7, 0.0, 0.0, '07:00', 0, 420, None, 'en', bot_id)
+        subscribers = self.repo.get_subscribers(7)
+        self.assertEqual(sorted((s.bot_id, s.chat_id) for s in subscribers), [(1, 100), (2, 200)])
+        self.assertEqual(self.repo.delete_subscriptions(10, bot_id=1), 1)
+        self.assertEqual(len(self.repo.get_due_subscriptions(420, 30, datetime(2024, 6, 1))), 2)
+
+    def test_catch_up_window_wraps_past_midnight(self):
+        self.repo.save_subscription(10, 100, 7, 0.0, 0.0, '23:50', 0, 1430, None, 'en', 1)
+        window_start = datetime(2024, 6, 1, 23, 35, tzinfo=timezone.utc)
+        self.assertEqual(len(self.repo.get_due_subscriptions(5, 30, window_start)), 1)
+        self.assertEqual(self.repo.get_due_subscriptions(25, 30, window_start), [])
+
+
+FORECAST = {'utc_offset_seconds': 3 * 3600, 'hourly': {
+    'time': [f'2024-06-{1 + i // 24:02d}T{i % 24:02d}:00' for i in range(48)],
+    **{name: [1] * 48 for name in (
+        'temperature_2m', 'relative_humidity_2m', 'apparent_temperature', 'precipitation', 'rain',
+        'showers', 'snowfall', 'weather_code', 'pressure_msl', 'surface_pressure', 'cloud_cover',
+        'wind_speed_10m', 'wind_direction_10m', 'wind_gusts_10m')},
+}}
+
+
+class SchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def deliver(self, repo, *times, listener=None):
+        scheduler = ForecastScheduler(sender=RateLimitedSender(rate=1000))
+        if listener is not None:
+            scheduler.add_listener(listener)
+        original = WeatherForecast.quest_many
+        self.fetched = []
+
+        def quest_many(cls, locations, *args):
+            self.fetched.extend(locations)
+            return [FORECAST] * len(locations)
+        WeatherForecast.quest_many = classmethod(quest_many)
+        try:
+            bot = FakeBot(1)
+            for now in times:
+                await scheduler.tick([bot], repo, now)
+        finally:
+            WeatherForecast.quest_many = original
+        return bot
+
+    async def test_delivery_through_the_repository(self):
+        repo = InMemoryRepository()
+        city = repo.create_city(10, 'Moscow', 55.75, 37.62)
+        repo.save_subscription(10, 100, city.id, 55.75, 37.62, '10:00', 0, 600, None, 'en', 0)
+        now = datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc)
+        bot = await self.deliver(repo, now, now)
+        self.assertEqual(len(bot.sent), 1)
+        self.assertIn('Moscow', bot.sent[0][1])
+        # The delivery minute follows the time zone of the location
+        due = repo.get_due_subscriptions(to_delivery_minute('10:00', 3 * 3600), 0, datetime(2024, 6, 2, tzinfo=timezone.utc))
+        self.assertEqual([sub.utc_offset for sub in due], [3 * 3600])
+
+    async def test_delivery_missed_before_midnight(self):
+        repo = InMemoryRepository()
+        city = repo.create_city(10, 'Moscow', 55.75, 37.62)
+        # 02:50 in UTC+3 is 23:50 UTC
+        repo.save_subscription(10, 100, city.id, 55.75, 37.62, '02:50', 3 * 3600, 1430, None, 'en', 0)
+        bot = await self.deliver(repo, *(datetime(2024, 6, day, hour, minute, tzinfo=timezone.utc) for day, hour, minute in (
+            (1, 23, 50), (2, 0, 5),     # delivered on time, not again after midnight
+            (3, 0, 5), (3, 0, 10),      # missed, caught up once after midnight
+            (3, 23, 50),                # the catch-up does not suppress the next delivery
+        )))
+        self.assertEqual(len(bot.sent), 3)
+
+    async def test_cities_in_one_cell(self):
+        repo = InMemoryRepository()
+        moscow = repo.create_city(10, 'Moscow', 55.75, 37.62)
+        reutov = repo.create_city(10, 'Reutov', 55.76, 37.65)
+        repo.save_subscription(10, 100, moscow.id, 55.75, 37.62, '10:00', 0, 600, None, 'en', 0)
+        repo.save_subscription(11, 200, reutov.id, 55.76, 37.65, '10:00', 0, 600, None, 'en', 0)
+        bot = await self.deliver(repo, datetime(2024, 6, 1, 10, 0, tzinfo=timezone.utc))
+        # One fetch for the cell, stored for both cities, every subscriber gets the title of the own city
+        self.assertEqual(len(self.fetched), 1)
+        self.assertEqual(sorted(repo.get_forecasts([moscow.id, reutov.id])), sorted([moscow.id, reutov.id]))
+        titles = {chat_id: text.splitlines()[0] for chat_id, text in bot.sent}
+        self.assertIn('Moscow', titles[100])
+        self.assertIn('Reutov', titles[200])
+
+    async def test_fresh_stored_forecast_is_reused(self):
+        repo = InMemoryRepository()
+        city = repo.create_city(10, 'Moscow', 55.75, 37.62)
+        repo.upsert_forecast(city.id, FORECAST)
+        repo.save_subscription(10, 100, city.id, 55.75, 37.62, '10:00', 0, 600, None, 'en', 0)
+        bot = await self.deliver(repo, datetime(2024, 6, 1, 10, 0, tzinfo=timezone.utc))
+        self.assertEqual(len(bot.sent), 1)
+        self.assertEqual(self.fetched, [])
+
+    async def test_refreshed_forecast_is_reported(self):
+        repo = InMemoryRepository()
+        city = repo.create_city(10, 'Moscow', 55.75, 37.62)
+        old = dict(FORECAST, utc_offset_seconds=0)
+        repo._forecasts[city.id] = ForecastRecord(city.id, old, datetime.now(timezone.utc) - timedelta(days=1))
+        repo.save_subscription(10, 100, city.id, 55.75, 37.62, '10:00', 0, 600, None, 'en', 0)
+        refreshed = []
+        await self.deliver(repo, datetime(2024, 6, 1, 10, 0, tzinfo=timezone.utc),
+                           listener=lambda *args: refreshed.append(args))
+        self.assertEqual(refreshed, [(city.id, 'Moscow', old, FORECAST)])
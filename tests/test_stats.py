@@ -0,0 +1,62 @@
+import random
+import unittest
+
+from core.utils.stats import SpaceSaving, QuantileSketch, HyperLogLog
+
+
+class SpaceSavingTest(unittest.TestCase):
+    def test_exact_below_capacity(self):
+        sketch = SpaceSaving(capacity=10)
+        for item, count in (('a', 5), ('b', 3), ('c', 1)):
+            sketch.add(item, count)
+        self.assertEqual(sketch.top(2), [('a', 5, 0), ('b', 3, 0)])
+
+    def test_heavy_hitters_survive_eviction(self):
+        rng = random.Random(0)
+        sketch = SpaceSaving(capacity=20)
+        stream = ['hot'] * 500 + ['warm'] * 200 + [f'cold{i}' for i in range(1000)]
+        rng.shuffle(stream)
+        for item in stream:
+            sketch.add(item)
+        top = sketch.top(2)
+        self.assertEqual([item for item, _, _ in top], ['hot', 'warm'])
+        for item, count, error in top:
+            true_count = stream.count(item)
+            self.assertLessEqual(count - error, true_count)
+            self.assertGreaterEqual(count, true_count)
+
+
+class QuantileSketchTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_relative_accuracy(self):
+        rng = random.Random(0)
+        values = sorted(rng.lognormvariate(0, 1) for _ in range(10000))
+        sketch = QuantileSketch(accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+        for q in (0.5, 0.9, 0.99):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / expected, 1, delta=0.02)
+
+    def test_zeros(self):
+        sketch = QuantileSketch()
+        for value in (0, 0, 0, 1):
+            sketch.add(value)
+        self.assertEqual(sketch.quantile(0.5), 0.0)
+
+
+class HyperLogLogTest(unittest.TestCase):
+    def test_small_cardinality_is_almost_exact(self):
+        counter = HyperLogLog()
+        for i in range(100):
+            counter.add(i)
+            counter.add(i)
+        self.assertAlmostEqual(len(counter), 100, delta=3)
+
+    def test_large_cardinality_within_error(self):
+        counter = HyperLogLog()
+        for i in range(50000):
+            counter.add(f'user{i}')
+        self.assertAlmostEqual(len(counter) / 50000, 1, delta=0.05)
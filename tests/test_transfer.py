@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, select
+
+from core.model.models import User, create_schema
+from core.utils.transfer import convert_defaults, import_table
+
+
+class ImportTableTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f'sqlite:///{self.directory.name}/test.db')
+        create_schema(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def users(self):
+        with self.engine.connect() as connection:
+            query = select(User.__table__.c.user_id, User.__table__.c.token, User.__table__.c.is_active,
+                           User.__table__.c.bot_id).order_by(User.__table__.c.user_id)
+            return [tuple(row) for row in connection.execute(query)]
+
+    def test_rows_with_different_keys(self):
+        records = [
+            {'user_id': 1, 'token': 'a', 'is_active': False},
+            {'user_id': 2, 'token': 'b'},
+            {'user_id': 3, 'token': 'c', 'is_active': False, 'unknown': 1},
+        ]
+        path = self.write('users.ndjson', ''.join(json.dumps(record) + '\n' for record in records))
+        self.assertEqual(import_table(self.engine, 'users', path), 3)
+        # The missing is_active gets the Python default instead of NULL
+        self.assertEqual(self.users(), [(1, 'a', False, 0), (2, 'b', True, 0), (3, 'c', False, 0)])
+
+    def test_set_values_are_converted(self):
+        path = self.write('users.csv', 'user_id,token\n1,a\n')
+        import_table(self.engine, 'users', path, defaults={'bot_id': '5', 'is_active': 'false'})
+        self.assertEqual(self.users(), [(1, 'a', False, 5)])
+
+    def test_unknown_set_column(self):
+        with self.assertRaises(ValueError):
+            convert_defaults(User.__table__, {'nope': '1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from core.utils.util import parse_forecast_options, is_forecast_old, forecast_ttl, is_delivery_due
+
+
+class ParseForecastOptionsTest(unittest.TestCase):
+    def test_city_only(self):
+        self.assertEqual(parse_forecast_options('New York'), ('New York', False, None))
+
+    def test_week(self):
+        self.assertEqual(parse_forecast_options('Moscow week'), ('Moscow', True, None))
+
+    def test_hours_are_sorted_and_deduplicated(self):
+        self.assertEqual(parse_forecast_options('Moscow 18,6,6'), ('Moscow', False, (6, 18)))
+
+    def test_week_and_hours_in_any_order(self):
+        self.assertEqual(parse_forecast_options('Moscow 6,12 week'), ('Moscow', True, (6, 12)))
+        self.assertEqual(parse_forecast_options('Moscow week 6,12'), ('Moscow', True, (6, 12)))
+
+    def test_invalid_hours_stay_in_the_name(self):
+        self.assertEqual(parse_forecast_options('Moscow 25'), ('Moscow 25', False, None))
+
+    def test_single_word_is_always_the_name(self):
+        self.assertEqual(parse_forecast_options('week'), ('week', False, None))
+
+
+class ForecastAgeTest(unittest.TestCase):
+    def test_aware_timestamps(self):
+        # PostgreSQL returns aware timestamps
+        now = datetime.now(timezone.utc)
+        self.assertFalse(is_forecast_old(now - timedelta(hours=1)))
+        self.assertTrue(is_forecast_old(now - timedelta(hours=13)))
+        self.assertAlmostEqual(forecast_ttl(now - timedelta(hours=2)), 10 * 3600, delta=5)
+
+    def test_naive_timestamps_are_utc(self):
+        # SQLite returns naive timestamps
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.assertFalse(is_forecast_old(now - timedelta(hours=1)))
+        self.assertEqual(forecast_ttl(now - timedelta(hours=13)), 0.0)
+
+
+class DeliveryWindowTest(unittest.TestCase):
+    def test_window(self):
+        self.assertTrue(is_delivery_due(420, 420, 30))
+        self.assertTrue(is_delivery_due(420, 450, 30))
+        self.assertFalse(is_delivery_due(420, 451, 30))
+        self.assertFalse(is_delivery_due(421, 420, 30))
+
+    def test_window_wraps_past_midnight(self):
+        # 23:50 is in the window at 00:10, 00:05 is not in the window at 23:55
+        self.assertTrue(is_delivery_due(1430, 10, 30))
+        self.assertFalse(is_delivery_due(5, 1435, 30))
@@ -0,0 +1,33 @@
+import unittest
+
+from core.utils.weather import aggregate_days
+
+HOURS = 48
+
+
+def forecast(codes):
+    return {'hourly': {
+        'time': [f'2024-06-0{1 + hour // 24}T{hour % 24:02d}:00' for hour in range(HOURS)],
+        'temperature_2m': [10.0] * HOURS,
+        'precipitation': [0.0] * HOURS,
+        'wind_gusts_10m': [20.0] * HOURS,
+        'weather_code': codes,
+    }}
+
+
+class AggregateDaysTest(unittest.TestCase):
+    def test_severe_code_wins_a_tie(self):
+        days = aggregate_days(forecast([3] * 12 + [61] * 12 + [0] * 24))
+        self.assertEqual([day.weather_code for day in days], [61, 0])
+
+    def test_missing_hours_are_not_clear_sky(self):
+        days = aggregate_days(forecast([None] * 20 + [61] * 4 + [None] * 24))
+        self.assertEqual(days[0].weather_code, 61)
+
+    def test_day_without_codes(self):
+        days = aggregate_days(forecast([3] * 24 + [None] * 24))
+        self.assertEqual(days[1].weather_code, -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
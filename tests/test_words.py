@@ -0,0 +1,35 @@
+import random
+import unittest
+
+from core.filters.words import AhoCorasick, compile_matcher
+
+
+class AhoCorasickTest(unittest.TestCase):
+    def test_overlapping_keywords(self):
+        matcher = AhoCorasick(['he', 'she', 'his', 'hers'])
+        self.assertTrue(matcher.search('ushers'))
+        self.assertTrue(matcher.search('ahishe'))
+        self.assertFalse(matcher.search('hxsxe'))
+
+    def test_failure_links_match_naive_search(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            keywords = [''.join(rng.choice('ab') for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 4))]
+            text = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 12)))
+            expected = any(keyword in text for keyword in keywords)
+            self.assertEqual(AhoCorasick(keywords).search(text), expected, (keywords, text))
+
+
+class CompileMatcherTest(unittest.TestCase):
+    def test_exact_match(self):
+        match = compile_matcher(('Hello',), True, False)
+        self.assertTrue(match('hello'))
+        self.assertFalse(match('hello there'))
+
+    def test_partial_match(self):
+        match = compile_matcher(('weather',), False, True)
+        self.assertTrue(match('what is the weather'))
+        self.assertFalse(match('WEATHER'))
+
+    def test_empty_word_matches_any_text(self):
+        self.assertTrue(compile_matcher(('',), True, True)('anything'))